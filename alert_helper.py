@@ -1,14 +1,23 @@
 # alert_helper.py
+import io
 import os
+import re
 import json
 import time
+import tempfile
 import subprocess
+import uuid
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Dict, List, Optional, Any, Tuple, Union
 from PIL import Image
+import numpy as np
 import cv2
 
+from gif_helper import GifBudget, GifEncoder
+from video_helper import FrameDeduplicator, FrameExtractor
+
 
 class ArtifactManager:
     """Manages the artifact.json file for persisting state between runs."""
@@ -94,65 +103,321 @@ class OnePasswordHelper:
         return out
 
 
+@dataclass
+class MediaBuffer:
+    """An encoded output held in memory instead of on disk, ready for MinioStorage.upload_bytes."""
+    name: str
+    data: bytes
+    content_type: str
+    uploaded: bool = False   # already streamed to MinIO while encoding; data is then empty
+
+
+# A produced output: a local file path, or a MediaBuffer in in-memory mode
+MediaItem = Union[str, MediaBuffer]
+
+
+class _TeeWriter:
+    """Binary writer that copies everything to several streams (a local file and an upload)."""
+
+    def __init__(self, *targets: BinaryIO):
+        self.targets = targets
+
+    def write(self, data) -> int:
+        for target in self.targets:
+            target.write(data)
+        return len(data)
+
+
+@dataclass
+class MediaOptions:
+    """
+    What VideoProcessor.extract_alert_media produces and how; from_config() builds it from
+    an AlertConfiguration. It is a plain dataclass so it pickles to the encoding service.
+
+    gif_selection="motion" takes the most active window around trigger_seconds instead of
+    spreading frames over the whole clip. still is "mid" for the middle frame, "best" for the
+    sharpest, most active frame in the preview window, or None.
+    stream_gif encodes GIF frames on a worker thread as they are decoded, writing them
+    straight to the preview instead of holding the whole animation in memory.
+    With in_memory, nothing is written to disk: every output is a MediaBuffer named after
+    the file it would have been (preview_path's basename for the preview).
+    gif_workers > 1 spreads GIF palette mapping over that many processes.
+    small_preview_width adds a low-bandwidth GIF rendition ("<preview>_small.gif") built from
+    the same frames, downscaled and thinned to roughly small_preview_fps.
+    max_preview_bytes caps the GIF preview size: the encoding settings are planned from
+    sample encodes of the decoded frames and the GIF is encoded once, so a budgeted GIF is
+    never streamed (see streams_preview).
+    contact_sheet_frames > 0 adds a grid JPEG of that many frames, spread evenly or picked
+    from the motion scan (contact_sheet_selection="motion").
+    crop (a fractional x0, y0, x1, y1 region) or auto_crop (the moving region found by the
+    motion scan) crops the preview frames before they are resized. crop_stills crops the
+    still, thumbnail and timed JPEGs to the same rectangle too (the contact sheet stays full).
+    dedup_threshold > 0 collapses static stretches of a buffered gif/webp preview into single
+    frames with longer durations (see FrameDeduplicator); a streamed GIF does the same
+    through GifStream's delta check.
+    decode_workers > 1 decodes long exports in that many segments in parallel.
+    decode_backend is "opencv" or "pyav" (see video_helper.DecodeBackend). keyframe_stills
+    snaps still-only frames (middle frame, timed JPEGs, even contact sheet) to keyframes
+    and decodes them without the frames in between (needs PyAV).
+    """
+    duration_seconds: int = 6
+    fps: int = 5
+    preview_format: str = "gif"
+    still: Optional[str] = "mid"
+    timed_jpegs: bool = False
+    thumbnail_width: Optional[int] = None
+    preset: str = "balanced"
+    gif_selection: str = "even"
+    trigger_seconds: float = 0.0
+    search_seconds: float = 20.0
+    stream_gif: bool = False
+    in_memory: bool = False
+    gif_workers: int = 1
+    small_preview_width: Optional[int] = None
+    small_preview_fps: float = 2
+    max_preview_bytes: Optional[int] = None
+    contact_sheet_frames: int = 0
+    contact_sheet_selection: str = "even"
+    crop: Optional[Tuple[float, float, float, float]] = None
+    auto_crop: bool = False
+    crop_stills: bool = False
+    dedup_threshold: float = 0.0
+    decode_workers: int = 1
+    decode_backend: str = "opencv"
+    keyframe_stills: bool = False
+
+    @classmethod
+    def from_config(cls, config: "AlertConfiguration", camera: str) -> "MediaOptions":
+        """The outputs bi_alerts_handler.py produces for an alert on camera."""
+        return cls(
+            duration_seconds=config.GIF_DURATION_SECONDS,
+            fps=config.GIF_FPS,
+            preview_format=config.get_preview_format(camera),
+            still=config.STILL_SELECTION,
+            thumbnail_width=config.POSTER_WIDTH or None,
+            preset=config.GIF_PRESET,
+            gif_selection=config.GIF_SELECTION,
+            # The export starts at the alert's trigger offset, so the trigger is at 0s
+            trigger_seconds=0.0,
+            search_seconds=config.MOTION_SEARCH_SECONDS,
+            stream_gif=config.GIF_STREAMING,
+            in_memory=not config.KEEP_LOCAL_MEDIA,
+            gif_workers=config.GIF_WORKERS,
+            small_preview_width=config.SMALL_PREVIEW_WIDTH or None,
+            small_preview_fps=config.SMALL_PREVIEW_FPS,
+            max_preview_bytes=config.GIF_MAX_BYTES or None,
+            contact_sheet_frames=config.CONTACT_SHEET_FRAMES,
+            contact_sheet_selection=config.CONTACT_SHEET_SELECTION,
+            crop=config.get_crop_region(camera),
+            auto_crop=config.GIF_AUTO_CROP,
+            crop_stills=config.CROP_STILLS,
+            dedup_threshold=config.FRAME_DEDUP_THRESHOLD,
+            decode_workers=config.DECODE_WORKERS,
+            decode_backend=config.DECODE_BACKEND,
+            keyframe_stills=config.KEYFRAME_STILLS,
+        )
+
+
 class VideoProcessor:
     """Handles video processing operations like MP4 to GIF conversion and frame extraction."""
     
+    PREVIEW_CONTENT_TYPES = {"gif": "image/gif", "webp": "image/webp", "mp4": "video/mp4"}
+    
+    # H.264 first so browsers and phones can play the preview; mp4v is the last resort
+    # for OpenCV builds without an H.264 encoder.
+    MP4_FOURCCS = ["avc1", "H264", "mp4v"]
+    
+    @staticmethod
+    def _save_gif(
+        frames: List[np.ndarray],
+        gif_path: Union[str, BinaryIO],
+        fps: int,
+        preset: str = "balanced",
+        workers: int = 1,
+        durations: Optional[List[int]] = None
+    ) -> None:
+        """
+        Write RGB frames to an animated GIF (path or binary stream). preset is a GifEncoder preset,
+        or "pil" for PIL's per-frame optimizer. workers > 1 maps frames onto the palette in that
+        many processes. durations (ms per frame) give variable timing.
+        """
+        if preset != "pil":
+            if isinstance(gif_path, str):
+                GifEncoder(preset, workers).save(frames, gif_path, fps, durations)
+            else:
+                GifEncoder(preset, workers).encode(frames, gif_path, fps, durations)
+            return
+
+        images = [Image.fromarray(frame) for frame in frames]
+        duration_per_frame = durations or int(1000 / fps)
+        images[0].save(
+            gif_path,
+            format="GIF",
+            save_all=True,
+            append_images=images[1:],
+            duration=duration_per_frame,
+            loop=0,
+            optimize=True
+        )
+    
+    @staticmethod
+    def _save_webp(
+        frames: List[np.ndarray],
+        webp_path: Union[str, BinaryIO],
+        fps: int,
+        quality: int = 70,
+        durations: Optional[List[int]] = None
+    ) -> None:
+        """Write RGB frames to an animated WebP (path or binary stream), optionally with per-frame durations."""
+        images = [Image.fromarray(frame) for frame in frames]
+        images[0].save(
+            webp_path,
+            format="WEBP",
+            save_all=True,
+            append_images=images[1:],
+            duration=durations or int(1000 / fps),
+            loop=0,
+            quality=quality,
+            method=4
+        )
+    
+    @staticmethod
+    def _save_mp4(frames: List[np.ndarray], mp4_path: Union[str, BinaryIO], fps: int) -> str:
+        """Write RGB frames to a short MP4. Returns the fourcc that was used."""
+        if not isinstance(mp4_path, str):
+            # cv2.VideoWriter can only write to a path, so stage through a temp file
+            fd, tmp_path = tempfile.mkstemp(suffix=".mp4")
+            os.close(fd)
+            try:
+                fourcc = VideoProcessor._save_mp4(frames, tmp_path, fps)
+                with open(tmp_path, "rb") as f:
+                    mp4_path.write(f.read())
+                return fourcc
+            finally:
+                os.remove(tmp_path)
+
+        # H.264 needs even dimensions
+        height, width = frames[0].shape[:2]
+        height, width = height - height % 2, width - width % 2
+        for fourcc in VideoProcessor.MP4_FOURCCS:
+            writer = cv2.VideoWriter(mp4_path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+            if writer.isOpened():
+                break
+            writer.release()
+        else:
+            raise Exception(f"No MP4 encoder available (tried {', '.join(VideoProcessor.MP4_FOURCCS)})")
+
+        try:
+            for frame in frames:
+                writer.write(cv2.cvtColor(frame[:height, :width], cv2.COLOR_RGB2BGR))
+        finally:
+            writer.release()
+        return fourcc
+    
+    @staticmethod
+    def _save_preview(
+        frames: List[np.ndarray],
+        preview_path: Union[str, BinaryIO],
+        fps: int,
+        preview_format: str = "gif",
+        preset: str = "balanced",
+        log_func=print,
+        gif_workers: int = 1,
+        durations: Optional[List[int]] = None
+    ) -> None:
+        """
+        Write RGB frames as a gif, webp or mp4 preview to a path or binary stream. durations
+        (ms per frame) apply to gif and webp; mp4 is always constant frame rate.
+        """
+        if preview_format == "gif":
+            VideoProcessor._save_gif(frames, preview_path, fps, preset, gif_workers, durations)
+        elif preview_format == "webp":
+            VideoProcessor._save_webp(frames, preview_path, fps, durations=durations)
+        elif preview_format == "mp4":
+            fourcc = VideoProcessor._save_mp4(frames, preview_path, fps)
+            if fourcc == "mp4v":
+                log_func("⚠️ No H.264 encoder in this OpenCV build; MP4 preview written as MPEG-4 Part 2")
+        else:
+            raise ValueError(f"Unknown preview format '{preview_format}'")
+    
+    @staticmethod
+    def _save_budgeted_gif(
+        frames: np.ndarray,
+        gif_path: Union[str, BinaryIO],
+        fps: int,
+        preset: str,
+        max_bytes: int,
+        workers: int = 1,
+        log_func=print
+    ) -> int:
+        """Encode a GIF adjusted to fit max_bytes (see GifBudget). Returns the number of frames written."""
+        plan = GifBudget.plan(frames, fps, max_bytes, preset)
+        notes = plan.changes(preset, frames.shape[2], len(frames))
+        if plan.estimated_bytes > max_bytes:
+            log_func(f"⚠️ GIF still estimated at {plan.estimated_bytes / 1024:.0f} KB after every adjustment "
+                     f"(budget {max_bytes / 1024:.0f} KB)")
+        if notes:
+            log_func(f"📏 GIF adjusted to fit {max_bytes / 1024:.0f} KB: {', '.join(notes)}")
+        frames = GifBudget.apply(frames, plan)
+        VideoProcessor._save_gif(frames, gif_path, fps / plan.frame_step, plan.preset, workers)
+        return len(frames)
+    
+    @staticmethod
+    def _save_jpeg(frame: np.ndarray, jpeg_path: str) -> None:
+        """Write a BGR frame to a JPEG."""
+        ok = cv2.imwrite(jpeg_path, frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        if not ok:
+            raise Exception("cv2.imwrite returned False")
+    
+    @staticmethod
+    def _encode_jpeg(frame: np.ndarray) -> bytes:
+        """Encode a BGR frame to JPEG bytes."""
+        ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        if not ok:
+            raise Exception("cv2.imencode returned False")
+        return data.tobytes()
+    
+    @staticmethod
+    def _jpeg_emitter(jpeg_save_dir: str, in_memory: bool) -> Callable[[np.ndarray, str], MediaItem]:
+        """Return emit(frame, name) that writes a JPEG to jpeg_save_dir, or encodes it to a MediaBuffer."""
+        def emit(frame: np.ndarray, name: str) -> MediaItem:
+            if in_memory:
+                return MediaBuffer(name, VideoProcessor._encode_jpeg(frame), "image/jpeg")
+            path = os.path.join(jpeg_save_dir, name)
+            VideoProcessor._save_jpeg(frame, path)
+            return path
+        return emit
+    
+    @staticmethod
+    def _save_timed_jpegs(timed_frames, camera_name: str, ts_str: str, emit) -> List[MediaItem]:
+        """Emit (seconds, frame) pairs as numbered JPEGs, skipping any that fail."""
+        extracted = []
+        for i, (t, frame) in enumerate(timed_frames, 1):
+            name = f"{camera_name}_{ts_str}_frame_{i:02d}_{t:.1f}s.jpg"
+            try:
+                extracted.append(emit(frame, name))
+            except Exception:
+                continue
+        return extracted
+    
     @staticmethod
     def convert_mp4_to_gif(
         mp4_path: str, 
         gif_path: str, 
         duration_seconds: int, 
         fps: int,
-        log_func=print
+        log_func=print,
+        preset: str = "balanced"
     ) -> Optional[str]:
         """Convert MP4 to GIF with specified duration and fps."""
         try:
             os.makedirs(os.path.dirname(gif_path), exist_ok=True)
-            if not os.path.exists(mp4_path):
-                raise Exception(f"Input file not found: {mp4_path}")
-
-            cap = cv2.VideoCapture(mp4_path)
-            if not cap.isOpened():
-                raise Exception(f"Could not open video file: {mp4_path}")
-
-            original_fps = cap.get(cv2.CAP_PROP_FPS)
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-            frames_to_extract = duration_seconds * fps
-            frame_step = max(1, int(total_frames / frames_to_extract))
-
-            frames = []
-            frame_count = 0
-            while len(frames) < frames_to_extract:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                if frame_count % frame_step == 0:
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    if width > 720:
-                        new_width = 720
-                        new_height = int(height * (new_width / width))
-                        frame_rgb = cv2.resize(frame_rgb, (new_width, new_height))
-                    frames.append(Image.fromarray(frame_rgb))
-                frame_count += 1
-
-            cap.release()
-            if not frames:
+            result = FrameExtractor.extract(mp4_path, gif_frame_count=duration_seconds * fps)
+            if len(result.gif_frames) == 0:
                 raise Exception("No frames extracted from video")
 
-            duration_per_frame = int(1000 / fps)
-            frames[0].save(
-                gif_path,
-                save_all=True,
-                append_images=frames[1:],
-                duration=duration_per_frame,
-                loop=0,
-                optimize=True
-            )
-
-            log_func(f"✅ GIF created: {gif_path} ({len(frames)} frames)")
+            VideoProcessor._save_gif(result.gif_frames, gif_path, fps, preset)
+            log_func(f"✅ GIF created: {gif_path} ({len(result.gif_frames)} frames)")
             return gif_path
         except Exception as e:
             log_func(f"❌ GIF conversion failed: {e}")
@@ -163,37 +428,19 @@ class VideoProcessor:
         mp4_path: str, 
         jpeg_save_dir: str, 
         camera_name: str,
+        keyframe: bool = False,
         log_func=print
     ) -> Optional[str]:
-        """Extract a single JPEG from the middle of the video."""
+        """Extract a single JPEG from the middle of the video (the nearest keyframe with keyframe=True)."""
         try:
             os.makedirs(jpeg_save_dir, exist_ok=True)
-            if not os.path.exists(mp4_path):
-                raise Exception(f"MP4 not found: {mp4_path}")
-
-            cap = cv2.VideoCapture(mp4_path)
-            if not cap.isOpened():
-                raise Exception(f"Could not open MP4: {mp4_path}")
-
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            if total_frames <= 0:
-                raise Exception("Total frames reported as 0")
-
-            mid_frame = max(0, total_frames // 2)
-            cap.set(cv2.CAP_PROP_POS_FRAMES, mid_frame)
-            ret, frame = cap.read()
-            cap.release()
-
-            if not ret or frame is None:
+            result = FrameExtractor.extract(mp4_path, still="mid", keyframe_stills=keyframe)
+            if result.still is None:
                 raise Exception("Failed to read middle frame")
 
             ts_str = datetime.now().strftime("%m%d%y_%H%M%S")
-            jpeg_name = f"{camera_name}_{ts_str}_mid.jpg"
-            jpeg_path = os.path.join(jpeg_save_dir, jpeg_name)
-
-            ok = cv2.imwrite(jpeg_path, frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-            if not ok:
-                raise Exception("cv2.imwrite returned False")
+            jpeg_path = os.path.join(jpeg_save_dir, f"{camera_name}_{ts_str}_mid.jpg")
+            VideoProcessor._save_jpeg(result.still, jpeg_path)
 
             log_func(f"✅ Extracted middle-frame JPEG: {jpeg_path}")
             return jpeg_path
@@ -201,61 +448,274 @@ class VideoProcessor:
             log_func(f"❌ Mid-frame JPEG extraction failed: {e}")
             return None
     
+    @staticmethod
+    def extract_best_jpeg(
+        mp4_path: str,
+        jpeg_save_dir: str,
+        camera_name: str,
+        candidates: int = 9,
+        log_func=print
+    ) -> Optional[str]:
+        """Extract the sharpest, most active of `candidates` frames spread over the video."""
+        try:
+            os.makedirs(jpeg_save_dir, exist_ok=True)
+            result = FrameExtractor.extract(mp4_path, still="best", still_candidates=candidates)
+            if result.still is None:
+                raise Exception("Failed to read candidate frames")
+
+            ts_str = datetime.now().strftime("%m%d%y_%H%M%S")
+            jpeg_path = os.path.join(jpeg_save_dir, f"{camera_name}_{ts_str}_best.jpg")
+            VideoProcessor._save_jpeg(result.still, jpeg_path)
+
+            log_func(f"✅ Extracted best-frame JPEG: {jpeg_path} (frame {result.still_index})")
+            return jpeg_path
+        except Exception as e:
+            log_func(f"❌ Best-frame JPEG extraction failed: {e}")
+            return None
+    
     @staticmethod
     def extract_alert_jpegs(
         mp4_path: str, 
         jpeg_save_dir: str, 
         camera_name: str,
+        keyframe: bool = False,
         log_func=print
     ) -> List[str]:
-        """Extract multiple JPEG frames from video at various time intervals."""
+        """Extract multiple JPEG frames from video at various time intervals (snapped to keyframes with keyframe=True)."""
         try:
             os.makedirs(jpeg_save_dir, exist_ok=True)
-            if not os.path.exists(mp4_path):
-                raise Exception(f"MP4 not found: {mp4_path}")
-
-            cap = cv2.VideoCapture(mp4_path)
-            if not cap.isOpened():
-                raise Exception(f"Could not open MP4: {mp4_path}")
-
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            duration_seconds = total_frames / fps
-
-            extraction_times = []
-            if duration_seconds > 2:
-                extraction_times.append(2.0)
-            if duration_seconds > 3:
-                t = duration_seconds - 3.0
-                if t > 0:
-                    extraction_times.append(t)
-            t = 0.0
-            while t < duration_seconds:
-                extraction_times.append(t)
-                t += 5.0
-
-            extraction_times = sorted(set(extraction_times))
-            extracted = []
-            ts_str = datetime.now().strftime('%m%d%y_%H%M%S')
+            result = FrameExtractor.extract(mp4_path, timed_jpegs=True, keyframe_stills=keyframe)
 
-            for i, t in enumerate(extraction_times, 1):
-                frame_number = int(t * fps)
-                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-                ret, frame = cap.read()
-                if not ret:
-                    continue
-                name = f"{camera_name}_{ts_str}_frame_{i:02d}_{t:.1f}s.jpg"
-                path = os.path.join(jpeg_save_dir, name)
-                ok = cv2.imwrite(path, frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                if ok:
-                    extracted.append(path)
-
-            cap.release()
+            ts_str = datetime.now().strftime('%m%d%y_%H%M%S')
+            emit = VideoProcessor._jpeg_emitter(jpeg_save_dir, in_memory=False)
+            extracted = VideoProcessor._save_timed_jpegs(result.timed_frames, camera_name, ts_str, emit)
             log_func(f"✅ Extracted {len(extracted)} JPEG frames")
             return extracted
         except Exception as e:
             log_func(f"❌ JPEG extraction failed: {e}")
             return []
+    
+    @staticmethod
+    def extract_alert_media(
+        mp4_path: str,
+        preview_path: str,
+        jpeg_save_dir: str,
+        camera_name: str,
+        options: Optional[MediaOptions] = None,
+        preview_stream: Optional[BinaryIO] = None,
+        log_func=print
+    ) -> Dict[str, Any]:
+        """
+        Produce the animated preview (gif, webp or mp4) and any requested stills from a
+        single decode of the MP4, as described by options (see MediaOptions; defaults when
+        None). Returns {"preview", "preview_format", "content_type", "preview_uploaded",
+        "still_jpeg", "jpegs", "thumbnail", "small_preview", "contact_sheet"}; outputs that
+        were not requested or failed are None (or [] for "jpegs"). The preview failing raises.
+        preview_stream (e.g. MinioStorage.open_upload) receives a streamed GIF as it is encoded,
+        so the upload overlaps the encode; it is closed on success and aborted on failure, and
+        "preview_uploaded" is then True. In in_memory mode the preview is only written to the
+        stream and "preview" is a MediaBuffer with uploaded=True and no data.
+        It is ignored (and left open) when the preview is not streamed; see streams_preview.
+        """
+        options = options or MediaOptions()
+        if options.preview_format not in VideoProcessor.PREVIEW_CONTENT_TYPES:
+            raise ValueError(f"Unknown preview format '{options.preview_format}'")
+        content_type = VideoProcessor.PREVIEW_CONTENT_TYPES[options.preview_format]
+        if not options.in_memory:
+            os.makedirs(os.path.dirname(preview_path), exist_ok=True)
+            os.makedirs(jpeg_save_dir, exist_ok=True)
+
+        budgeted = bool(options.max_preview_bytes) and options.preview_format == "gif" and options.preset != "pil"
+        streaming = VideoProcessor.streams_preview(options)
+        upload = preview_stream if streaming else None
+        preview_file: Optional[BinaryIO] = None
+        if options.in_memory:
+            preview_file = None if upload else io.BytesIO()
+        elif streaming:
+            preview_file = open(preview_path, "wb")
+        gif_target = _TeeWriter(*(target for target in (preview_file, upload) if target))
+        gif_stream = GifEncoder(options.preset, options.gif_workers).open_stream(gif_target, options.fps, threaded=True) if streaming else None
+
+        # The small rendition is tiny, so its frames are simply collected while decoding
+        small_step = max(1, round(options.fps / options.small_preview_fps)) if options.small_preview_width else 0
+        small_frames: List[np.ndarray] = []
+        gif_sink = gif_stream.add_frame if gif_stream else None
+        if gif_stream and small_step:
+            seen = [0]
+
+            def gif_sink(frame: np.ndarray) -> None:
+                if seen[0] % small_step == 0:
+                    # frame is the extractor's reused buffer; keep a copy even when it needs no resize
+                    small_frames.append(FrameExtractor.resize_to_width(frame, options.small_preview_width).copy())
+                seen[0] += 1
+                gif_stream.add_frame(frame)
+        try:
+            result = FrameExtractor.extract(
+                mp4_path,
+                gif_frame_count=options.duration_seconds * options.fps,
+                still=options.still,
+                timed_jpegs=options.timed_jpegs,
+                thumbnail_width=options.thumbnail_width,
+                gif_fps=options.fps,
+                gif_selection=options.gif_selection,
+                trigger_seconds=options.trigger_seconds,
+                search_seconds=options.search_seconds,
+                gif_sink=gif_sink,
+                contact_sheet_frames=options.contact_sheet_frames,
+                contact_sheet_selection=options.contact_sheet_selection,
+                crop=options.crop,
+                auto_crop=options.auto_crop,
+                crop_stills=options.crop_stills,
+                decode_workers=options.decode_workers,
+                backend=options.decode_backend,
+                keyframe_stills=options.keyframe_stills,
+            )
+            if not result.gif_indices:
+                raise Exception("No frames extracted from video")
+            if gif_stream:
+                frame_count = gif_stream.close()
+                gif_stream = None
+            if upload:
+                upload.close()
+        except Exception:
+            if gif_stream:
+                gif_stream.abort()
+            if upload:
+                upload.abort()
+            if preview_file and not options.in_memory:
+                preview_file.close()
+                os.remove(preview_path)
+            raise
+        finally:
+            if preview_file and not options.in_memory and not preview_file.closed:
+                preview_file.close()
+
+        if result.crop:
+            x0, y0, x1, y1 = result.crop
+            log_func(f"✂️ Preview cropped to {x1 - x0}x{y1 - y0} at ({x0}, {y0}) "
+                     f"of {result.info.width}x{result.info.height}")
+
+        outputs: Dict[str, Any] = {
+            "preview": None,
+            "preview_format": options.preview_format,
+            "content_type": content_type,
+            "preview_uploaded": upload is not None,
+            "still_jpeg": None,
+            "jpegs": [],
+            "thumbnail": None,
+            "small_preview": None,
+            "contact_sheet": None,
+        }
+
+        if not streaming:
+            target = preview_file if options.in_memory else preview_path
+            if budgeted:
+                frame_count = VideoProcessor._save_budgeted_gif(
+                    result.gif_frames, target, options.fps, options.preset, options.max_preview_bytes, options.gif_workers, log_func
+                )
+            else:
+                frames, durations = result.gif_frames, None
+                if options.dedup_threshold and options.preview_format != "mp4":
+                    keep, durations = FrameDeduplicator.collapse(frames, int(1000 / options.fps), options.dedup_threshold)
+                    if len(keep) < len(frames):
+                        log_func(f"🧹 Collapsed {len(frames) - len(keep)} static frames into longer delays")
+                    frames = frames[keep]
+                VideoProcessor._save_preview(
+                    frames, target, options.fps, options.preview_format, options.preset, log_func, options.gif_workers, durations
+                )
+                frame_count = len(frames)
+        if options.in_memory and upload:
+            outputs["preview"] = MediaBuffer(os.path.basename(preview_path), b"", content_type, uploaded=True)
+            log_func(f"✅ {options.preview_format.upper()} streamed to upload: {outputs['preview'].name} "
+                     f"({frame_count} frames)")
+        elif options.in_memory:
+            outputs["preview"] = MediaBuffer(os.path.basename(preview_path), preview_file.getvalue(), content_type)
+            log_func(f"✅ {options.preview_format.upper()} created in memory: {outputs['preview'].name} "
+                     f"({frame_count} frames, {len(outputs['preview'].data) / 1024:.0f} KB)")
+        else:
+            outputs["preview"] = preview_path
+            log_func(f"✅ {options.preview_format.upper()} created: {preview_path} ({frame_count} frames)")
+
+        emit = VideoProcessor._jpeg_emitter(jpeg_save_dir, options.in_memory)
+        ts_str = datetime.now().strftime("%m%d%y_%H%M%S")
+        if options.still:
+            label = "middle-frame" if options.still == "mid" else "best-frame"
+            try:
+                if result.still is None:
+                    raise Exception("Failed to read still frame")
+                outputs["still_jpeg"] = emit(result.still, f"{camera_name}_{ts_str}_{options.still}.jpg")
+                log_func(f"✅ Extracted {label} JPEG: {VideoProcessor.media_name(outputs['still_jpeg'])} (frame {result.still_index})")
+            except Exception as e:
+                log_func(f"❌ {label.capitalize()} JPEG extraction failed: {e}")
+
+        if options.timed_jpegs:
+            outputs["jpegs"] = VideoProcessor._save_timed_jpegs(result.timed_frames, camera_name, ts_str, emit)
+            log_func(f"✅ Extracted {len(outputs['jpegs'])} JPEG frames")
+
+        if options.thumbnail_width:
+            try:
+                if result.thumbnail is None:
+                    raise Exception("Failed to read thumbnail frame")
+                outputs["thumbnail"] = emit(result.thumbnail, f"{camera_name}_{ts_str}_thumb.jpg")
+                log_func(f"✅ Extracted thumbnail JPEG: {VideoProcessor.media_name(outputs['thumbnail'])}")
+            except Exception as e:
+                log_func(f"❌ Thumbnail extraction failed: {e}")
+
+        if options.contact_sheet_frames:
+            try:
+                if result.contact_sheet is None:
+                    raise Exception("No frames decoded for the contact sheet")
+                outputs["contact_sheet"] = emit(result.contact_sheet, f"{camera_name}_{ts_str}_sheet.jpg")
+                log_func(f"✅ Built contact sheet JPEG: {VideoProcessor.media_name(outputs['contact_sheet'])}")
+            except Exception as e:
+                log_func(f"❌ Contact sheet failed: {e}")
+
+        if small_step:
+            if not streaming:
+                small_frames = [
+                    FrameExtractor.resize_to_width(frame, options.small_preview_width)
+                    for frame in result.gif_frames[::small_step]
+                ]
+            try:
+                outputs["small_preview"] = VideoProcessor._save_small_preview(
+                    small_frames, preview_path, options.fps / small_step, options.preset, options.in_memory
+                )
+                log_func(f"✅ Small GIF created: {VideoProcessor.media_name(outputs['small_preview'])} "
+                         f"({len(small_frames)} frames at {small_frames[0].shape[1]}px)")
+            except Exception as e:
+                log_func(f"❌ Small GIF creation failed: {e}")
+
+        return outputs
+    
+    @staticmethod
+    def streams_preview(options: MediaOptions) -> bool:
+        """
+        True if extract_alert_media encodes this preview frame by frame (and so can stream it).
+        A byte budget is planned from the decoded frames before the single encode, so a
+        budgeted GIF is buffered instead.
+        """
+        return (
+            options.stream_gif and options.preview_format == "gif" and options.preset != "pil"
+            and not options.max_preview_bytes
+        )
+    
+    @staticmethod
+    def _save_small_preview(
+        frames: List[np.ndarray], preview_path: str, fps: float, preset: str, in_memory: bool
+    ) -> MediaItem:
+        """Write the low-bandwidth GIF rendition next to the main preview."""
+        small_path = os.path.splitext(preview_path)[0] + "_small.gif"
+        if in_memory:
+            buffer = io.BytesIO()
+            VideoProcessor._save_gif(frames, buffer, fps, preset)
+            return MediaBuffer(os.path.basename(small_path), buffer.getvalue(), "image/gif")
+        VideoProcessor._save_gif(frames, small_path, fps, preset)
+        return small_path
+    
+    @staticmethod
+    def media_name(item: MediaItem) -> str:
+        """Display name of an output: the file path, or the MediaBuffer's name."""
+        return item.name if isinstance(item, MediaBuffer) else item
 
 
 class FileWaiter:
@@ -378,6 +838,133 @@ class AlertConfiguration:
         # File processing settings
         self.GIF_DURATION_SECONDS = 6
         self.GIF_FPS = 5
+        self.GIF_PRESET = "balanced"  # GifEncoder preset: fast | balanced | quality, or "pil" for the legacy encoder
+        self.GIF_STREAMING = True     # Encode GIF frames on a worker thread as they are decoded
+        
+        # Media is encoded in memory and uploaded with put_object. Set True (or the
+        # KEEP_LOCAL_MEDIA env var) to also keep files in GIF_SAVE_DIR for debugging.
+        self.KEEP_LOCAL_MEDIA = False
+        
+        # A streamed GIF (GIF_STREAMING, so only without GIF_MAX_BYTES) is uploaded as a
+        # multipart stream while it is encoded instead of after. The multipart upload starts
+        # once one part (5 MiB) has been encoded; a smaller GIF is sent with a single
+        # put_object when it is done. Seconds to wait for it to finish.
+        self.STREAM_UPLOADS = True
+        self.STREAM_UPLOAD_TIMEOUT = 60
+        
+        # Archive the exported MP4 to MinIO (clips/<camera>/<YYYYMMDD>/...) so it can be reviewed
+        # or reprocessed without another BI export. "full" uploads the export as-is; "trimmed"
+        # remuxes (no re-encode, needs PyAV) the first ARCHIVE_CLIP_SECONDS from the trigger.
+        self.ARCHIVE_CLIPS = False
+        self.ARCHIVE_CLIP_MODE = "full"
+        self.ARCHIVE_CLIP_SECONDS = 30
+        # The alert is logged without waiting for the archive; its clip_url is filled in once the
+        # upload finishes, waiting up to ARCHIVE_UPLOAD_TIMEOUT after the rest of the run.
+        self.ARCHIVE_UPLOAD_TIMEOUT = 600   # seconds; a full export is far bigger than a preview
+        
+        # Preview format: gif | webp | mp4. CAMERA_PREVIEW_FORMATS overrides it per camera,
+        # e.g. {"FrontYardDW": "webp"}
+        self.PREVIEW_FORMAT = "gif"
+        self.CAMERA_PREVIEW_FORMATS: Dict[str, str] = {}
+        
+        # Preview frame selection: "motion" picks the most active window within
+        # MOTION_SEARCH_SECONDS of the trigger, "even" spreads frames over the whole export
+        self.GIF_SELECTION = "motion"
+        self.MOTION_SEARCH_SECONDS = 20
+        
+        # Still JPEG sent with the alert: "best" scores frames in the preview window by
+        # sharpness and activity, "mid" is the middle frame of the export
+        self.STILL_SELECTION = "best"
+        
+        # Hand encoding to a running encoding_service.py (warm process pool shared across
+        # alerts). Falls back to encoding in-process when the service is not reachable, or
+        # when no worker picked the job up within ENCODING_SERVICE_TIMEOUT seconds; a job
+        # already running then gets that long again before the handler stops waiting.
+        self.USE_ENCODING_SERVICE = True
+        self.ENCODING_SERVICE_TIMEOUT = 120
+        
+        # Processes used to map GIF frames onto the palette. Leave at 1 when the encoding
+        # service already runs one job per core.
+        self.GIF_WORKERS = 1
+        
+        # Upper bound for the GIF preview (messaging apps reject or re-compress large files).
+        # The encoder trades palette, frame rate, width and length to fit, planned from sample
+        # encodes before a single full encode; a budgeted GIF is therefore not streamed
+        # (GIF_STREAMING only applies with 0, which disables the budget).
+        self.GIF_MAX_BYTES = 3 * 1024 * 1024
+        
+        # Extra renditions sent alongside the main preview: a small low-FPS GIF for slow
+        # connections and a poster JPEG. Set a width to 0 to skip that rendition.
+        self.SMALL_PREVIEW_WIDTH = 320
+        self.SMALL_PREVIEW_FPS = 2
+        self.POSTER_WIDTH = 320
+        
+        # Contact sheet: a grid JPEG of CONTACT_SHEET_FRAMES frames ("motion" follows the
+        # activity scan, "even" spreads over the export). 0 disables.
+        self.CONTACT_SHEET_FRAMES = 9
+        self.CONTACT_SHEET_SELECTION = "motion"
+        
+        # Crop the preview to the subject before resizing. CAMERA_CROP_REGIONS pins a region
+        # per camera as fractions of the frame (x0, y0, x1, y1), e.g. {"Driveway": (0.3, 0.2, 1.0, 1.0)};
+        # other cameras use the moving region from the motion scan when GIF_AUTO_CROP is set.
+        # CROP_STILLS applies the same crop to the still, poster and timed JPEGs; the contact
+        # sheet always shows the whole frame.
+        self.GIF_AUTO_CROP = True
+        self.CAMERA_CROP_REGIONS: Dict[str, Tuple[float, float, float, float]] = {}
+        self.CROP_STILLS = False
+        
+        # Static stretches of the preview become one frame with a longer delay. The value is
+        # the busiest-block mean difference (gray levels) below which frames count as
+        # identical; 0 disables. A streamed GIF merges unchanged frames regardless.
+        self.FRAME_DEDUP_THRESHOLD = 3.0
+        
+        # Long exports (over FrameSampler.PARALLEL_MIN_SPAN frames between the first and last
+        # frame needed) are decoded in this many segments at once, one capture per thread.
+        # Off by default: measure with benchmark_video.py's decode suite on the BI machine
+        # first, since the encoding service and Blue Iris already compete for the cores.
+        self.DECODE_WORKERS = 1
+        
+        # Decoder: "opencv" (cv2.VideoCapture) or "pyav" (FFmpeg via PyAV, threaded decoding;
+        # needs `pip install av`). benchmark_video.py's backends suite compares them.
+        self.DECODE_BACKEND = "opencv"
+        
+        # Serve still-only frames (mid-frame, timed JPEGs, evenly spread contact sheets) from
+        # the nearest keyframe, skipping the decode of everything in between. Needs PyAV;
+        # ignored without it.
+        self.KEYFRAME_STILLS = True
+        
+        # Near-duplicate alerts: the middle frame's perceptual hash (PHASH_METHOD: dhash | phash,
+        # cropped like the preview to the camera's CAMERA_CROP_REGIONS entry, if any) is compared with
+        # the alerts sent for the camera in the last DUPLICATE_WINDOW_SECONDS. Within
+        # DUPLICATE_MAX_DISTANCE differing bits (of 64), DUPLICATE_SUPPRESSION "suppress" stops
+        # before the GIF encode, uploads and webhook; "log" only reports it (for tuning); "off".
+        # A small subject in a wide static scene barely moves the hash, so tune with "log" first.
+        # An alert's hash is claimed when it is checked, so alerts of a burst handled at the same
+        # time see each other; a failed alert withdraws its claim.
+        # The middle frame stands in for the still that is sent: STILL_SELECTION "best" only picks
+        # that one during the encode, which the check exists to skip.
+        self.DUPLICATE_SUPPRESSION = "log"
+        self.DUPLICATE_WINDOW_SECONDS = 600
+        self.DUPLICATE_MAX_DISTANCE = 4
+        self.PHASH_METHOD = "dhash"
+        
+        # Check the alert's JPEG with a local CPU detector before exporting, and skip the export
+        # when no AI_OBJECT scores DETECTOR_THRESHOLD. Any SSD model OpenCV DNN reads works; the
+        # defaults describe the Caffe MobileNet-SSD, which `python download_models.py` saves to
+        # models/. Other models need DETECTOR_LABELS (a text file, one class name per line in
+        # class-id order) and their own input scaling. A missing model, alert handle or image
+        # skips the check rather than the alert.
+        # Runs on the encoding service when it is up, which batches detections for alert bursts.
+        self.VERIFY_BEFORE_EXPORT = False
+        self.DETECTOR_MODEL = str(Path(__file__).with_name("models") / "MobileNetSSD_deploy.caffemodel")
+        self.DETECTOR_CONFIG = str(Path(__file__).with_name("models") / "MobileNetSSD_deploy.prototxt")
+        self.DETECTOR_LABELS = None
+        self.DETECTOR_INPUT_SIZE = 300
+        self.DETECTOR_SCALE = 1 / 127.5
+        self.DETECTOR_MEAN = 127.5
+        self.DETECTOR_SWAP_RB = False
+        self.DETECTOR_THRESHOLD = 0.4
+        self.DETECTOR_MAX_BATCH = 8
     
     def get_export_duration(self, alert_msec: int) -> int:
         """Decide export duration based on alert duration."""
@@ -385,4 +972,46 @@ class AlertConfiguration:
     
     def get_gif_filename(self, camera: str) -> str:
         """Generate GIF filename with timestamp."""
-        return f"{camera}_{datetime.now().strftime('%m%d%y_%H%M%S')}.gif"
\ No newline at end of file
+        return self.get_preview_filename(camera, "gif")
+    
+    def get_clip_key(self, camera: str, timestamp: str, alert_handle: str) -> Tuple[str, str]:
+        """
+        (object_prefix, name) of the archived source clip, derived from the alert alone so a
+        clip can be found again from its alert: clips/<camera>/<YYYYMMDD>/<camera>_<HHMMSS>_<handle>.mp4.
+        The date and time come from the Blue Iris timestamp (today's date when it has none);
+        the alert handle, unique per alert, keeps alerts in the same second apart.
+        """
+        def slug(value: str) -> str:
+            return re.sub(r"[^A-Za-z0-9-]+", "", str(value or "")) or "none"
+        alert_time = self.parse_alert_timestamp(timestamp)
+        when = alert_time.strftime("%H%M%S") if alert_time else slug(timestamp)
+        day = (alert_time or datetime.now()).strftime("%Y%m%d")
+        return f"clips/{camera}/{day}", f"{camera}_{when}_{slug(alert_handle)}.mp4"
+    
+    @staticmethod
+    def parse_alert_timestamp(timestamp: str) -> Optional[datetime]:
+        """Blue Iris alert timestamp as a datetime (time-only formats get today's date); None if unrecognised."""
+        for fmt in ("%m/%d/%Y %I:%M:%S %p", "%m/%d/%Y %I:%M:%S%p", "%m/%d/%Y %H:%M:%S"):
+            try:
+                return datetime.strptime(str(timestamp or "").strip(), fmt)
+            except ValueError:
+                pass
+        for fmt in ("%I:%M:%S %p", "%H:%M:%S"):
+            try:
+                parsed = datetime.strptime(str(timestamp or "").strip(), fmt)
+                return datetime.combine(datetime.now().date(), parsed.time())
+            except ValueError:
+                pass
+        return None
+    
+    def get_preview_format(self, camera: str) -> str:
+        """Preview format for a camera, falling back to PREVIEW_FORMAT."""
+        return self.CAMERA_PREVIEW_FORMATS.get(camera, self.PREVIEW_FORMAT)
+    
+    def get_crop_region(self, camera: str) -> Optional[Tuple[float, float, float, float]]:
+        """Fixed preview crop for a camera, or None to use auto-cropping (if enabled)."""
+        return self.CAMERA_CROP_REGIONS.get(camera)
+    
+    def get_preview_filename(self, camera: str, preview_format: str) -> str:
+        """Generate preview filename with timestamp."""
+        return f"{camera}_{datetime.now().strftime('%m%d%y_%H%M%S')}.{preview_format}"
\ No newline at end of file
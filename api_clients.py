@@ -1,10 +1,13 @@
 # api_clients.py
 from __future__ import annotations
 import hashlib
+import io
+import queue
 import re
+import threading
 import time
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
 
 import requests
 from minio import Minio
@@ -65,6 +68,19 @@ class BlueIrisAPI:
         session = self.ensure_session()
         return self._post({"cmd": "export", "session": session, "path": path, "startms": startms, "msec": msec})
 
+    def _get_image(self, path: str, params: Dict[str, Any]) -> bytes:
+        url = f"{self.cfg.host}/{path}"
+        self._debug(f"BI GET {url}")
+        r = requests.get(url, params={"session": self.ensure_session(), **params}, timeout=self.cfg.timeout)
+        r.raise_for_status()
+        if not r.headers.get("Content-Type", "").startswith("image/"):
+            raise RuntimeError(f"Blue Iris returned {r.headers.get('Content-Type')} instead of an image for {path}")
+        return r.content
+
+    def alert_image(self, alert_handle: str) -> bytes:
+        """Full-size JPEG Blue Iris saved for an alert (e.g. "@1896798668")."""
+        return self._get_image(f"alerts/{alert_handle}", {"fulljpeg": 1})
+
     # ---------- helpers specific to your logic (still API-focused) ----------
 
     @staticmethod
@@ -102,9 +118,10 @@ class BlueIrisAPI:
         valid_alerts.sort(key=lambda x: x.get("date", 0), reverse=True)
         sel = valid_alerts[0]
 
-        # Normalize to the structure your main expects
+        # Normalize to the structure your main expects; "alert" is the alert's own handle (its JPEG)
         return {
             "path": sel.get("clip", ""),
+            "alert": sel.get("path", ""),
             "camera": sel.get("camera", camera),
             "offset": sel.get("offset", 0),
             "msec": sel.get("msec", 0),
@@ -122,7 +139,136 @@ class MinioConfig:
     bucket: str
     secure: bool = True
 
+class UploadStream(io.RawIOBase):
+    """
+    Writable stream that MinioStorage.open_upload uploads while it is still being written.
+    Writes are buffered until min_stream_bytes (one multipart part) have arrived; only then
+    does a background put_object(length=-1) start, sending the chunks as multipart parts.
+    An object closed below that size gains nothing from streaming, so close() sends it with
+    a single put_object of known length instead. result() returns the URL either way.
+    abort() makes the upload fail so MinIO discards the parts already sent.
+    """
+
+    QUEUE_CHUNKS = 64
+
+    def __init__(
+        self,
+        stream_upload: Callable[["UploadStream"], str],
+        bytes_upload: Callable[[bytes], str],
+        min_stream_bytes: int = 0
+    ):
+        super().__init__()
+        self._stream_upload = stream_upload
+        self._bytes_upload = bytes_upload
+        self._min_stream_bytes = min_stream_bytes
+        self._buffered: List[bytes] = []
+        self._started = False
+        self._chunks: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=self.QUEUE_CHUNKS)
+        self._pending = b""
+        self._eof = False
+        self._aborted = False
+        self._done = threading.Event()
+        self._url: Optional[str] = None
+        self._error: Optional[BaseException] = None
+        self.bytes_written = 0
+
+    # writer side (the encoder)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed UploadStream")
+        chunk = bytes(data)
+        if not chunk:
+            return 0
+        self.bytes_written += len(chunk)
+        if self._started:
+            self._put(chunk)
+        else:
+            self._buffered.append(chunk)
+            if self.bytes_written >= self._min_stream_bytes:
+                self._start(self._stream_upload, self)
+                self._put(b"".join(self._buffered))
+                self._buffered = []
+        return len(chunk)
+
+    def close(self) -> None:
+        if not self.closed:
+            if self._started:
+                self._put(None)
+            else:
+                self._start(self._bytes_upload, b"".join(self._buffered))
+                self._buffered = []
+        super().close()
+
+    def abort(self) -> None:
+        """Fail the upload instead of completing it."""
+        self._aborted = True
+        if not self.closed:
+            if self._started:
+                self._put(None)
+            else:
+                self._buffered = []
+                self._finish(None, IOError("Upload aborted by producer"))
+            super().close()
+
+    def _start(self, upload: Callable, source) -> None:
+        self._started = True
+
+        def run():
+            try:
+                self._finish(upload(source), None)
+            except BaseException as e:
+                self._finish(None, e)
+
+        threading.Thread(target=run, name="upload-stream", daemon=True).start()
+
+    def _put(self, chunk: Optional[bytes]) -> None:
+        # A bounded queue keeps a stalled upload from buffering the whole output in memory
+        while not self._done.is_set():
+            try:
+                self._chunks.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        if chunk is not None:
+            raise IOError(f"Upload already finished: {self._error}")
+
+    # reader side (put_object)
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._pending and not self._eof:
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._pending = chunk
+        if self._aborted:
+            raise IOError("Upload aborted by producer")
+        if size is None or size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def _finish(self, url: Optional[str], error: Optional[BaseException]) -> None:
+        self._url, self._error = url, error
+        self._done.set()
+
+    def result(self, timeout: Optional[float] = None) -> str:
+        """Wait for the upload to complete and return the object's URL."""
+        if not self._done.wait(timeout):
+            raise TimeoutError("Streaming upload did not complete in time")
+        if self._error:
+            raise self._error
+        return self._url
+
+
 class MinioStorage:
+    # put_object's multipart part size for streams of unknown length (S3 minimum is 5 MiB)
+    STREAM_PART_SIZE = 5 * 1024 * 1024
+
     def __init__(self, cfg: MinioConfig, debug_log=lambda *_: None, log=lambda *_: None):
         self.cfg = cfg
         self._debug = debug_log
@@ -133,30 +279,93 @@ class MinioStorage:
             secret_key=cfg.secret_key,
             secure=cfg.secure
         )
+        self._bucket_ready = False
 
     def ensure_bucket(self):
+        """Create the bucket if needed; checked once per client."""
+        if self._bucket_ready:
+            return
         if not self.client.bucket_exists(self.cfg.bucket):
             self.client.make_bucket(self.cfg.bucket)
+        self._bucket_ready = True
 
-    def upload_file(self, local_path: str, object_prefix: str = "alerts", content_type: Optional[str]=None) -> str:
-        """Uploads a single file and returns a URL."""
+    def upload_file(self, local_path: str, object_prefix: str = "alerts", content_type: Optional[str]=None,
+                    name: Optional[str] = None) -> str:
+        """Uploads a single file (as name, default its file name) and returns a URL."""
         from pathlib import Path
         self.ensure_bucket()
-        name = Path(local_path).name
+        name = name or Path(local_path).name
         object_name = f"{object_prefix}/{name}"
 
-        # basic content-type inference
         if content_type is None:
-            ext = Path(local_path).suffix.lower()
-            ct_map = {'.gif': 'image/gif', '.mp4': 'video/mp4', '.avi': 'video/avi', '.mov': 'video/quicktime', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg'}
-            content_type = ct_map.get(ext, 'application/octet-stream')
+            content_type = self._guess_content_type(name)
 
         self._debug(f"MinIO fput_object {self.cfg.bucket}/{object_name} ({content_type})")
         result = self.client.fput_object(self.cfg.bucket, object_name, local_path, content_type=content_type)
-        url = f"{'https' if self.cfg.secure else 'http'}://{self.cfg.endpoint}/{self.cfg.bucket}/{object_name}"
+        url = self._object_url(object_name)
         self._log(f"✅ Uploaded to MinIO: {object_name}")
         return url
 
+    def upload_bytes(self, data: bytes, name: str, object_prefix: str = "alerts", content_type: Optional[str]=None) -> str:
+        """Uploads an in-memory object with put_object and returns a URL."""
+        self.ensure_bucket()
+        object_name = f"{object_prefix}/{name}"
+
+        if content_type is None:
+            content_type = self._guess_content_type(name)
+
+        self._debug(f"MinIO put_object {self.cfg.bucket}/{object_name} ({content_type}, {len(data)} bytes)")
+        self.client.put_object(self.cfg.bucket, object_name, io.BytesIO(data), length=len(data), content_type=content_type)
+        url = self._object_url(object_name)
+        self._log(f"✅ Uploaded to MinIO: {object_name}")
+        return url
+
+    def upload_stream(self, stream: BinaryIO, name: str, object_prefix: str = "alerts",
+                      content_type: Optional[str] = None, part_size: Optional[int] = None) -> str:
+        """
+        Uploads a readable stream of unknown length (a producer still writing, a file being
+        copied, a pipe) as a multipart upload and returns a URL. Parts go up as soon as
+        part_size bytes have been read, so a slow producer overlaps with the upload.
+        """
+        self.ensure_bucket()
+        object_name = f"{object_prefix}/{name}"
+
+        if content_type is None:
+            content_type = self._guess_content_type(name)
+
+        self._debug(f"MinIO multipart put_object {self.cfg.bucket}/{object_name} ({content_type}, streamed)")
+        self.client.put_object(
+            self.cfg.bucket, object_name, stream, length=-1,
+            part_size=part_size or self.STREAM_PART_SIZE, content_type=content_type
+        )
+        url = self._object_url(object_name)
+        self._log(f"✅ Uploaded to MinIO: {object_name}")
+        return url
+
+    def open_upload(self, name: str, object_prefix: str = "alerts", content_type: Optional[str] = None) -> UploadStream:
+        """
+        Starts a streaming upload and returns the UploadStream to write the object into.
+        Close it when done and call result() for the URL; abort() it if the producer fails.
+        The multipart upload only starts once a part's worth has been written; a smaller
+        object is sent with a single put_object on close.
+        """
+        return UploadStream(
+            lambda stream: self.upload_stream(stream, name, object_prefix, content_type),
+            lambda data: self.upload_bytes(data, name, object_prefix, content_type),
+            min_stream_bytes=self.STREAM_PART_SIZE
+        )
+
+    @staticmethod
+    def _guess_content_type(name: str) -> str:
+        """basic content-type inference from the file extension"""
+        from pathlib import Path
+        ext = Path(name).suffix.lower()
+        ct_map = {'.gif': 'image/gif', '.webp': 'image/webp', '.mp4': 'video/mp4', '.avi': 'video/avi', '.mov': 'video/quicktime', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg'}
+        return ct_map.get(ext, 'application/octet-stream')
+
+    def _object_url(self, object_name: str) -> str:
+        return f"{'https' if self.cfg.secure else 'http'}://{self.cfg.endpoint}/{self.cfg.bucket}/{object_name}"
+
     def upload_many(self, local_paths: List[str], object_prefix: str = "alert_frames") -> List[str]:
         urls: List[str] = []
         for p in local_paths:
@@ -187,18 +396,37 @@ class WebhookNotifier:
         timestamp: str,
         gif_url: str,
         jpeg_urls: Optional[List[str]] = None,
+        preview_content_type: str = "image/gif",
+        small_gif_url: Optional[str] = None,
+        poster_url: Optional[str] = None,
+        contact_sheet_url: Optional[str] = None,
     ) -> requests.Response:
+        """
+        gif_url is the animated preview, which may be a WebP or MP4 per preview_content_type;
+        has_gif means a preview is attached whatever its format, so receivers branch on
+        preview_content_type.
+        small_gif_url (low-res, low-FPS GIF) and poster_url (small JPEG) are optional renditions
+        receivers can pick from on slow connections. contact_sheet_url is a grid JPEG of
+        frames across the event.
+        """
         data = {
             "camera": camera,
             "timestamp": timestamp,
             "has_gif": "true",
             "minio_url": gif_url,
             "gif_source": "minio",
+            "preview_content_type": preview_content_type,
         }
         if jpeg_urls:
             data["has_jpegs"] = "true"
             data["jpeg_count"] = str(len(jpeg_urls))
             data["jpeg_urls"] = ",".join(jpeg_urls)
+        if small_gif_url:
+            data["small_gif_url"] = small_gif_url
+        if poster_url:
+            data["poster_url"] = poster_url
+        if contact_sheet_url:
+            data["contact_sheet_url"] = contact_sheet_url
 
         last_exc: Optional[Exception] = None
         for attempt in range(1, self.cfg.retries + 1):
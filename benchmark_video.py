@@ -0,0 +1,222 @@
+# benchmark_video.py
+"""
+Benchmarks for the video processing stages of the alert handler.
+Usage: python benchmark_video.py <path_to_mp4> [runs] [sampling|gif|decode|backends|all]
+
+Point it at a real Blue Iris export (ideally a long one, e.g. a 60s CLIP_DURATION_MS clip)
+to see how each stage scales with clip length.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import cv2
+from PIL import Image, ImageSequence
+
+from alert_helper import AlertConfiguration, VideoProcessor
+from gif_helper import GifEncoder
+from video_helper import DecodeBackend, FrameSampler, FrameExtractor
+
+
+def time_call(func, runs):
+    """Run func `runs` times and return (best_seconds, last_result)."""
+    best = None
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def legacy_read_all(mp4_path, count):
+    """The original sampler: cap.read() on every frame, keep every frame_step-th."""
+    cap = cv2.VideoCapture(mp4_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frame_step = max(1, int(total_frames / count))
+    kept = 0
+    frame_count = 0
+    while kept < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frame_count % frame_step == 0:
+            kept += 1
+        frame_count += 1
+    cap.release()
+    return kept
+
+
+def sampler_read(mp4_path, count, seek_threshold, keyframes=None):
+    """FrameSampler: grab without retrieve, seek across gaps that pass a keyframe."""
+    cap = cv2.VideoCapture(mp4_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    indices = FrameSampler.step_indices(total_frames, count)
+    kept = sum(1 for _ in FrameSampler.sample(cap, indices, seek_threshold, keyframes))
+    cap.release()
+    return kept
+
+
+def bench_sampling(mp4_path, runs):
+    config = AlertConfiguration()
+    count = config.GIF_DURATION_SECONDS * config.GIF_FPS
+
+    print(f"🎞  Frame sampling ({count} output frames, best of {runs})")
+    legacy_time, legacy_kept = time_call(lambda: legacy_read_all(mp4_path, count), runs)
+    print(f"   ├─ read() every frame:   {legacy_time * 1000:8.1f} ms ({legacy_kept} frames)")
+
+    grab_time, grab_kept = time_call(lambda: sampler_read(mp4_path, count, sys.maxsize), runs)
+    print(f"   ├─ grab() skipped frames: {grab_time * 1000:8.1f} ms ({grab_kept} frames)")
+
+    keyframes = FrameSampler.keyframe_indices(mp4_path)
+    seek_time, seek_kept = time_call(
+        lambda: sampler_read(mp4_path, count, FrameSampler.SEEK_THRESHOLD_FRAMES, keyframes), runs
+    )
+    print(f"   └─ grab() + seek:         {seek_time * 1000:8.1f} ms ({seek_kept} frames)")
+    print(f"   Speedup vs read(): {legacy_time / grab_time:.2f}x (grab), {legacy_time / seek_time:.2f}x (seek)")
+
+
+def bench_decode(mp4_path, runs):
+    config = AlertConfiguration()
+    count = config.GIF_DURATION_SECONDS * config.GIF_FPS
+    workers = max(2, os.cpu_count() or 1)
+
+    def extract(decode_workers):
+        return FrameExtractor.extract(
+            mp4_path, gif_frame_count=count, still="best", timed_jpegs=True, decode_workers=decode_workers
+        )
+
+    print(f"🧵 Segment decode (GIF + best still + timed JPEGs, best of {runs})")
+    serial_time, _ = time_call(lambda: extract(1), runs)
+    print(f"   ├─ one capture:           {serial_time * 1000:8.1f} ms")
+    parallel_time, _ = time_call(lambda: extract(workers), runs)
+    print(f"   └─ {workers} segment captures:    {parallel_time * 1000:8.1f} ms ({serial_time / parallel_time:.2f}x)")
+
+
+def backend_read(mp4_path, backend, indices, max_width=None, **options):
+    decoder = DecodeBackend.open(mp4_path, backend, **options)
+    try:
+        return sum(1 for _ in decoder.sample(indices, max_width=max_width))
+    finally:
+        decoder.release()
+
+
+def bench_backends(mp4_path, runs):
+    config = AlertConfiguration()
+    count = config.GIF_DURATION_SECONDS * config.GIF_FPS
+    probe = DecodeBackend.open(mp4_path)
+    total_frames = probe.probe().total_frames
+    probe.release()
+    indices = FrameSampler.step_indices(total_frames, count)
+
+    print(f"🔌 Decode backends ({len(indices)} frames across the clip, best of {runs})")
+    cases = [
+        ("opencv", "opencv", {}, None),
+        ("pyav", "pyav", {}, None),
+        ("pyav @ 320px", "pyav", {}, 320),
+        ("pyav keyframes only", "pyav", {"keyframes_only": True}, None),
+    ]
+    baseline = None
+    for label, backend, options, max_width in cases:
+        try:
+            elapsed, kept = time_call(lambda: backend_read(mp4_path, backend, indices, max_width, **options), runs)
+        except Exception as e:
+            print(f"   ├─ {label:<22} skipped: {e}")
+            continue
+        baseline = baseline or elapsed
+        print(f"   ├─ {label:<22} {elapsed * 1000:8.1f} ms ({kept} frames, {baseline / elapsed:.2f}x)")
+
+
+def gif_psnr(gif_path, frames, fps):
+    """Mean PSNR (dB) of the decoded GIF frames against the RGB source frames."""
+    decoded = []
+    with Image.open(gif_path) as gif:
+        for f in ImageSequence.Iterator(gif):
+            # Static frames are merged into longer delays; repeat them to line up with the source
+            repeats = max(1, round(f.info.get("duration", 1000 / fps) * fps / 1000))
+            decoded.extend([np.asarray(f.convert("RGB"), dtype=np.float32)] * repeats)
+    scores = []
+    for out, src in zip(decoded, frames):
+        mse = float(np.mean((out - src.astype(np.float32)) ** 2))
+        scores.append(99.0 if mse == 0 else 10 * np.log10(255.0 ** 2 / mse))
+    return sum(scores) / len(scores)
+
+
+def bench_gif(mp4_path, runs):
+    config = AlertConfiguration()
+    result = FrameExtractor.extract(mp4_path, gif_frame_count=config.GIF_DURATION_SECONDS * config.GIF_FPS)
+    frames = result.gif_frames
+    height, width = frames[0].shape[:2]
+
+    print(f"🎨 GIF encoding ({len(frames)} frames at {width}x{height}, best of {runs})")
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline = None
+        for preset in ["pil"] + list(GifEncoder.PRESETS):
+            gif_path = os.path.join(tmp, f"{preset}.gif")
+            elapsed, _ = time_call(lambda: VideoProcessor._save_gif(frames, gif_path, config.GIF_FPS, preset), runs)
+            size_kb = os.path.getsize(gif_path) / 1024
+            psnr = gif_psnr(gif_path, frames, config.GIF_FPS)
+            baseline = baseline or elapsed
+            label = "PIL optimize=True" if preset == "pil" else f"GifEncoder '{preset}'"
+            print(f"   ├─ {label:<22} {elapsed * 1000:8.1f} ms  {size_kb:9.1f} KB  {psnr:5.1f} dB  ({baseline / elapsed:.2f}x)")
+
+        workers = os.cpu_count() or 1
+        if workers > 1:
+            gif_path = os.path.join(tmp, "parallel.gif")
+            VideoProcessor._save_gif(frames, gif_path, config.GIF_FPS, "balanced", workers)  # warm the pool
+            elapsed, _ = time_call(
+                lambda: VideoProcessor._save_gif(frames, gif_path, config.GIF_FPS, "balanced", workers), runs
+            )
+            label = f"'balanced' x{workers} procs"
+            print(f"   └─ {label:<22} {elapsed * 1000:8.1f} ms  {os.path.getsize(gif_path) / 1024:9.1f} KB"
+                  f"  {gif_psnr(gif_path, frames, config.GIF_FPS):5.1f} dB  ({baseline / elapsed:.2f}x)")
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python benchmark_video.py <path_to_mp4> [runs] [sampling|gif|decode|backends|all]")
+        return 1
+
+    mp4_path = sys.argv[1]
+    if not os.path.exists(mp4_path):
+        print(f"❌ MP4 not found: {mp4_path}")
+        return 1
+
+    runs = 3
+    if len(sys.argv) > 2:
+        try:
+            runs = max(1, int(sys.argv[2]))
+        except ValueError:
+            print(f"⚠️ Invalid runs '{sys.argv[2]}'. Using default: {runs}")
+
+    suite = sys.argv[3] if len(sys.argv) > 3 else "all"
+
+    cap = cv2.VideoCapture(mp4_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    print(f"📼 {os.path.basename(mp4_path)}: {width}x{height}, {total_frames} frames @ {fps:.1f} fps")
+
+    benches = {
+        "sampling": bench_sampling,
+        "gif": bench_gif,
+        "decode": bench_decode,
+        "backends": bench_backends,
+    }
+    if suite != "all" and suite not in benches:
+        print(f"❌ Unknown benchmark '{suite}'. Choose from: {', '.join(benches)}, all")
+        return 1
+
+    for name, bench in benches.items():
+        if suite in ("all", name):
+            bench(mp4_path, runs)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
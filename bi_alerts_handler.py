@@ -2,6 +2,7 @@
 import sys
 import os
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -9,9 +10,13 @@ from dotenv import load_dotenv
 from api_clients import BlueIrisAPI, BlueIrisConfig, MinioStorage, MinioConfig, WebhookNotifier, WebhookConfig
 from alert_helper import (
     ArtifactManager, OnePasswordHelper, VideoProcessor, FileWaiter, 
-    SessionValidator, Logger, AlertConfiguration
+    SessionValidator, Logger, AlertConfiguration, MediaBuffer, MediaOptions
 )
 from database_helper import DatabaseLogger, DatabaseConfig
+from detector_helper import ObjectDetector
+from encoding_service import EncodingClient, EncodingServiceConfig
+from phash_helper import PerceptualHash, RecentHashIndex
+from video_helper import ClipRemuxer, FrameExtractor
 
 
 class BlueIrisAlertHandler:
@@ -26,6 +31,8 @@ class BlueIrisAlertHandler:
         self.config = AlertConfiguration()
         if debug_mode:
             self.config.ALERT_SEARCH_TIME = self.config.DEBUG_ALERT_SEARCH_TIME
+        if os.getenv("KEEP_LOCAL_MEDIA", "false").lower() == "true":
+            self.config.KEEP_LOCAL_MEDIA = True
         
         # Initialize paths and logging
         self._setup_paths()
@@ -34,6 +41,9 @@ class BlueIrisAlertHandler:
         # Initialize artifact manager
         self.artifact_manager = ArtifactManager(self.artifact_path)
         self.artifact = self.artifact_manager.load()
+        self.hash_index = RecentHashIndex(
+            Path(__file__).with_name("phash_index.json"), self.config.DUPLICATE_WINDOW_SECONDS
+        )
         
         # Initialize API clients (will be set up in main)
         self.bi_client = None
@@ -45,6 +55,17 @@ class BlueIrisAlertHandler:
         self.camera_arg = None
         self.timestamp_arg = None
         self.alert_name_arg = None
+        self.preview_content_type = "image/gif"
+        self.small_preview = None
+        self.poster = None
+        self.contact_sheet = None
+        self.preview_upload = None
+        self.clip_archive = None
+        self.alert_log_id = None
+        self.still_hash = None
+        self.hash_claimed = False
+        self.duplicate_of = None
+        self.rejection = None
     
     def _setup_paths(self):
         """Setup file paths."""
@@ -182,6 +203,7 @@ class BlueIrisAlertHandler:
             data = self.bi_client.clipstats(self.alert_name_arg)
             candidate = {
                 "path": data.get("path", ""),
+                "alert": self.alert_name_arg,
                 "camera": self.camera_arg,
                 "offset": data.get("triggeroffset", 0),
                 "msec": data.get("alertmsec", 0),
@@ -207,6 +229,66 @@ class BlueIrisAlertHandler:
         
         return alert_clip
     
+    def _verify_alert(self, alert_clip):
+        """Confirm the AI object in the alert's JPEG with the local detector; False means skip the export."""
+        if not self.config.VERIFY_BEFORE_EXPORT:
+            return True
+        handle = alert_clip.get("alert")
+        if not handle or handle == "@-1":
+            self.logger.log("ℹ️ No alert handle to fetch an alert JPEG for; exporting without detector check")
+            return True
+        if not os.path.exists(self.config.DETECTOR_MODEL):
+            self.logger.log(f"⚠️ Detector model missing ({self.config.DETECTOR_MODEL}); run download_models.py. "
+                            f"Exporting without detector check")
+            return True
+        try:
+            detections = self._detect_objects(self.bi_client.alert_image(handle))
+        except Exception as e:
+            self.logger.log(f"⚠️ Detector check unavailable, exporting anyway: {e}")
+            return True
+        source = f"alert JPEG {handle}"
+        
+        best = ObjectDetector.best(detections, self.config.AI_OBJECT)
+        if best and best.confidence >= self.config.DETECTOR_THRESHOLD:
+            self.logger.log(f"🔎 Detector confirmed {self.config.AI_OBJECT} in {source} ({best.confidence:.0%})")
+            return True
+        found = f"best {best.confidence:.0%}" if best else "none found"
+        self.rejection = (f"Rejected by detector: no {self.config.AI_OBJECT} >= "
+                          f"{self.config.DETECTOR_THRESHOLD:.0%} in {source} ({found})")
+        self.logger.log(f"🚫 {self.rejection}; skipping export")
+        return False
+    
+    def _detect_objects(self, image):
+        """Detections in a JPEG, on the encoding service (batched with other alerts) if it is up."""
+        if self.config.USE_ENCODING_SERVICE:
+            client = EncodingClient(EncodingServiceConfig.from_env(), log_func=self.logger.log)
+            if client.available():
+                try:
+                    return client.submit("detect_objects", image=image).result(
+                        timeout=self.config.ENCODING_SERVICE_TIMEOUT
+                    )
+                except Exception as e:
+                    self.logger.log(f"⚠️ Encoding service detection failed ({e}); detecting in-process")
+        detector = ObjectDetector.from_config(self.config)
+        return detector.detect(ObjectDetector.decode_jpeg(image))
+    
+    def _log_rejected(self):
+        """Record an alert the detector rejected; nothing is exported or sent."""
+        if self.db_logger:
+            try:
+                self.db_logger.log_alert(
+                    camera=self.camera_arg,
+                    timestamp=self.timestamp_arg,
+                    alert_handle=self.alert_name_arg,
+                    gif_url="",
+                    jpeg_urls=[],
+                    success=False,
+                    error_message=self.rejection,
+                    debug_mode=self.debug_mode
+                )
+            except Exception as e:
+                self.logger.log(f"⚠️ Failed to log to database: {e}")
+    
     def _export_video(self, alert_clip):
         """Export video clip from Blue Iris."""
         alert_path = alert_clip["path"]
@@ -231,49 +313,278 @@ class BlueIrisAlertHandler:
         
         return exported_mp4_path
     
+    def _is_duplicate(self, exported_mp4_path):
+        """
+        Hash the middle frame and compare it with the camera's recent alerts; True to suppress.
+        The middle frame stands in for the sent still, which is only picked during the encode.
+        """
+        mode = self.config.DUPLICATE_SUPPRESSION
+        if mode == "off":
+            return False
+        try:
+            result = FrameExtractor.extract(
+                exported_mp4_path, still="mid",
+                crop=self.config.get_crop_region(self.camera_arg), crop_stills=True,
+                backend=self.config.DECODE_BACKEND, keyframe_stills=self.config.KEYFRAME_STILLS
+            )
+            if result.still is None:
+                raise Exception("Failed to read middle frame")
+            self.still_hash = PerceptualHash.compute(result.still, self.config.PHASH_METHOD)
+            # Reserved as pending in the same locked step, so a concurrent alert of the burst sees it
+            match = self.hash_index.claim(
+                self.camera_arg, self.still_hash, self.config.DUPLICATE_MAX_DISTANCE, self.timestamp_arg
+            )
+        except Exception as e:
+            self.logger.log(f"⚠️ Duplicate check failed, processing normally: {e}")
+            return False
+        
+        if match is None:
+            self.hash_claimed = True
+            self.logger.debug(f"Still hash {self.still_hash:016x}: no recent near-duplicate")
+            return False
+        state = "still being processed, " if match.pending else ""
+        self.logger.log(f"🔁 Near-duplicate of the {match.label} alert ({state}{match.seconds_ago:.0f}s ago, "
+                        f"{match.distance} bits differ)")
+        if mode != "suppress":
+            return False
+        self.duplicate_of = match
+        return True
+    
+    def _log_suppressed(self):
+        """Record a suppressed duplicate; nothing is encoded, uploaded or sent."""
+        match = self.duplicate_of
+        self.logger.log("🔇 Duplicate suppressed: skipping GIF encode, uploads and webhook")
+        if self.db_logger:
+            try:
+                self.db_logger.log_alert(
+                    camera=self.camera_arg,
+                    timestamp=self.timestamp_arg,
+                    alert_handle=self.alert_name_arg,
+                    gif_url="",
+                    jpeg_urls=[],
+                    success=False,
+                    error_message=f"Suppressed: near-duplicate of the {match.label} alert ({match.distance} bits differ)",
+                    debug_mode=self.debug_mode
+                )
+            except Exception as e:
+                self.logger.log(f"⚠️ Failed to log to database: {e}")
+    
+    def _remember_still_hash(self):
+        """Add a sent alert's hash to the index (or confirm its claim) so later near-duplicates can be caught."""
+        if self.still_hash is None:
+            return
+        try:
+            if self.hash_claimed:
+                self.hash_index.confirm(self.camera_arg, self.still_hash, self.timestamp_arg)
+                self.hash_claimed = False
+            else:
+                self.hash_index.add(self.camera_arg, self.still_hash, self.timestamp_arg)
+        except Exception as e:
+            self.logger.log(f"⚠️ Failed to record still hash: {e}")
+    
+    def _release_still_hash(self):
+        """Withdraw the claimed hash of an alert that failed, so it does not suppress the next one."""
+        if not self.hash_claimed:
+            return
+        try:
+            self.hash_index.release(self.camera_arg, self.still_hash, self.timestamp_arg)
+            self.hash_claimed = False
+        except Exception as e:
+            self.logger.log(f"⚠️ Failed to release still hash: {e}")
+    
+    def _start_clip_archive(self, exported_mp4_path):
+        """Upload the source clip in the background while the preview is encoded; None if disabled."""
+        if not self.config.ARCHIVE_CLIPS:
+            return None
+        object_prefix, name = self.config.get_clip_key(self.camera_arg, self.timestamp_arg, self.alert_name_arg)
+        self.logger.log(f"🗄  Archiving source clip to MinIO as {object_prefix}/{name} ({self.config.ARCHIVE_CLIP_MODE})...")
+        pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clip-archive")
+        future = pool.submit(self._archive_clip, exported_mp4_path, object_prefix, name)
+        pool.shutdown(wait=False)
+        return future
+    
+    def _archive_clip(self, exported_mp4_path, object_prefix, name):
+        """Upload the export (or stream a trimmed remux of it) to MinIO; returns its URL."""
+        if self.config.ARCHIVE_CLIP_MODE == "trimmed":
+            stream = self.storage_client.open_upload(name, object_prefix, "video/mp4")
+            try:
+                ClipRemuxer.remux(exported_mp4_path, stream, 0.0, self.config.ARCHIVE_CLIP_SECONDS)
+            except Exception:
+                stream.abort()
+                raise
+            stream.close()
+            return stream.result(self.config.ARCHIVE_UPLOAD_TIMEOUT)
+        # The export is complete on disk, so its length is known: a plain fput_object
+        return self.storage_client.upload_file(exported_mp4_path, object_prefix, "video/mp4", name=name)
+    
+    def _archived_clip_url(self):
+        """URL of the archived source clip; a failed archive only leaves it out of the log."""
+        if self.clip_archive is None:
+            return None
+        try:
+            clip_url = self.clip_archive.result(timeout=self.config.ARCHIVE_UPLOAD_TIMEOUT)
+            self.logger.log(f"✅ Source clip archived: {clip_url}")
+            return clip_url
+        except Exception as e:
+            self.logger.log(f"⚠️ Source clip archive failed: {e}")
+            return None
+    
+    def _record_clip_archive(self):
+        """Wait for the source clip archive (after the alert is delivered and logged) and add its URL to the row."""
+        clip_url = self._archived_clip_url()
+        if not (clip_url and self.db_logger and self.alert_log_id):
+            return
+        try:
+            self.db_logger.update_clip_url(self.alert_log_id, clip_url)
+        except Exception as e:
+            self.logger.log(f"⚠️ Failed to record clip URL in database: {e}")
+    
     def _process_video(self, exported_mp4_path):
-        """Process exported video - convert to GIF and extract frames."""
-        # Convert to GIF
-        gif_filename = self.config.get_gif_filename(self.camera_arg)
-        gif_path = os.path.join(self.config.GIF_SAVE_DIR, gif_filename)
+        """Process exported video - convert to a preview and extract frames in a single decode pass."""
+        preview_format = self.config.get_preview_format(self.camera_arg)
+        preview_filename = self.config.get_preview_filename(self.camera_arg, preview_format)
+        preview_path = os.path.join(self.config.GIF_SAVE_DIR, preview_filename)
+        jpeg_dir = os.path.join(self.config.GIF_SAVE_DIR, "frames")
         
-        self.logger.log("🎬 Converting MP4 to GIF...")
-        converted_gif_path = VideoProcessor.convert_mp4_to_gif(
-            exported_mp4_path, 
-            gif_path, 
-            self.config.GIF_DURATION_SECONDS, 
-            self.config.GIF_FPS,
-            log_func=self.logger.log
+        self.logger.log(f"🎬 Converting MP4 to {preview_format.upper()} and extracting still JPEG...")
+        options = MediaOptions.from_config(self.config, self.camera_arg)
+        job = dict(
+            mp4_path=exported_mp4_path,
+            preview_path=preview_path,
+            jpeg_save_dir=jpeg_dir,
+            camera_name=self.camera_arg,
+            options=options,
         )
+        try:
+            outputs = self._encode_with_service(job)
+            if outputs is None:
+                self.preview_upload = self._open_preview_upload(options, preview_filename)
+                outputs = VideoProcessor.extract_alert_media(
+                    **job, preview_stream=self.preview_upload, log_func=self.logger.log
+                )
+        except Exception as e:
+            if self.preview_upload:
+                self.preview_upload.abort()
+                self.preview_upload = None
+            self.logger.log(f"❌ {preview_format.upper()} conversion failed: {e}")
+            raise Exception(f"{preview_format.upper()} conversion failed, aborting webhook")
         
-        if not converted_gif_path:
-            raise Exception("GIF conversion failed, aborting webhook")
+        if self.preview_upload and not outputs["preview_uploaded"]:
+            # The stream went unused, so the preview is uploaded from the output as usual
+            self.preview_upload.abort()
+            self.preview_upload = None
+        self.preview_content_type = outputs["content_type"]
+        self.small_preview = outputs["small_preview"]
+        self.poster = outputs["thumbnail"]
+        self.contact_sheet = outputs["contact_sheet"]
+        return outputs["preview"], outputs["still_jpeg"]
+    
+    def _open_preview_upload(self, options, preview_filename):
+        """Start a streaming upload for a preview encoded frame by frame, so it goes up while encoding."""
+        if not (self.config.STREAM_UPLOADS and VideoProcessor.streams_preview(options)):
+            return None
+        self.logger.log("📤 Streaming preview to MinIO while encoding...")
+        return self.storage_client.open_upload(
+            preview_filename, "alerts", VideoProcessor.PREVIEW_CONTENT_TYPES[options.preview_format]
+        )
+    
+    def _encode_with_service(self, job):
+        """Run the encoding job on the shared encoding service; None means encode in-process."""
+        if not self.config.USE_ENCODING_SERVICE:
+            return None
+        client = EncodingClient(EncodingServiceConfig.from_env(), log_func=self.logger.log)
+        if not client.available():
+            self.logger.log("ℹ️ Encoding service not running; encoding in-process")
+            return None
         
-        # Extract mid-frame JPEG
-        jpeg_dir = os.path.join(self.config.GIF_SAVE_DIR, "frames")
-        self.logger.log("📸 Extracting single mid-frame JPEG...")
-        mid_jpeg_local = VideoProcessor.extract_midframe_jpeg(
-            exported_mp4_path, jpeg_dir, self.camera_arg, log_func=self.logger.log
+        # The service writes its files under "service/" (same names, so the same object keys):
+        # a job that times out keeps running and must not overwrite the in-process fallback
+        preview_dir, preview_name = os.path.split(job["preview_path"])
+        service_job = dict(
+            job,
+            preview_path=os.path.join(preview_dir, "service", preview_name),
+            jpeg_save_dir=os.path.join(job["jpeg_save_dir"], "service"),
         )
+        self.logger.log("🎬 Submitting encoding job to encoding service...")
+        future = client.submit("extract_alert_media", **service_job)
+        timeout = self.config.ENCODING_SERVICE_TIMEOUT
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            pass
+        except Exception as e:
+            self.logger.log(f"⚠️ Encoding service job failed ({e}); encoding in-process")
+            return None
         
-        return converted_gif_path, mid_jpeg_local
+        # Encoding in-process while the service job also runs would double the CPU load in
+        # exactly the alert storms the pool absorbs: only fall back once the job is withdrawn
+        if future.withdraw():
+            self.logger.log(f"⚠️ No encoding worker free after {timeout}s; job withdrawn, encoding in-process")
+            return None
+        self.logger.log(f"⏳ Encoding service job still running after {timeout}s; waiting for it")
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self.logger.log(f"⚠️ Encoding service job still running after {2 * timeout}s; "
+                            f"ignoring its output and encoding in-process")
+        except Exception as e:
+            self.logger.log(f"⚠️ Encoding service job failed ({e}); encoding in-process")
+        return None
+    
+    def _upload_media(self, item, object_prefix, content_type=None):
+        """Upload a local file, or an in-memory MediaBuffer straight from memory."""
+        if isinstance(item, MediaBuffer):
+            return self.storage_client.upload_bytes(
+                item.data, item.name, object_prefix=object_prefix, content_type=content_type or item.content_type
+            )
+        return self.storage_client.upload_file(item, object_prefix=object_prefix, content_type=content_type)
+    
+    def _rendition_url(self, future, label):
+        """Result of an optional rendition upload; a failure only drops it from the webhook."""
+        if future is None:
+            return None
+        try:
+            url = future.result()
+            self.logger.log(f"✅ {label} uploaded: {url}")
+            return url
+        except Exception as e:
+            self.logger.log(f"⚠️ {label} upload failed: {e}")
+            return None
     
     def _upload_and_notify(self, converted_gif_path, mid_jpeg_local):
         """Upload files to MinIO and send webhook notification."""
-        # Upload main GIF
-        self.logger.log("📤 Uploading main GIF to MinIO...")
-        gif_minio_url = self.storage_client.upload_file(converted_gif_path, object_prefix="alerts")
-        self.logger.log(f"✅ Main GIF uploaded: {gif_minio_url}")
-        
-        # Upload JPEG if available
-        jpeg_minio_urls = []
-        if mid_jpeg_local:
-            self.logger.log("📤 Uploading mid-frame JPEG to MinIO...")
-            mid_jpeg_url = self.storage_client.upload_file(mid_jpeg_local, object_prefix="alert_frames")
-            jpeg_minio_urls = [mid_jpeg_url]
-            self.logger.log(f"✅ Mid-frame JPEG uploaded: {mid_jpeg_url}")
-        else:
-            self.logger.log("⚠️ No mid-frame JPEG produced; webhook will include GIF only")
+        # All renditions go up together; the main preview and still keep their own log lines
+        self.logger.log("📤 Uploading main GIF and renditions to MinIO...")
+        # Check the bucket before the parallel uploads, so they do not race to create it
+        self.storage_client.ensure_bucket()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            if self.preview_upload:
+                gif_future = pool.submit(self.preview_upload.result, self.config.STREAM_UPLOAD_TIMEOUT)
+            else:
+                gif_future = pool.submit(
+                    self._upload_media, converted_gif_path, "alerts", self.preview_content_type
+                )
+            jpeg_future = pool.submit(self._upload_media, mid_jpeg_local, "alert_frames") if mid_jpeg_local else None
+            small_future = pool.submit(self._upload_media, self.small_preview, "alerts") if self.small_preview else None
+            poster_future = pool.submit(self._upload_media, self.poster, "alert_frames") if self.poster else None
+            sheet_future = (
+                pool.submit(self._upload_media, self.contact_sheet, "alert_frames") if self.contact_sheet else None
+            )
+            
+            gif_minio_url = gif_future.result()
+            self.logger.log(f"✅ Main GIF uploaded: {gif_minio_url}")
+            
+            jpeg_minio_urls = []
+            if jpeg_future:
+                mid_jpeg_url = jpeg_future.result()
+                jpeg_minio_urls = [mid_jpeg_url]
+                self.logger.log(f"✅ Mid-frame JPEG uploaded: {mid_jpeg_url}")
+            else:
+                self.logger.log("⚠️ No mid-frame JPEG produced; webhook will include GIF only")
+            
+            small_gif_url = self._rendition_url(small_future, "Small GIF")
+            poster_url = self._rendition_url(poster_future, "Poster JPEG")
+            contact_sheet_url = self._rendition_url(sheet_future, "Contact sheet")
         
         # Send webhook
         self.logger.log("📨 Sending webhook...")
@@ -282,12 +593,17 @@ class BlueIrisAlertHandler:
             timestamp=self.timestamp_arg,
             gif_url=gif_minio_url,
             jpeg_urls=jpeg_minio_urls if jpeg_minio_urls else None,
+            preview_content_type=self.preview_content_type,
+            small_gif_url=small_gif_url,
+            poster_url=poster_url,
+            contact_sheet_url=contact_sheet_url,
         )
         
-        # Log to database - this is the key addition
+        # Log to database - this is the key addition. The archived clip's URL is added
+        # afterwards (_record_clip_archive), so a long archive upload never delays the row.
         if self.db_logger:
             try:
-                self.db_logger.log_alert(
+                self.alert_log_id = self.db_logger.log_alert(
                     camera=self.camera_arg,
                     timestamp=self.timestamp_arg,
                     alert_handle=self.alert_name_arg,
@@ -317,7 +633,7 @@ class BlueIrisAlertHandler:
         total_time = datetime.now() - self.script_start_time
         self.logger.log(f"  ├─ ⏱ Total execution time: {total_time}")
         self.logger.log(f"  ├─ MP4 exported: {os.path.basename(exported_mp4_path)}")
-        self.logger.log(f"  ├─ Main GIF: {os.path.basename(converted_gif_path)}")
+        self.logger.log(f"  ├─ Main GIF: {os.path.basename(VideoProcessor.media_name(converted_gif_path))}")
         if jpeg_minio_urls:
             self.logger.log(f"  └─ JPEG frames: {len(jpeg_minio_urls)} uploaded")
     
@@ -341,19 +657,31 @@ class BlueIrisAlertHandler:
             # Blue Iris operations
             self._handle_session_management()
             alert_clip = self._get_alert_clip()
+            if not self._verify_alert(alert_clip):
+                self._log_rejected()
+                self.logger.log("✅ Process completed (rejected before export)")
+                return
             exported_mp4_path = self._export_video(alert_clip)
+            if self._is_duplicate(exported_mp4_path):
+                self._log_suppressed()
+                self.logger.log("✅ Process completed (duplicate suppressed)")
+                return
+            self.clip_archive = self._start_clip_archive(exported_mp4_path)
             
             # Video processing
             converted_gif_path, mid_jpeg_local = self._process_video(exported_mp4_path)
             
             # Upload and notify (includes database logging)
             jpeg_minio_urls = self._upload_and_notify(converted_gif_path, mid_jpeg_local)
+            self._remember_still_hash()
             
             # Finalize
             self._finalize(exported_mp4_path, converted_gif_path, jpeg_minio_urls)
+            self._record_clip_archive()
             
         except Exception as e:
             self.logger.log(f"❌ Failed: {e}")
+            self._release_still_hash()
             
             # Log failure to database if we have the required info
             if self.db_logger and hasattr(self, 'camera_arg') and self.camera_arg:
@@ -86,6 +86,9 @@ class DatabaseLogger:
             jpeg_urls TEXT[], -- Array of JPEG URLs
             jpeg_count INTEGER DEFAULT 0,
             
+            -- URL of the archived source clip, if archived
+            clip_url TEXT,
+            
             -- Processing status
             success BOOLEAN DEFAULT FALSE,
             error_message TEXT,
@@ -95,6 +98,9 @@ class DatabaseLogger:
             created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
         );
         
+        -- Tables created before clip archiving lack the column
+        ALTER TABLE alert_logs ADD COLUMN IF NOT EXISTS clip_url TEXT;
+        
         -- Create indexes for common queries
         CREATE INDEX IF NOT EXISTS idx_alert_logs_camera ON alert_logs(camera);
         CREATE INDEX IF NOT EXISTS idx_alert_logs_created_at ON alert_logs(created_at);
@@ -120,7 +126,8 @@ class DatabaseLogger:
         jpeg_urls: List[str] = None,
         success: bool = True,
         error_message: str = None,
-        debug_mode: bool = False
+        debug_mode: bool = False,
+        clip_url: str = None
     ) -> str:
         """Log the alert data that was sent to n8n."""
         for attempt in range(3):
@@ -133,14 +140,14 @@ class DatabaseLogger:
                 insert_sql = """
                 INSERT INTO alert_logs (
                     id, camera, timestamp, alert_handle, gif_url, jpeg_urls, 
-                    jpeg_count, success, error_message, debug_mode
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    jpeg_count, success, error_message, debug_mode, clip_url
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """
                 
                 with self._connection.cursor() as cursor:
                     cursor.execute(insert_sql, (
                         log_id, camera, timestamp, alert_handle, gif_url, 
-                        jpeg_urls, len(jpeg_urls), success, error_message, debug_mode
+                        jpeg_urls, len(jpeg_urls), success, error_message, debug_mode, clip_url
                     ))
                     self._connection.commit()
                 
@@ -153,6 +160,18 @@ class DatabaseLogger:
                     raise
                 time.sleep(1)
     
+    def update_clip_url(self, log_id: str, clip_url: str) -> None:
+        """Set the archived clip URL of an alert logged before its archive upload finished."""
+        try:
+            self.connect()
+            with self._connection.cursor() as cursor:
+                cursor.execute("UPDATE alert_logs SET clip_url = %s WHERE id = %s", (clip_url, log_id))
+                self._connection.commit()
+            self._debug(f"Recorded clip URL for alert {log_id}")
+        except Exception as e:
+            self._log(f"❌ Failed to record clip URL: {e}")
+            raise
+    
     def get_recent_alerts(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Get recent alert logs for monitoring/debugging."""
         try:
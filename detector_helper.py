@@ -0,0 +1,156 @@
+# detector_helper.py
+"""
+CPU object detection used to double-check an alert before the export.
+
+Blue Iris' AI sometimes flags wind, shadows or headlights as a person. Running a small SSD
+detector (OpenCV DNN, CPU backend) over the alert JPEG takes tens of milliseconds, while a
+false positive that reaches the export costs the export, decode, encode and uploads.
+
+Any SSD-style model OpenCV DNN reads works (Caffe MobileNet-SSD, TensorFlow SSD MobileNet):
+their detection output is [1, 1, N, 7] rows of (image_id, class_id, confidence, x0, y0, x1,
+y1), and image_id is what lets one forward pass serve a whole batch of images.
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+import cv2
+
+
+# Class names of the Caffe MobileNet-SSD (PASCAL VOC), the default model
+VOC_LABELS = [
+    "background", "aeroplane", "bicycle", "bird", "boat", "bottle", "bus", "car", "cat", "chair",
+    "cow", "diningtable", "dog", "horse", "motorbike", "person", "pottedplant", "sheep", "sofa",
+    "train", "tvmonitor",
+]
+
+
+@dataclass
+class Detection:
+    label: str
+    confidence: float
+    box: Tuple[float, float, float, float]   # fractional x0, y0, x1, y1
+
+
+class ObjectDetector:
+    """An SSD detector on OpenCV's CPU backend, with batched inference."""
+
+    def __init__(
+        self,
+        model_path: str,
+        config_path: Optional[str] = None,
+        labels: Optional[Sequence[str]] = None,
+        input_size: int = 300,
+        scale: float = 1 / 127.5,
+        mean: float = 127.5,
+        swap_rb: bool = False,
+        min_confidence: float = 0.2,
+    ):
+        if not os.path.exists(model_path):
+            raise Exception(f"Detector model not found: {model_path} (run download_models.py)")
+        self.net = cv2.dnn.readNet(model_path, config_path or "")
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.labels = list(labels or VOC_LABELS)
+        self.input_size = input_size
+        self.scale = scale
+        self.mean = mean
+        self.swap_rb = swap_rb
+        self.min_confidence = min_confidence
+
+    @classmethod
+    def from_config(cls, config) -> "ObjectDetector":
+        """Build the detector described by an AlertConfiguration's DETECTOR_* settings."""
+        labels = None
+        if config.DETECTOR_LABELS:
+            with open(config.DETECTOR_LABELS, "r", encoding="utf-8") as f:
+                labels = [line.strip() for line in f]
+        return cls(
+            config.DETECTOR_MODEL,
+            config.DETECTOR_CONFIG,
+            labels=labels,
+            input_size=config.DETECTOR_INPUT_SIZE,
+            scale=config.DETECTOR_SCALE,
+            mean=config.DETECTOR_MEAN,
+            swap_rb=config.DETECTOR_SWAP_RB,
+        )
+
+    def detect_batch(self, images: List[np.ndarray]) -> List[List[Detection]]:
+        """Detections for each BGR image, from a single forward pass."""
+        if not images:
+            return []
+        size = (self.input_size, self.input_size)
+        blob = cv2.dnn.blobFromImages(
+            images, self.scale, size, (self.mean, self.mean, self.mean), swapRB=self.swap_rb, crop=False
+        )
+        self.net.setInput(blob)
+        rows = self.net.forward().reshape(-1, 7)
+
+        results: List[List[Detection]] = [[] for _ in images]
+        for image_id, class_id, confidence, x0, y0, x1, y1 in rows:
+            if image_id < 0 or confidence < self.min_confidence:
+                continue  # padding rows, or below anything worth reporting
+            class_id = int(class_id)
+            label = self.labels[class_id] if 0 <= class_id < len(self.labels) else str(class_id)
+            box = tuple(float(np.clip(v, 0.0, 1.0)) for v in (x0, y0, x1, y1))
+            results[int(image_id)].append(Detection(label, float(confidence), box))
+        for detections in results:
+            detections.sort(key=lambda d: d.confidence, reverse=True)
+        return results
+
+    def detect(self, image: np.ndarray) -> List[Detection]:
+        return self.detect_batch([image])[0]
+
+    @staticmethod
+    def best(detections: List[Detection], label: str) -> Optional[Detection]:
+        """The most confident detection of label (case-insensitive), if any."""
+        matches = [d for d in detections if d.label.lower() == label.lower()]
+        return max(matches, key=lambda d: d.confidence) if matches else None
+
+    @staticmethod
+    def decode_jpeg(data: bytes) -> np.ndarray:
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise Exception("Could not decode image")
+        return image
+
+
+class DetectionBatcher:
+    """
+    Groups detection requests that arrive together (an alert burst hitting the encoding
+    service) into one batched forward pass. A request waits at most max_wait_ms for others
+    to join; up to max_batch images go through the network at once.
+    """
+
+    def __init__(self, detector: ObjectDetector, max_batch: int = 8, max_wait_ms: float = 50):
+        self.detector = detector
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._requests: "queue.Queue[Tuple[np.ndarray, Future]]" = queue.Queue()
+        threading.Thread(target=self._run, name="detection-batcher", daemon=True).start()
+
+    def submit(self, image: np.ndarray) -> Future:
+        """Queue an image; the future resolves to its list of Detections."""
+        future: Future = Future()
+        self._requests.put((image, future))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._requests.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._requests.get(timeout=self.max_wait))
+                except queue.Empty:
+                    break
+            try:
+                results = self.detector.detect_batch([image for image, _ in batch])
+                for (_, future), detections in zip(batch, results):
+                    future.set_result(detections)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
@@ -0,0 +1,53 @@
+# download_models.py
+"""
+Downloads the default detector for VERIFY_BEFORE_EXPORT: the Caffe MobileNet-SSD (PASCAL VOC)
+from https://github.com/chuanqi305/MobileNet-SSD, saved where AlertConfiguration's
+DETECTOR_CONFIG and DETECTOR_MODEL point (models/ next to the handler by default).
+Run this once before enabling VERIFY_BEFORE_EXPORT.
+"""
+
+import os
+import sys
+import requests
+from alert_helper import AlertConfiguration
+
+BASE_URL = "https://raw.githubusercontent.com/chuanqi305/MobileNet-SSD/master"
+
+
+def download(url: str, path: str) -> None:
+    """Stream url to path through a temporary file, so an interrupted download leaves nothing behind."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".part"
+    with requests.get(url, stream=True, timeout=60) as r:
+        r.raise_for_status()
+        with open(tmp, "wb") as f:
+            for chunk in r.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+    os.replace(tmp, path)
+
+
+def main():
+    print("🔧 Downloading the MobileNet-SSD detector...")
+    config = AlertConfiguration()
+    files = [
+        (f"{BASE_URL}/deploy.prototxt", config.DETECTOR_CONFIG),
+        (f"{BASE_URL}/mobilenet_iter_73000.caffemodel", config.DETECTOR_MODEL),
+    ]
+    try:
+        for url, path in files:
+            if os.path.exists(path):
+                print(f"✅ Already present: {path}")
+                continue
+            print(f"📥 {url}")
+            download(url, path)
+            print(f"✅ Saved {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+    except Exception as e:
+        print(f"❌ Download failed: {e}")
+        return 1
+
+    print("\n🎉 Detector ready. Set VERIFY_BEFORE_EXPORT = True in AlertConfiguration to use it.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
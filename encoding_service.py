@@ -0,0 +1,279 @@
+# encoding_service.py
+"""
+Persistent video encoding service shared across alerts.
+
+Blue Iris starts a fresh bi_alerts_handler.py process per alert, so every alert pays for
+importing cv2/PIL and then quantizes its GIF under the GIL while other alerts queue up
+behind it. This service keeps a process pool warm and sized to the cores Blue Iris leaves
+free; handlers submit VideoProcessor jobs over a local socket and get futures back.
+
+Usage: python encoding_service.py
+Requires ENCODING_SERVICE_AUTHKEY in the environment (or .env), shared with the handler.
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+
+# VideoProcessor methods a client may run remotely
+JOB_METHODS = {
+    "extract_alert_media",
+    "convert_mp4_to_gif",
+    "extract_midframe_jpeg",
+    "extract_best_jpeg",
+    "extract_alert_jpegs",
+}
+
+# Jobs the service runs itself rather than on the pool: detection keeps one network loaded
+# and batches the images of alerts that arrive together
+SERVICE_JOBS = {"detect_objects"}
+
+
+@dataclass
+class EncodingServiceConfig:
+    host: str = "127.0.0.1"
+    port: int = 6061
+    authkey: Optional[bytes] = None
+    reserved_cores: int = 2      # left for Blue Iris recording/AI
+    workers: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "EncodingServiceConfig":
+        key = os.getenv("ENCODING_SERVICE_AUTHKEY")
+        return cls(
+            host=os.getenv("ENCODING_SERVICE_HOST", cls.host),
+            port=int(os.getenv("ENCODING_SERVICE_PORT", cls.port)),
+            authkey=key.encode() if key else None,
+        )
+
+    def worker_count(self) -> int:
+        if self.workers:
+            return self.workers
+        return max(1, (os.cpu_count() or 1) - self.reserved_cores)
+
+
+def _warm_worker() -> None:
+    """Pool initializer: import the heavy modules and touch the encoder once so jobs start hot."""
+    import numpy as np
+    from gif_helper import GifEncoder
+    import io
+
+    frames = np.zeros((2, 16, 16, 3), dtype=np.uint8)
+    GifEncoder("fast").encode(frames, io.BytesIO(), fps=5)
+
+
+def _run_job(method: str, kwargs: Dict[str, Any]) -> Tuple[str, Any, List[str]]:
+    """
+    Run a VideoProcessor method in a worker, capturing its log lines for the client.
+    Returns (status, result or error message, logs), so a failed job still reports its logs.
+    """
+    from alert_helper import VideoProcessor
+
+    logs: List[str] = []
+    try:
+        return "ok", getattr(VideoProcessor, method)(**kwargs, log_func=logs.append), logs
+    except Exception as e:
+        return "error", str(e), logs
+
+
+class EncodingService:
+    """Accepts jobs on a local socket and runs them on a warm process pool."""
+
+    # How often a connection waiting on a pool job is checked for a withdraw request
+    POLL_SECONDS = 0.1
+
+    def __init__(self, config: EncodingServiceConfig, log=print):
+        if not config.authkey:
+            raise RuntimeError("ENCODING_SERVICE_AUTHKEY not set; refusing to start without authentication")
+        self.config = config
+        self._log = log
+        self.pool = ProcessPoolExecutor(max_workers=config.worker_count(), initializer=_warm_worker)
+        self._batcher = None
+        self._batcher_lock = threading.Lock()
+
+    def serve_forever(self) -> None:
+        address = (self.config.host, self.config.port)
+        with Listener(address, authkey=self.config.authkey) as listener:
+            self._log(f"🎬 Encoding service listening on {address[0]}:{address[1]} with {self.config.worker_count()} workers")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    self._log(f"⚠️ Rejected connection: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn) -> None:
+        with conn:
+            try:
+                method, kwargs = conn.recv()
+            except EOFError:
+                return  # availability probe
+            logs: List[str] = []
+            try:
+                if method in SERVICE_JOBS:
+                    status, payload = "ok", self._detect_objects(**kwargs)
+                elif method in JOB_METHODS:
+                    status, payload, logs = self._wait(conn, self.pool.submit(_run_job, method, kwargs))
+                else:
+                    raise ValueError(f"Unknown job '{method}'")
+            except Exception as e:
+                status, payload = "error", str(e)
+            if status == "cancelled":
+                self._log(f"ℹ️ Encoding job withdrawn: {payload}")
+            elif status != "ok":
+                self._log(f"❌ Encoding job failed: {payload}")
+            try:
+                conn.send((status, payload, logs))
+            except Exception:
+                pass
+
+    def _wait(self, conn, job: Future) -> Tuple[str, Any, List[str]]:
+        """
+        Wait for a pool job while watching the connection for a withdraw request or the client
+        going away. A job no worker has started yet is dropped; one already running is left to
+        finish, and a withdrawing client is told so with a "running" message.
+        """
+        while True:
+            try:
+                return job.result(timeout=self.POLL_SECONDS)
+            except FutureTimeoutError:
+                pass
+            try:
+                if not conn.poll():
+                    continue
+                conn.recv()
+            except (EOFError, OSError):
+                job.cancel()
+                return "cancelled", "client disconnected", []
+            if job.cancel():
+                return "cancelled", "dropped before a worker started it", []
+            conn.send(("running", None, []))
+
+    def _detect_objects(self, image: bytes):
+        """Detections in a JPEG, batched with any other requests arriving at the same time."""
+        from alert_helper import AlertConfiguration
+        from detector_helper import DetectionBatcher, ObjectDetector
+
+        with self._batcher_lock:
+            if self._batcher is None:
+                config = AlertConfiguration()
+                self._batcher = DetectionBatcher(ObjectDetector.from_config(config), config.DETECTOR_MAX_BATCH)
+                self._log(f"🔎 Detector loaded: {config.DETECTOR_MODEL}")
+        return self._batcher.submit(ObjectDetector.decode_jpeg(image)).result()
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=True)
+
+
+class ServiceFuture(Future):
+    """Future of a service job; withdraw() takes the job back if no worker has started it."""
+
+    def __init__(self):
+        super().__init__()
+        self._withdraw = threading.Event()
+        self._answered = threading.Event()
+        self._dropped = False
+
+    def withdraw(self, timeout: float = 5.0) -> bool:
+        """
+        Ask the service to drop the job. True when it was dropped before a worker started it
+        (the future then raises CancelledError); False when it is already running, in which
+        case the future still resolves to its result.
+        """
+        self._withdraw.set()
+        self._answered.wait(timeout)
+        return self._dropped
+
+
+class EncodingClient:
+    """Submits VideoProcessor jobs to a running EncodingService."""
+
+    POLL_SECONDS = 0.1
+
+    def __init__(self, config: EncodingServiceConfig, log_func=print):
+        self.config = config
+        self._log = log_func
+
+    def available(self) -> bool:
+        """True if the service is configured and accepting connections."""
+        if not self.config.authkey:
+            return False
+        try:
+            Client((self.config.host, self.config.port), authkey=self.config.authkey).close()
+            return True
+        except Exception:
+            return False
+
+    def submit(self, method: str, **kwargs) -> ServiceFuture:
+        """
+        Queue a job; the future resolves to the method's return value. Remote log lines go to
+        log_func, also when the job fails. Each job waits on its own daemon thread, so a caller
+        that gives up on the future can exit without waiting for the service to answer.
+        """
+        if method not in JOB_METHODS and method not in SERVICE_JOBS:
+            raise ValueError(f"Unknown job '{method}'")
+        future = ServiceFuture()
+
+        def run() -> None:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self._round_trip(method, kwargs, future))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                future._answered.set()
+
+        threading.Thread(target=run, name="encoding-client", daemon=True).start()
+        return future
+
+    def _round_trip(self, method: str, kwargs: Dict[str, Any], future: ServiceFuture) -> Any:
+        with Client((self.config.host, self.config.port), authkey=self.config.authkey) as conn:
+            conn.send((method, kwargs))
+            withdrawing = False
+            while True:
+                if not conn.poll(self.POLL_SECONDS):
+                    if future._withdraw.is_set() and not withdrawing:
+                        conn.send(("withdraw", None))
+                        withdrawing = True
+                    continue
+                status, payload, logs = conn.recv()
+                if status != "running":
+                    break
+                future._answered.set()  # too late to withdraw; the result follows
+        for line in logs:
+            self._log(line)
+        if status == "cancelled":
+            future._dropped = True
+            raise CancelledError(payload)
+        if status != "ok":
+            raise RuntimeError(f"Encoding service job failed: {payload}")
+        return payload
+
+
+def main():
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
+    try:
+        service = EncodingService(EncodingServiceConfig.from_env())
+    except Exception as e:
+        print(f"❌ {e}")
+        return 1
+
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 Shutting down encoding service...")
+    finally:
+        service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
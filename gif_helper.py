@@ -0,0 +1,799 @@
+# gif_helper.py
+"""
+NumPy GIF encoding used by VideoProcessor in alert_helper.py.
+
+One palette is built for the whole animation from a sample of frames, then every frame
+is mapped against it through a precomputed color lookup table. This replaces PIL's
+optimize=True path, which quantizes each frame separately. Frames after the first are
+delta-encoded against what is already on screen, which suits mostly-static camera footage.
+"""
+
+import atexit
+import io
+import math
+import queue
+import struct
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, replace
+from multiprocessing import shared_memory
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+import numpy as np
+import cv2
+from PIL import Image, GifImagePlugin
+
+
+# 4x4 Bayer matrix, normalized to [-0.5, 0.5), for ordered dithering
+BAYER_4X4 = (np.array([
+    [0, 8, 2, 10],
+    [12, 4, 14, 6],
+    [3, 11, 1, 9],
+    [15, 7, 13, 5],
+], dtype=np.float32) + 0.5) / 16.0 - 0.5
+
+
+class GifPalette:
+    """Builds a global palette and a color lookup table for mapping frames onto it."""
+
+    @staticmethod
+    def sample_pixels(frames: List[np.ndarray], sample_frames: int, pixel_stride: int) -> np.ndarray:
+        """Take every pixel_stride-th pixel from up to sample_frames evenly spaced frames."""
+        count = min(len(frames), max(1, sample_frames))
+        picks = np.linspace(0, len(frames) - 1, count).round().astype(int)
+        return np.concatenate([
+            frames[i][::pixel_stride, ::pixel_stride].reshape(-1, 3) for i in np.unique(picks)
+        ])
+
+    @staticmethod
+    def histogram(pixels: np.ndarray, bits: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Bin pixels to `bits` per channel. Returns (bin colors as float32 RGB, pixel counts)."""
+        shift = 8 - bits
+        q = (pixels >> shift).astype(np.int32)
+        keys = (q[:, 0] << (2 * bits)) | (q[:, 1] << bits) | q[:, 2]
+        counts = np.bincount(keys, minlength=1 << (3 * bits))
+        used = np.nonzero(counts)[0]
+        mask = (1 << bits) - 1
+        centers = np.stack([(used >> (2 * bits)) & mask, (used >> bits) & mask, used & mask], axis=1)
+        colors = (centers.astype(np.float32) + 0.5) * (1 << shift)
+        return colors, counts[used].astype(np.float32)
+
+    @staticmethod
+    def median_cut(colors: np.ndarray, weights: np.ndarray, palette_size: int) -> np.ndarray:
+        """Weighted median cut over histogram bins. Returns (<= palette_size, 3) float32."""
+        def score(box: np.ndarray) -> Tuple[float, int]:
+            # Widest channel range, weighted by population; single-bin boxes cannot split
+            if len(box) < 2:
+                return 0.0, 0
+            spans = colors[box].max(axis=0) - colors[box].min(axis=0)
+            axis = int(spans.argmax())
+            return float(spans[axis] * np.sqrt(weights[box].sum())), axis
+
+        boxes = [np.arange(len(colors))]
+        scores = [score(boxes[0])]
+        while len(boxes) < palette_size:
+            best = max(range(len(boxes)), key=lambda i: scores[i][0])
+            if scores[best][0] <= 0:
+                break
+
+            box, (_, axis) = boxes.pop(best), scores.pop(best)
+            box = box[np.argsort(colors[box, axis], kind="stable")]
+            cumulative = np.cumsum(weights[box])
+            split = int(np.searchsorted(cumulative, cumulative[-1] / 2))
+            split = min(max(split, 1), len(box) - 1)
+            for half in (box[:split], box[split:]):
+                boxes.append(half)
+                scores.append(score(half))
+
+        return np.stack([
+            (colors[box] * weights[box, None]).sum(axis=0) / weights[box].sum() for box in boxes
+        ]).astype(np.float32)
+
+    @staticmethod
+    def nearest(colors: np.ndarray, palette: np.ndarray, chunk: int = 32768) -> np.ndarray:
+        """Index of the nearest palette entry for each color, computed in chunks to bound memory."""
+        palette = palette.astype(np.float32)
+        palette_sq = (palette ** 2).sum(axis=1)
+        out = np.empty(len(colors), dtype=np.uint8)
+        for start in range(0, len(colors), chunk):
+            block = colors[start:start + chunk].astype(np.float32)
+            # |c - p|^2 = |c|^2 - 2 c.p + |p|^2; |c|^2 is constant per row so it is dropped
+            distances = palette_sq[None, :] - 2.0 * block @ palette.T
+            out[start:start + chunk] = distances.argmin(axis=1)
+        return out
+
+    @staticmethod
+    def refine(colors: np.ndarray, weights: np.ndarray, palette: np.ndarray, iterations: int) -> np.ndarray:
+        """A few weighted k-means (Lloyd) steps over the histogram bins."""
+        for _ in range(iterations):
+            labels = GifPalette.nearest(colors, palette)
+            totals = np.bincount(labels, weights=weights, minlength=len(palette))
+            used = totals > 0
+            for channel in range(3):
+                sums = np.bincount(labels, weights=weights * colors[:, channel], minlength=len(palette))
+                palette[used, channel] = sums[used] / totals[used]
+        return palette
+
+    @staticmethod
+    def build(
+        frames: List[np.ndarray],
+        palette_size: int = 256,
+        sample_frames: int = 8,
+        pixel_stride: int = 4,
+        refine_iterations: int = 1
+    ) -> np.ndarray:
+        """Build one palette for all frames. Returns (N, 3) uint8 with N <= palette_size."""
+        pixels = GifPalette.sample_pixels(frames, sample_frames, pixel_stride)
+        colors, weights = GifPalette.histogram(pixels, bits=5)
+        palette = GifPalette.median_cut(colors, weights, palette_size)
+        palette = GifPalette.refine(colors, weights, palette, refine_iterations)
+        return np.clip(palette.round(), 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def lookup_table(palette: np.ndarray, bits: int) -> np.ndarray:
+        """Nearest palette index for every color at `bits` per channel, flattened to 1-D."""
+        levels = 1 << bits
+        grid = (np.arange(levels, dtype=np.float32) + 0.5) * (256 / levels)
+        r, g, b = np.meshgrid(grid, grid, grid, indexing="ij")
+        colors = np.stack([r.ravel(), g.ravel(), b.ravel()], axis=1)
+        return GifPalette.nearest(colors, palette)
+
+
+class GifWriter:
+    """
+    Minimal GIF89a container writer with a single global color table.
+    PIL only supplies the LZW-compressed image data for each frame.
+    """
+
+    def __init__(self, fp: BinaryIO, width: int, height: int, palette: np.ndarray, loop: int = 0):
+        self.fp = fp
+        self.width = width
+        self.height = height
+        self.palette = palette
+        self.frames_written = 0
+
+        # Global color table size must be a power of two, at least 2 entries
+        table_bits = max(1, int(np.ceil(np.log2(max(2, len(palette))))))
+        table = np.zeros((1 << table_bits, 3), dtype=np.uint8)
+        table[:len(palette)] = palette
+
+        fp.write(b"GIF89a")
+        fp.write(struct.pack("<HHBBB", width, height, 0x80 | 0x70 | (table_bits - 1), 0, 0))
+        fp.write(table.tobytes())
+        # NETSCAPE2.0 application extension: loop count (0 = forever)
+        fp.write(b"!\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", loop) + b"\x00")
+
+    def write_frame(
+        self,
+        indices: np.ndarray,
+        duration_ms: int,
+        offset: Tuple[int, int] = (0, 0),
+        transparency: Optional[int] = None,
+        disposal: int = 1
+    ) -> None:
+        """Write one frame of palette indices at offset. disposal=1 leaves it on screen for the next frame."""
+        image = Image.fromarray(np.ascontiguousarray(indices))
+        image.putpalette(self.palette.tobytes())
+        params: Dict[str, Any] = {"duration": duration_ms, "disposal": disposal}
+        if transparency is not None:
+            params["transparency"] = transparency
+        self.fp.write(b"".join(GifImagePlugin.getdata(image, offset, **params)))
+        self.frames_written += 1
+
+    def close(self) -> None:
+        self.fp.write(b";")
+
+
+class GifEncoder:
+    """
+    Encodes RGB frames to an animated GIF against a single global palette.
+
+    With delta encoding each frame after the first only carries the bounding box of pixels
+    that changed from what is already on screen, and unchanged pixels inside that box are
+    written as the transparent index. delta_threshold is the per-channel difference below
+    which a pixel counts as unchanged, which keeps sensor noise on static background out of
+    the output; 0 compares palette indices exactly.
+    """
+
+    PRESETS: Dict[str, Dict[str, Any]] = {
+        "fast": {
+            "palette_size": 128, "sample_frames": 4, "pixel_stride": 8, "refine_iterations": 0,
+            "lut_bits": 5, "dither": 0.0, "delta": True, "delta_threshold": 16,
+        },
+        "balanced": {
+            "palette_size": 256, "sample_frames": 8, "pixel_stride": 4, "refine_iterations": 1,
+            "lut_bits": 5, "dither": 0.0, "delta": True, "delta_threshold": 10,
+        },
+        "quality": {
+            "palette_size": 256, "sample_frames": 16, "pixel_stride": 2, "refine_iterations": 3,
+            "lut_bits": 6, "dither": 12.0, "delta": True, "delta_threshold": 6,
+        },
+    }
+
+    def __init__(self, preset: str = "balanced", workers: int = 1):
+        if preset not in self.PRESETS:
+            raise ValueError(f"Unknown GIF preset '{preset}' (expected one of {', '.join(self.PRESETS)})")
+        self.preset = preset
+        self.settings = self.PRESETS[preset]
+        self.workers = max(1, workers)
+
+    def build_palette(self, frames: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (palette, lookup table) for the given frames."""
+        s = self.settings
+        # Delta encoding reserves the last palette slot for transparency
+        palette_size = s["palette_size"] - 1 if s["delta"] else s["palette_size"]
+        palette = GifPalette.build(
+            frames,
+            palette_size=palette_size,
+            sample_frames=s["sample_frames"],
+            pixel_stride=s["pixel_stride"],
+            refine_iterations=s["refine_iterations"],
+        )
+        return palette, GifPalette.lookup_table(palette, s["lut_bits"])
+
+    def map_frame(self, frame: np.ndarray, lut: np.ndarray) -> np.ndarray:
+        """Map an RGB frame to palette indices, with optional ordered dithering."""
+        bits = self.settings["lut_bits"]
+        shift = 8 - bits
+        strength = self.settings["dither"]
+        if strength:
+            height, width = frame.shape[:2]
+            threshold = np.tile(BAYER_4X4 * strength, ((height + 3) // 4, (width + 3) // 4))[:height, :width]
+            frame = np.clip(frame + threshold[:, :, None], 0, 255).astype(np.uint8)
+        q = frame >> shift
+        keys = (q[:, :, 0].astype(np.int32) << (2 * bits)) | (q[:, :, 1].astype(np.int32) << bits) | q[:, :, 2]
+        return lut[keys]
+
+    def map_frames(self, frames: np.ndarray, lut: np.ndarray) -> np.ndarray:
+        """Map a (N, H, W, 3) batch to (N, H, W) palette indices, split across processes when workers > 1."""
+        if self.workers > 1 and len(frames) > 1:
+            return ParallelFrameMapper.map(frames, lut, self.preset, self.workers)
+        return np.stack([self.map_frame(frame, lut) for frame in frames])
+
+    def changed_mask(self, frame: np.ndarray, indices: np.ndarray, shown: np.ndarray, reference: np.ndarray) -> np.ndarray:
+        """
+        Pixels that differ from what the previous frames left on screen. `reference` holds the
+        source RGB of each on-screen pixel as of when it was written, so the comparison ignores
+        quantization error and small changes cannot accumulate into drift.
+        """
+        threshold = self.settings["delta_threshold"]
+        if threshold <= 0:
+            return indices != shown
+        diff = cv2.absdiff(frame, reference)
+        # Channel-wise np.maximum is much faster than diff.max(axis=2) on interleaved RGB
+        return np.maximum(np.maximum(diff[:, :, 0], diff[:, :, 1]), diff[:, :, 2]) > threshold
+
+    def encode(
+        self, frames: List[np.ndarray], fp: BinaryIO, fps: int, durations: Optional[List[int]] = None
+    ) -> int:
+        """
+        Encode frames to an open binary stream. durations (ms per frame) override the 1000 / fps
+        default. Returns the number of frames written.
+        """
+        if len(frames) == 0:
+            raise ValueError("No frames to encode")
+        stream = GifStream(self, fp, fps, palette=self.build_palette(frames))
+        try:
+            for i, frame in enumerate(frames):
+                stream.add_frame(frame, durations[i] if durations else None)
+            return stream.close()
+        except BaseException:
+            stream.abort()
+            raise
+
+    def open_stream(self, fp: BinaryIO, fps: int, threaded: bool = False):
+        """Start an incremental GifStream on fp, optionally encoding on a worker thread."""
+        stream = GifStream(self, fp, fps)
+        return ThreadedGifStream(stream) if threaded else stream
+
+    def save(self, frames: List[np.ndarray], gif_path: str, fps: int, durations: Optional[List[int]] = None) -> int:
+        """Encode frames to gif_path. Returns the number of frames written."""
+        with open(gif_path, "wb") as fp:
+            return self.encode(frames, fp, fps, durations)
+
+
+class GifStream:
+    """
+    Incremental GIF encoding: frames are added one at a time and their bytes reach fp as
+    soon as the palette is fixed. Without a precomputed palette, the first palette_frames
+    frames are copied aside to build one and everything after is written immediately, so
+    memory stays constant regardless of how many frames follow. add_frame() never keeps a
+    reference to the caller's array.
+
+    Each frame is held back until the next one arrives: a frame in which nothing changed
+    (with delta encoding) is folded into the held frame's duration instead of being
+    written, so static stretches cost one frame with a longer delay.
+
+    With workers > 1, a full batch is handed to ParallelFrameMapper and the previous batch
+    is written while the workers map it, so mapping overlaps both the LZW stage and the
+    caller decoding the next batch.
+    """
+
+    def __init__(
+        self,
+        encoder: GifEncoder,
+        fp: BinaryIO,
+        fps: int,
+        palette: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+        palette_frames: Optional[int] = None
+    ):
+        self.encoder = encoder
+        self.fp = fp
+        self.duration = int(1000 / fps)
+        self.palette_frames = palette_frames or encoder.settings["sample_frames"]
+        # With parallel mapping, frames are always batched so each batch spreads across workers
+        self.batch_frames = self.palette_frames
+        if encoder.workers > 1:
+            self.batch_frames = max(self.palette_frames, 2 * encoder.workers)
+        self.pending: Optional[np.ndarray] = None
+        self.pending_count = 0
+        self.writer: Optional[GifWriter] = None
+        self.palette: Optional[np.ndarray] = None
+        self.lut: Optional[np.ndarray] = None
+        self.transparent: Optional[int] = None
+        self.shown: Optional[np.ndarray] = None
+        self.reference: Optional[np.ndarray] = None
+        self.merged_frames = 0
+        self._held: Optional[Dict[str, Any]] = None
+        self._pending_durations: List[int] = []
+        self._preset_palette = palette
+        self._mapping: Optional[Tuple["MappedBatch", List[int]]] = None
+
+    def add_frame(self, frame: np.ndarray, duration_ms: Optional[int] = None) -> None:
+        """Add a frame shown for duration_ms (default: 1000 / fps)."""
+        duration = duration_ms or self.duration
+        if self.writer is None and self._preset_palette is not None:
+            self._start(frame.shape, *self._preset_palette)
+        if self.writer is not None and self.encoder.workers == 1:
+            self._write(frame, duration=duration)
+            return
+
+        if self.pending is None:
+            self.pending = np.empty((self.batch_frames,) + frame.shape, dtype=np.uint8)
+        self.pending[self.pending_count] = frame
+        self._pending_durations.append(duration)
+        self.pending_count += 1
+        if self.pending_count == self.batch_frames:
+            self._flush_pending()
+
+    def close(self) -> int:
+        """Finish the GIF (flushing any frames still held back). Returns frames written."""
+        if self.pending_count:
+            self._flush_pending()
+        self._write_mapped()
+        if self.writer is None:
+            raise ValueError("No frames to encode")
+        self._emit(None)
+        self.writer.close()
+        return self.writer.frames_written
+
+    def _flush_pending(self) -> None:
+        frames = self.pending[:self.pending_count]
+        if self.writer is None:
+            palette, lut = self.encoder.build_palette(frames[:self.palette_frames])
+            self._start(frames[0].shape, palette, lut)
+        if self.encoder.workers > 1 and len(frames) > 1:
+            # Frames are copied into a ring slot, so the pending buffer is free to refill
+            batch = ParallelFrameMapper.submit(frames, self.lut, self.encoder.preset, self.encoder.workers)
+            self._write_mapped()
+            self._mapping = (batch, self._pending_durations)
+        else:
+            self._write_mapped()
+            mapped = self.encoder.map_frames(frames, self.lut)
+            for frame, indices, duration in zip(frames, mapped, self._pending_durations):
+                self._write(frame, indices, duration)
+        self._pending_durations = []
+        self.pending_count = 0
+        if self.encoder.workers == 1:
+            self.pending = None
+
+    def _write_mapped(self) -> None:
+        """Write the batch the workers are mapping, straight from its ring slot, then free the slot."""
+        if self._mapping is None:
+            return
+        batch, durations = self._mapping
+        self._mapping = None
+        try:
+            frames, mapped = batch.result()
+            for frame, indices, duration in zip(frames, mapped, durations):
+                self._write(frame, indices, duration)
+        finally:
+            batch.release()
+
+    def abort(self) -> None:
+        """Drop a batch still being mapped without writing it, returning its ring slot."""
+        if self._mapping is not None:
+            self._mapping[0].release()
+            self._mapping = None
+
+    def _start(self, shape: Tuple[int, ...], palette: np.ndarray, lut: np.ndarray) -> None:
+        self.palette, self.lut = palette, lut
+        delta = self.encoder.settings["delta"]
+        self.transparent = len(palette) if delta else None
+        table = np.vstack([palette, np.zeros((1, 3), dtype=np.uint8)]) if delta else palette
+        height, width = shape[:2]
+        self.writer = GifWriter(self.fp, width, height, table)
+
+    def _write(self, frame: np.ndarray, indices: Optional[np.ndarray] = None, duration: Optional[int] = None) -> None:
+        duration = duration or self.duration
+        if indices is None:
+            indices = self.encoder.map_frame(frame, self.lut)
+        if self.shown is None or self.transparent is None:
+            # shown is updated in place later and indices may live in a ring slot, so both
+            # the held frame and shown need their own copies
+            self._emit(dict(indices=indices.copy(), duration_ms=duration))
+            self.shown = indices.copy()
+            self.reference = frame.copy()
+            return
+
+        transparent = self.transparent
+        changed = self.encoder.changed_mask(frame, indices, self.shown, self.reference)
+        rows = np.flatnonzero(changed.any(axis=1))
+        if len(rows) == 0:
+            # Nothing moved: show the held frame for longer instead of writing this one
+            self._held["duration_ms"] += duration
+            self.merged_frames += 1
+            return
+        cols = np.flatnonzero(changed.any(axis=0))
+        y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+        region_changed = changed[y0:y1, x0:x1]
+        region = np.where(region_changed, indices[y0:y1, x0:x1], transparent).astype(np.uint8)
+        self._emit(dict(indices=region, duration_ms=duration, offset=(int(x0), int(y0)), transparency=transparent))
+        self.shown[y0:y1, x0:x1][region_changed] = indices[y0:y1, x0:x1][region_changed]
+        self.reference[y0:y1, x0:x1][region_changed] = frame[y0:y1, x0:x1][region_changed]
+
+    def _emit(self, frame: Optional[Dict[str, Any]]) -> None:
+        """Write the held frame, now that its duration is final, and hold `frame` in its place."""
+        if self._held is not None:
+            self.writer.write_frame(**self._held)
+        self._held = frame
+
+
+@dataclass(frozen=True)
+class SharedArray:
+    """Picklable descriptor of a uint8 array inside a shared-memory segment."""
+    name: str
+    offset: int
+    shape: Tuple[int, ...]
+
+    def view(self, segment: shared_memory.SharedMemory) -> np.ndarray:
+        return np.ndarray(self.shape, dtype=np.uint8, buffer=segment.buf, offset=self.offset)
+
+
+class SharedFrameRing:
+    """
+    A fixed set of shared-memory slots reused from batch to batch. A producer copies its data
+    into a free slot and hands workers SharedArray descriptors; workers attach to each segment
+    once (see _attach) and keep the mapping, so after warm-up a batch costs one memcpy in
+    instead of creating, faulting in and unlinking fresh segments. Slots only grow. With two
+    slots one batch is mapped while the previous one is read back.
+    """
+
+    def __init__(self, slots: int = 2):
+        self._free: "queue.Queue[int]" = queue.Queue()
+        self._segments: List[Optional[shared_memory.SharedMemory]] = [None] * slots
+        for slot in range(slots):
+            self._free.put(slot)
+        atexit.register(self.close)
+
+    def acquire(self, nbytes: int) -> Tuple[int, shared_memory.SharedMemory]:
+        """Block until a slot is free and return it with a segment of at least nbytes."""
+        slot = self._free.get()
+        segment = self._segments[slot]
+        if segment is None or segment.size < nbytes:
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+            segment = self._segments[slot] = shared_memory.SharedMemory(create=True, size=nbytes)
+        return slot, segment
+
+    def release(self, slot: int) -> None:
+        self._free.put(slot)
+
+    def close(self) -> None:
+        for slot, segment in enumerate(self._segments):
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+                self._segments[slot] = None
+
+
+# Worker-side attachments, by segment name. Slots that grew leave stale names behind, so
+# only the most recent few are kept open.
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+_MAX_ATTACHED = 8
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    segment = _attached.get(name)
+    if segment is None:
+        while len(_attached) >= _MAX_ATTACHED:
+            _attached.pop(next(iter(_attached))).close()
+        segment = _attached[name] = shared_memory.SharedMemory(name=name)
+    return segment
+
+
+def _map_chunk(frames: SharedArray, out: SharedArray, lut: SharedArray, start: int, stop: int, preset: str) -> None:
+    """Worker side of ParallelFrameMapper: map frames[start:stop] from the ring slot in place."""
+    segment = _attach(frames.name)
+    source, target, table = frames.view(segment), out.view(segment), lut.view(segment)
+    encoder = GifEncoder(preset)
+    for i in range(start, stop):
+        target[i] = encoder.map_frame(source[i], table)
+    del source, target, table
+
+
+class MappedBatch:
+    """A batch in a ring slot that workers are mapping. Call release() once done with result()."""
+
+    def __init__(
+        self, ring: SharedFrameRing, slot: int, segment: shared_memory.SharedMemory,
+        source: SharedArray, out: SharedArray, futures: List[Future]
+    ):
+        self.ring = ring
+        self.slot: Optional[int] = slot
+        self.segment = segment
+        self.source = source
+        self.out = out
+        self.futures = futures
+
+    def result(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Wait for the workers; returns the batch's RGB frames and palette indices as views into the slot."""
+        for future in self.futures:
+            future.result()
+        return self.source.view(self.segment), self.out.view(self.segment)
+
+    def release(self) -> None:
+        """Return the slot to the ring, once no worker can still be writing to it."""
+        if self.slot is None:
+            return
+        for future in self.futures:
+            future.cancel()
+        wait(self.futures)
+        self.ring.release(self.slot)
+        self.slot = None
+
+
+class ParallelFrameMapper:
+    """
+    Palette mapping (dithering + LUT lookup) is independent per frame, so batches are split
+    into contiguous chunks and mapped in worker processes. Frames, the LUT and the output
+    indices share one SharedFrameRing slot; only descriptors and chunk bounds are pickled.
+    submit() returns as soon as the batch is in its slot, so the caller can fill the next
+    batch while this one maps (see GifStream). The pool and the ring live for the life of the
+    process so later batches and GIFs reuse warm workers and already-mapped memory.
+    """
+
+    _pool: Optional[ProcessPoolExecutor] = None
+    _pool_workers = 0
+    _ring: Optional[SharedFrameRing] = None
+
+    @classmethod
+    def pool(cls, workers: int) -> ProcessPoolExecutor:
+        if cls._pool is None or cls._pool_workers != workers:
+            if cls._pool is not None:
+                cls._pool.shutdown(wait=False)
+            cls._pool = ProcessPoolExecutor(max_workers=workers)
+            cls._pool_workers = workers
+        return cls._pool
+
+    @classmethod
+    def ring(cls) -> SharedFrameRing:
+        if cls._ring is None:
+            cls._ring = SharedFrameRing()
+        return cls._ring
+
+    @classmethod
+    def submit(cls, frames: np.ndarray, lut: np.ndarray, preset: str, workers: int) -> MappedBatch:
+        """Copy a (N, H, W, 3) batch and the LUT into a free ring slot and start mapping it."""
+        frames = np.ascontiguousarray(frames, dtype=np.uint8)
+        count = len(frames)
+        index_bytes = frames.nbytes // 3
+        ring = cls.ring()
+        slot, segment = ring.acquire(frames.nbytes + index_bytes + lut.nbytes)
+        try:
+            source = SharedArray(segment.name, 0, frames.shape)
+            out = SharedArray(segment.name, frames.nbytes, frames.shape[:3])
+            table = SharedArray(segment.name, frames.nbytes + index_bytes, lut.shape)
+            source.view(segment)[...] = frames
+            table.view(segment)[...] = lut
+
+            bounds = np.linspace(0, count, min(workers, count) + 1).astype(int)
+            pool = cls.pool(workers)
+            futures = [
+                pool.submit(_map_chunk, source, out, table, int(a), int(b), preset)
+                for a, b in zip(bounds[:-1], bounds[1:])
+            ]
+        except BaseException:
+            ring.release(slot)
+            raise
+        return MappedBatch(ring, slot, segment, source, out, futures)
+
+    @classmethod
+    def map(cls, frames: np.ndarray, lut: np.ndarray, preset: str, workers: int) -> np.ndarray:
+        """Map a batch and wait for it; returns the (N, H, W) palette indices."""
+        batch = cls.submit(frames, lut, preset, workers)
+        try:
+            return batch.result()[1].copy()
+        finally:
+            batch.release()
+
+
+class ThreadedGifStream:
+    """
+    Runs a GifStream on a worker thread so quantization and LZW overlap with decoding.
+    add_frame() copies the frame into a small ring of slots and returns; it only blocks
+    when the encoder falls queue_size frames behind.
+    """
+
+    def __init__(self, stream: GifStream, queue_size: int = 4):
+        self.stream = stream
+        self.queue: "queue.Queue[Optional[Tuple[np.ndarray, Optional[int]]]]" = queue.Queue(maxsize=queue_size)
+        # queue_size queued + one being encoded + one being filled
+        self.ring_size = queue_size + 2
+        self.ring: Optional[np.ndarray] = None
+        self.next_slot = 0
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self._run, name="gif-encoder", daemon=True)
+        self.thread.start()
+
+    def add_frame(self, frame: np.ndarray, duration_ms: Optional[int] = None) -> None:
+        if self.error is not None:
+            raise self.error
+        if self.ring is None:
+            self.ring = np.empty((self.ring_size,) + frame.shape, dtype=np.uint8)
+        slot = self.ring[self.next_slot]
+        slot[...] = frame
+        self.next_slot = (self.next_slot + 1) % self.ring_size
+        self.queue.put((slot, duration_ms))
+
+    def close(self) -> int:
+        """Wait for the worker to finish and return the number of frames written."""
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.stream.close()
+
+    def abort(self) -> None:
+        """Stop the worker without finishing the GIF, e.g. when decoding failed."""
+        self.error = self.error or RuntimeError("GIF stream aborted")
+        self.queue.put(None)
+        self.thread.join()
+        self.stream.abort()
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue  # drain so add_frame() never blocks on a dead worker
+            try:
+                self.stream.add_frame(*item)
+            except BaseException as e:
+                self.error = e
+
+
+@dataclass
+class GifBudgetPlan:
+    """Adjustments GifBudget settled on, and the size it expects them to produce."""
+    preset: str
+    frame_step: int
+    width: int
+    frame_count: int
+    estimated_bytes: int = 0
+
+    def changes(self, preset: str, width: int, frame_count: int) -> List[str]:
+        """Human-readable list of what differs from encoding the source frames as-is."""
+        notes = []
+        if self.preset != preset:
+            notes.append(f"preset {preset} → {self.preset}")
+        if self.frame_step != 1:
+            notes.append(f"every {self.frame_step} frames")
+        if self.width != width:
+            notes.append(f"width {width} → {self.width}px")
+        if self.frame_count != -(-frame_count // self.frame_step):
+            notes.append(f"trimmed to {self.frame_count} frames")
+        return notes
+
+
+class GifBudget:
+    """
+    Fits a GIF under a byte budget with a single full encode. Short runs of frames are
+    encoded as samples to estimate the full size (first frame plus per-frame delta cost),
+    and the adjustments are tried in order of how little they cost visually: a smaller
+    palette, half the frame rate, a narrower frame, and finally a shorter clip.
+    """
+
+    SAMPLE_PAIRS = 5
+    HEADROOM = 0.9            # aim below the budget; estimates are not exact
+    FALLBACK_PRESET = "fast"
+    MAX_FRAME_STEP = 2
+    MIN_WIDTH = 320
+    WIDTH_ATTEMPTS = 3
+    MIN_FRAMES = 4
+
+    @classmethod
+    def plan(cls, frames: np.ndarray, fps: float, max_bytes: int, preset: str = "balanced") -> GifBudgetPlan:
+        source = GifBudgetPlan(preset, 1, frames.shape[2], len(frames))
+        target = max_bytes * cls.HEADROOM
+        plan = cls._estimated(frames, fps, source)
+        if plan.estimated_bytes <= target:
+            return plan
+
+        if preset != cls.FALLBACK_PRESET:
+            plan = cls._estimated(frames, fps, replace(plan, preset=cls.FALLBACK_PRESET))
+            if plan.estimated_bytes <= target:
+                return plan
+
+        if len(frames) >= 2 * cls.MIN_FRAMES:
+            step = cls.MAX_FRAME_STEP
+            plan = cls._estimated(frames, fps, replace(plan, frame_step=step, frame_count=-(-len(frames) // step)))
+            if plan.estimated_bytes <= target:
+                return plan
+
+        for _ in range(cls.WIDTH_ATTEMPTS):
+            if plan.width <= cls.MIN_WIDTH:
+                break
+            # Bytes scale roughly with pixel count; LZW makes that optimistic, so re-check
+            width = max(cls.MIN_WIDTH, int(plan.width * math.sqrt(target / plan.estimated_bytes)))
+            plan = cls._estimated(frames, fps, replace(plan, width=width - width % 2))
+            if plan.estimated_bytes <= target:
+                return plan
+
+        # Shorter clip: per-frame cost is roughly constant after the first frame
+        first = cls._estimated(frames, fps, replace(plan, frame_count=1)).estimated_bytes
+        per_frame = (plan.estimated_bytes - first) / max(1, plan.frame_count - 1)
+        count = int((target - first) / per_frame) + 1 if per_frame > 0 else plan.frame_count
+        count = min(plan.frame_count, max(cls.MIN_FRAMES, count))
+        return cls._estimated(frames, fps, replace(plan, frame_count=count))
+
+    @classmethod
+    def apply(cls, frames: np.ndarray, plan: GifBudgetPlan) -> np.ndarray:
+        """Frames with the plan's step, trim (kept centered) and width applied."""
+        frames = frames[::plan.frame_step]
+        start = (len(frames) - plan.frame_count) // 2
+        frames = frames[start:start + plan.frame_count]
+        return cls._resize(frames, plan.width)
+
+    @classmethod
+    def _estimated(cls, frames: np.ndarray, fps: float, plan: GifBudgetPlan) -> GifBudgetPlan:
+        thinned = frames[::plan.frame_step]
+        start = (len(thinned) - plan.frame_count) // 2
+        thinned = thinned[start:start + plan.frame_count]
+        # Consecutive pairs spread over the clip: activity is rarely uniform
+        pairs = min(cls.SAMPLE_PAIRS, len(thinned) - 1)
+        if pairs < 1:
+            return replace(plan, estimated_bytes=cls._encoded_size(cls._resize(thinned, plan.width), fps, plan))
+        positions = np.linspace(0, len(thinned) - 2, pairs).astype(int)
+        sample = cls._resize(np.stack([thinned[i + k] for i in positions for k in (0, 1)]), plan.width)
+
+        encoder = GifEncoder(plan.preset)
+        palette = encoder.build_palette(sample)
+        firsts = [cls._encoded_size(sample[i:i + 1], fps, plan, encoder, palette) for i in range(0, len(sample), 2)]
+        deltas = [cls._encoded_size(sample[i:i + 2], fps, plan, encoder, palette) - firsts[i // 2]
+                  for i in range(0, len(sample), 2)]
+        first = firsts[0]
+        return replace(plan, estimated_bytes=int(first + np.mean(deltas) * (plan.frame_count - 1)))
+
+    @staticmethod
+    def _encoded_size(frames: np.ndarray, fps: float, plan: GifBudgetPlan, encoder=None, palette=None) -> int:
+        encoder = encoder or GifEncoder(plan.preset)
+        buffer = io.BytesIO()
+        stream = GifStream(encoder, buffer, fps / plan.frame_step, palette=palette or encoder.build_palette(frames))
+        for frame in frames:
+            stream.add_frame(frame)
+        stream.close()
+        return len(buffer.getvalue())
+
+    @staticmethod
+    def _resize(frames: np.ndarray, width: int) -> np.ndarray:
+        if frames.shape[2] == width:
+            return frames
+        height = int(round(frames.shape[1] * width / frames.shape[2]))
+        height -= height % 2
+        out = np.empty((len(frames), height, width, 3), dtype=np.uint8)
+        for i, frame in enumerate(frames):
+            cv2.resize(frame, (width, height), dst=out[i], interpolation=cv2.INTER_AREA)
+        return out
@@ -0,0 +1,205 @@
+# phash_helper.py
+"""
+Perceptual hashes of alert stills, used by bi_alerts_handler.py to spot an alert that
+looks the same as one recently sent for the same camera (wind, shadows, repeated AI hits
+on a parked car) before paying for the GIF encode, uploads and webhook.
+
+A hash is a 64-bit integer; two stills are near-identical when few bits differ (Hamming
+distance). Each alert runs in its own process, so recent hashes live in a small JSON file,
+read and rewritten under an OS file lock because alerts of a burst run concurrently.
+A camera only holds the alerts of one window, so the index is a linear Hamming scan: a
+BK-tree would not pay for itself below a few thousand entries.
+"""
+
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import cv2
+
+try:
+    import msvcrt   # Windows, where Blue Iris runs
+except ImportError:
+    msvcrt = None
+    import fcntl
+
+
+class PerceptualHash:
+    """64-bit dHash / pHash of a BGR frame."""
+
+    METHODS = ("dhash", "phash")
+
+    @staticmethod
+    def dhash(frame: np.ndarray) -> int:
+        """Difference hash: is each pixel of a 9x8 thumbnail brighter than its right neighbour."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+        return PerceptualHash._pack(small[:, 1:] > small[:, :-1])
+
+    @staticmethod
+    def phash(frame: np.ndarray) -> int:
+        """DCT hash: low 8x8 frequencies of a 32x32 thumbnail against their median."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+        low = cv2.dct(small)[:8, :8]
+        # The DC term is overall brightness, which would dominate the median
+        return PerceptualHash._pack(low > np.median(low.flatten()[1:]))
+
+    @staticmethod
+    def compute(frame: np.ndarray, method: str = "dhash") -> int:
+        if method not in PerceptualHash.METHODS:
+            raise ValueError(f"Unknown perceptual hash '{method}'")
+        return getattr(PerceptualHash, method)(frame)
+
+    @staticmethod
+    def distance(a: int, b: int) -> int:
+        """Hamming distance: the number of differing bits."""
+        return bin(a ^ b).count("1")
+
+    @staticmethod
+    def _pack(bits: np.ndarray) -> int:
+        value = 0
+        for bit in bits.flatten():
+            value = (value << 1) | int(bit)
+        return value
+
+
+@dataclass
+class HashMatch:
+    distance: int
+    label: str             # the earlier alert's timestamp argument
+    seconds_ago: float
+    pending: bool = False  # the earlier alert is still being processed (claimed, not yet confirmed)
+
+
+class RecentHashIndex:
+    """
+    Per-camera hashes of recently sent alerts, persisted between handler runs.
+    claim() looks a hash up and, when nothing matches, records it as pending in the same
+    locked step, so two alerts of a burst cannot both miss each other; the run confirm()s
+    the entry once its alert is sent, or release()s it if it fails. A pending entry left by
+    a run that died stops counting after pending_seconds.
+    """
+
+    def __init__(self, path: Path, window_seconds: float, pending_seconds: float = 300):
+        self.path = path
+        self.window_seconds = window_seconds
+        self.pending_seconds = pending_seconds
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold an exclusive lock on the index's .lock file while reading or rewriting it."""
+        with open(self.path.with_suffix(".lock"), "a+b") as lock:
+            if msvcrt:
+                lock.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue  # LK_LOCK gives up after ~10s of retries; keep waiting
+                try:
+                    yield
+                finally:
+                    lock.seek(0)
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _load(self) -> Dict[str, List[Dict[str, Any]]]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}  # a corrupt index only costs one round of duplicates
+
+    def _save(self, data: Dict[str, List[Dict[str, Any]]]) -> None:
+        # A temp file of our own, swapped in whole, so a crash never leaves half an index
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp, self.path)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def _recent(self, entries: List[Dict[str, Any]], now: float) -> List[Dict[str, Any]]:
+        pending_window = min(self.pending_seconds, self.window_seconds)
+        return [
+            e for e in entries
+            if now - e["time"] <= (pending_window if e.get("pending") else self.window_seconds)
+        ]
+
+    def _closest(self, entries: List[Dict[str, Any]], value: int, max_distance: int, now: float) -> Optional[HashMatch]:
+        best: Optional[Tuple[int, Dict[str, Any]]] = None
+        for entry in self._recent(entries, now):
+            distance = PerceptualHash.distance(value, int(entry["hash"], 16))
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, entry)
+        if best is None:
+            return None
+        distance, entry = best
+        return HashMatch(distance, entry.get("label", ""), now - entry["time"], bool(entry.get("pending")))
+
+    def _update(self, camera: str, change: Callable[[List[Dict[str, Any]], float], Any]) -> Any:
+        """Apply change to the camera's recent entries and write them back, all under the lock."""
+        now = time.time()
+        with self._locked():
+            data = self._load()
+            entries = self._recent(data.get(camera, []), now)
+            result = change(entries, now)
+            data[camera] = entries
+            self._save(data)
+        return result
+
+    def find(self, camera: str, value: int, max_distance: int) -> Optional[HashMatch]:
+        """Closest hash sent for the camera within the window, if within max_distance."""
+        now = time.time()
+        with self._locked():
+            data = self._load()
+        return self._closest(data.get(camera, []), value, max_distance, now)
+
+    def add(self, camera: str, value: int, label: str = "") -> None:
+        """Record a sent alert's hash, dropping the camera's entries that left the window."""
+        self._update(camera, lambda entries, now: entries.append(
+            {"hash": f"{value:016x}", "time": now, "label": label}
+        ))
+
+    def claim(self, camera: str, value: int, max_distance: int, label: str = "") -> Optional[HashMatch]:
+        """find(), and record the hash as pending under the same lock when nothing matches."""
+        def change(entries: List[Dict[str, Any]], now: float) -> Optional[HashMatch]:
+            match = self._closest(entries, value, max_distance, now)
+            if match is None:
+                entries.append({"hash": f"{value:016x}", "time": now, "label": label, "pending": True})
+            return match
+        return self._update(camera, change)
+
+    def confirm(self, camera: str, value: int, label: str = "") -> None:
+        """Mark a claimed hash as sent, so it counts for the whole window."""
+        def change(entries: List[Dict[str, Any]], now: float) -> None:
+            for entry in self._claimed(entries, value, label):
+                entry.pop("pending")
+        self._update(camera, change)
+
+    def release(self, camera: str, value: int, label: str = "") -> None:
+        """Drop a claimed hash whose alert was not sent."""
+        def change(entries: List[Dict[str, Any]], now: float) -> None:
+            for entry in self._claimed(entries, value, label):
+                entries.remove(entry)
+        self._update(camera, change)
+
+    @staticmethod
+    def _claimed(entries: List[Dict[str, Any]], value: int, label: str) -> List[Dict[str, Any]]:
+        return [e for e in entries if e.get("pending") and e["hash"] == f"{value:016x}" and e.get("label", "") == label]
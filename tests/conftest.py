@@ -0,0 +1,23 @@
+# conftest.py
+"""Makes the handler's top-level modules importable from the tests, and shared fixtures."""
+
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def synthetic_export(tmp_path):
+    """A 3 s, 10 fps clip of a square crossing a gray background."""
+    path = tmp_path / "export.mp4"
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 10, (160, 96))
+    for i in range(30):
+        frame = np.full((96, 160, 3), 90, dtype=np.uint8)
+        frame[30:60, 4 + i * 4:34 + i * 4] = (20, 200, 240)
+        writer.write(frame)
+    writer.release()
+    return str(path)
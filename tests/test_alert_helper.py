@@ -0,0 +1,72 @@
+# test_alert_helper.py
+"""MediaOptions built from an AlertConfiguration, extract_alert_media driven by it, and the clip archive key."""
+
+import pickle
+from datetime import datetime
+from PIL import Image
+from alert_helper import AlertConfiguration, MediaOptions, VideoProcessor
+
+
+def test_from_config_maps_the_settings():
+    config = AlertConfiguration()
+    config.CAMERA_PREVIEW_FORMATS = {"porch": "webp"}
+    config.CAMERA_CROP_REGIONS = {"porch": (0.1, 0.2, 0.5, 0.6)}
+    config.KEEP_LOCAL_MEDIA = False
+    config.GIF_MAX_BYTES = 0
+    config.SMALL_PREVIEW_WIDTH = 0
+
+    options = MediaOptions.from_config(config, "porch")
+    assert options.preview_format == "webp"
+    assert options.crop == (0.1, 0.2, 0.5, 0.6)
+    assert options.in_memory is True
+    assert options.max_preview_bytes is None
+    assert options.small_preview_width is None
+    assert options.trigger_seconds == 0.0
+    assert options.fps == config.GIF_FPS
+
+    other = MediaOptions.from_config(config, "driveway")
+    assert other.preview_format == config.PREVIEW_FORMAT
+    assert other.crop is None
+
+
+def test_options_pickle_for_the_encoding_service():
+    options = MediaOptions.from_config(AlertConfiguration(), "driveway")
+    assert pickle.loads(pickle.dumps(options)) == options
+
+
+def test_extract_alert_media_follows_the_options(synthetic_export, tmp_path):
+    options = MediaOptions(duration_seconds=2, fps=5, thumbnail_width=80)
+    outputs = VideoProcessor.extract_alert_media(
+        synthetic_export, str(tmp_path / "preview.gif"), str(tmp_path), "driveway",
+        options=options, log_func=lambda *args: None,
+    )
+    with Image.open(tmp_path / "preview.gif") as gif:
+        assert gif.n_frames == 10
+        assert gif.size == (160, 96)
+    assert outputs["thumbnail"] is not None
+
+
+def test_budgeted_gif_is_encoded_once_to_fit(synthetic_export, tmp_path):
+    options = MediaOptions(duration_seconds=2, fps=5, stream_gif=True, in_memory=True, max_preview_bytes=4000)
+    assert not VideoProcessor.streams_preview(options)
+    assert VideoProcessor.streams_preview(MediaOptions(stream_gif=True))
+    logs = []
+    outputs = VideoProcessor.extract_alert_media(
+        synthetic_export, str(tmp_path / "preview.gif"), str(tmp_path), "driveway",
+        options=options, log_func=logs.append,
+    )
+    assert not outputs["preview_uploaded"]
+    assert 0 < len(outputs["preview"].data) <= 4000
+    assert any("adjusted to fit" in line for line in logs)
+
+
+def test_clip_key_is_predictable_from_the_alert():
+    config = AlertConfiguration()
+    key = config.get_clip_key("Driveway", "10/18/2026 11:59:58 PM", "@72123843570675")
+    assert key == ("clips/Driveway/20261018", "Driveway_235958_72123843570675.mp4")
+    assert config.get_clip_key("Driveway", "10/18/2026 11:59:58 PM", "@72123843570675") == key
+    # Time-only timestamps (Blue Iris' default) fall on today's date
+    prefix, name = config.get_clip_key("Driveway", "10:36:32 AM", "@1")
+    assert prefix == f"clips/Driveway/{datetime.now():%Y%m%d}"
+    assert name == "Driveway_103632_1.mp4"
+    assert config.get_clip_key("Driveway", "soon", None)[1] == "Driveway_soon_none.mp4"
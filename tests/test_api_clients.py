@@ -0,0 +1,111 @@
+"""MinioStorage uploads and UploadStream against an in-memory stand-in for the MinIO client."""
+import pytest
+
+from api_clients import MinioConfig, MinioStorage
+
+
+class FakeMinio:
+    """Records objects; put_object(length=-1) reads part_size chunks like minio-py does."""
+
+    def __init__(self):
+        self.objects = {}
+        self.parts = {}
+        self.bucket_checks = 0
+
+    def bucket_exists(self, bucket):
+        self.bucket_checks += 1
+        return False
+
+    def make_bucket(self, bucket):
+        pass
+
+    def put_object(self, bucket, object_name, data, length, part_size=None, content_type=None):
+        if length >= 0:
+            self.objects[object_name] = data.read(length)
+            self.parts[object_name] = 1
+            return
+        parts = []
+        while True:
+            part = b""
+            while len(part) < part_size:
+                chunk = data.read(part_size - len(part))
+                if not chunk:
+                    break
+                part += chunk
+            if not part:
+                break
+            parts.append(part)
+        self.objects[object_name] = b"".join(parts)
+        self.parts[object_name] = len(parts)
+
+    def fput_object(self, bucket, object_name, file_path, content_type=None):
+        with open(file_path, "rb") as f:
+            self.objects[object_name] = f.read()
+        self.parts[object_name] = 1
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    monkeypatch.setattr(MinioStorage, "STREAM_PART_SIZE", 1024)
+    storage = MinioStorage(MinioConfig("minio.example", "key", "secret", "bucket"))
+    storage.client = FakeMinio()
+    return storage
+
+
+def test_small_upload_is_sent_in_one_put_on_close(storage):
+    stream = storage.open_upload("alert.gif", "alerts", "image/gif")
+    stream.write(b"GIF89a")
+    stream.write(b"x" * 100)
+    assert "alerts/alert.gif" not in storage.client.objects
+    stream.close()
+    assert stream.result(5) == "https://minio.example/bucket/alerts/alert.gif"
+    assert storage.client.objects["alerts/alert.gif"] == b"GIF89a" + b"x" * 100
+    assert storage.client.parts["alerts/alert.gif"] == 1
+
+
+def test_large_upload_streams_multipart_parts(storage):
+    stream = storage.open_upload("alert.gif")
+    payload = bytes(range(256)) * 20   # 5 parts of 1024 bytes
+    for start in range(0, len(payload), 300):
+        stream.write(payload[start:start + 300])
+    stream.close()
+    assert stream.result(5).endswith("/alerts/alert.gif")
+    assert storage.client.objects["alerts/alert.gif"] == payload
+    assert storage.client.parts["alerts/alert.gif"] == 5
+    assert stream.bytes_written == len(payload)
+
+
+def test_abort_fails_the_upload_and_stores_nothing(storage):
+    small = storage.open_upload("small.gif")
+    small.write(b"x" * 10)
+    small.abort()
+    with pytest.raises(IOError, match="aborted"):
+        small.result(5)
+
+    large = storage.open_upload("large.gif")
+    large.write(b"x" * 4096)
+    large.abort()
+    with pytest.raises(IOError, match="aborted"):
+        large.result(5)
+    assert storage.client.objects == {}
+    with pytest.raises(ValueError):
+        large.write(b"more")
+
+
+def test_upload_file_keeps_the_length_and_takes_an_object_name(storage, tmp_path):
+    clip = tmp_path / "export.mp4"
+    clip.write_bytes(b"\x00" * 5000)
+    url = storage.upload_file(str(clip), "clips/Driveway/20261019", "video/mp4", name="alert-1.mp4")
+    assert url == "https://minio.example/bucket/clips/Driveway/20261019/alert-1.mp4"
+    assert storage.client.parts["clips/Driveway/20261019/alert-1.mp4"] == 1
+    assert storage.upload_file(str(clip)).endswith("/alerts/export.mp4")
+
+
+def test_bucket_is_checked_once_per_client(storage):
+    storage.upload_bytes(b"a", "a.jpg")
+    storage.upload_bytes(b"b", "b.jpg")
+    stream = storage.open_upload("c.gif")
+    stream.write(b"c")
+    stream.close()
+    stream.result(5)
+    assert storage.client.bucket_checks == 1
@@ -0,0 +1,114 @@
+"""BlueIrisAlertHandler steps around the encode, with fake MinIO, webhook and database clients."""
+from concurrent.futures import Future
+
+import pytest
+
+from alert_helper import AlertConfiguration, Logger, MediaBuffer
+from bi_alerts_handler import BlueIrisAlertHandler
+from phash_helper import RecentHashIndex
+
+
+class FakeStorage:
+    def ensure_bucket(self):
+        pass
+
+    def upload_bytes(self, data, name, object_prefix="alerts", content_type=None):
+        return f"https://minio.example/bucket/{object_prefix}/{name}"
+
+
+class FakeNotifier:
+    def __init__(self):
+        self.alerts = []
+
+    def send_alert(self, **alert):
+        self.alerts.append(alert)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.rows = {}
+
+    def log_alert(self, **row):
+        log_id = f"row-{len(self.rows) + 1}"
+        self.rows[log_id] = dict(row)
+        return log_id
+
+    def update_clip_url(self, log_id, clip_url):
+        self.rows[log_id]["clip_url"] = clip_url
+
+
+@pytest.fixture
+def handler(tmp_path):
+    """A handler with its clients replaced, skipping __init__'s secrets and Windows paths."""
+    handler = BlueIrisAlertHandler.__new__(BlueIrisAlertHandler)
+    handler.config = AlertConfiguration()
+    handler.logger = Logger(str(tmp_path / "log.txt"))
+    handler.debug_mode = False
+    handler.storage_client = FakeStorage()
+    handler.notifier_client = FakeNotifier()
+    handler.db_logger = FakeDatabase()
+    handler.camera_arg, handler.timestamp_arg, handler.alert_name_arg = "Driveway", "10:36:32 AM", "@7212"
+    handler.preview_content_type = "image/gif"
+    handler.small_preview = handler.poster = handler.contact_sheet = None
+    handler.preview_upload = None
+    handler.clip_archive = None
+    handler.alert_log_id = None
+    handler.hash_index = RecentHashIndex(tmp_path / "phash_index.json", handler.config.DUPLICATE_WINDOW_SECONDS)
+    handler.still_hash = None
+    handler.hash_claimed = False
+    handler.duplicate_of = None
+    return handler
+
+
+def test_alert_is_logged_before_the_clip_archive_finishes(handler):
+    handler.clip_archive = Future()
+    preview = MediaBuffer("Driveway.gif", b"GIF89a", "image/gif")
+    still = MediaBuffer("Driveway.jpg", b"\xff\xd8", "image/jpeg")
+
+    handler._upload_and_notify(preview, still)
+    row = handler.db_logger.rows[handler.alert_log_id]
+    assert handler.notifier_client.alerts[0]["gif_url"].endswith("/alerts/Driveway.gif")
+    assert row["success"] and row.get("clip_url") is None
+
+    handler.clip_archive.set_result("https://minio.example/bucket/clips/Driveway/clip.mp4")
+    handler._record_clip_archive()
+    assert row["clip_url"] == "https://minio.example/bucket/clips/Driveway/clip.mp4"
+
+
+def test_failed_clip_archive_leaves_the_row_without_a_url(handler):
+    handler.clip_archive = Future()
+    handler.clip_archive.set_exception(IOError("connection reset"))
+    handler._upload_and_notify(MediaBuffer("Driveway.gif", b"GIF89a", "image/gif"), None)
+    handler._record_clip_archive()
+    assert handler.db_logger.rows[handler.alert_log_id].get("clip_url") is None
+
+
+def rerun(handler, timestamp):
+    """The same handler state a new process would start the next alert with."""
+    handler.timestamp_arg = timestamp
+    handler.still_hash, handler.hash_claimed, handler.duplicate_of = None, False, None
+    return handler
+
+
+def test_duplicate_check_claims_the_hash_until_the_alert_is_sent(handler, synthetic_export):
+    handler.config.DUPLICATE_SUPPRESSION = "suppress"
+    assert not handler._is_duplicate(synthetic_export)
+    assert handler.hash_claimed
+    first_hash = handler.still_hash
+
+    # A concurrent alert of the same scene sees the claim before the first one is sent
+    assert rerun(handler, "10:36:40 AM")._is_duplicate(synthetic_export)
+    assert handler.duplicate_of.pending and handler.duplicate_of.label == "10:36:32 AM"
+
+    handler.still_hash, handler.hash_claimed, handler.timestamp_arg = first_hash, True, "10:36:32 AM"
+    handler._remember_still_hash()
+    match = handler.hash_index.find("Driveway", first_hash, 0)
+    assert match is not None and not match.pending
+
+
+def test_failed_alert_releases_its_claim(handler, synthetic_export):
+    handler.config.DUPLICATE_SUPPRESSION = "suppress"
+    assert not handler._is_duplicate(synthetic_export)
+    handler._release_still_hash()
+    assert not handler.hash_claimed
+    assert not rerun(handler, "10:37:00 AM")._is_duplicate(synthetic_export)
@@ -0,0 +1,86 @@
+# test_detector_helper.py
+"""DetectionBatcher with a stand-in detector that records the batches it receives."""
+
+import threading
+import time
+import numpy as np
+import pytest
+from detector_helper import Detection, DetectionBatcher
+
+
+class RecordingDetector:
+    """Answers each image with one detection labelled by the image's fill value."""
+
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def detect_batch(self, images):
+        with self.lock:
+            self.batches.append(len(images))
+        time.sleep(self.delay)
+        return [[Detection(f"image-{int(image[0, 0, 0])}", 0.9, (0.0, 0.0, 1.0, 1.0))] for image in images]
+
+
+class FailingDetector:
+    def detect_batch(self, images):
+        raise RuntimeError("forward pass failed")
+
+
+def image(value):
+    return np.full((8, 8, 3), value, dtype=np.uint8)
+
+
+def test_requests_arriving_together_share_a_forward_pass():
+    detector = RecordingDetector()
+    batcher = DetectionBatcher(detector, max_batch=8, max_wait_ms=200)
+    futures = [batcher.submit(image(i)) for i in range(5)]
+    results = [future.result(timeout=5) for future in futures]
+    assert detector.batches == [5]
+    assert [r[0].label for r in results] == [f"image-{i}" for i in range(5)]
+
+
+def test_batches_are_capped_at_max_batch():
+    detector = RecordingDetector()
+    batcher = DetectionBatcher(detector, max_batch=4, max_wait_ms=200)
+    futures = [batcher.submit(image(i)) for i in range(10)]
+    results = [future.result(timeout=5) for future in futures]
+    assert max(detector.batches) <= 4
+    assert sum(detector.batches) == 10
+    assert [r[0].label for r in results] == [f"image-{i}" for i in range(10)]
+
+
+def test_concurrent_submitters_get_their_own_results():
+    detector = RecordingDetector(delay=0.01)
+    batcher = DetectionBatcher(detector, max_batch=8, max_wait_ms=50)
+    results = {}
+
+    def submit(value):
+        results[value] = batcher.submit(image(value)).result(timeout=5)
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(detector.batches) == 16
+    assert len(detector.batches) < 16
+    assert all(results[i][0].label == f"image-{i}" for i in range(16))
+
+
+def test_a_lone_request_waits_at_most_max_wait():
+    detector = RecordingDetector()
+    batcher = DetectionBatcher(detector, max_batch=8, max_wait_ms=50)
+    started = time.monotonic()
+    batcher.submit(image(1)).result(timeout=5)
+    assert time.monotonic() - started < 1.0
+    assert detector.batches == [1]
+
+
+def test_a_failed_batch_fails_every_request_in_it():
+    batcher = DetectionBatcher(FailingDetector(), max_batch=8, max_wait_ms=100)
+    futures = [batcher.submit(image(i)) for i in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
@@ -0,0 +1,91 @@
+# test_encoding_service.py
+"""Jobs sent through a local EncodingService: round trips, failures and withdrawing."""
+
+import socket
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+import pytest
+import alert_helper
+from alert_helper import MediaOptions
+from encoding_service import EncodingClient, EncodingService, EncodingServiceConfig
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def service():
+    config = EncodingServiceConfig(port=free_port(), authkey=b"test-key", workers=1)
+    service = EncodingService(config, log=lambda line: None)
+    threading.Thread(target=service.serve_forever, daemon=True).start()
+    client = EncodingClient(config, log_func=lambda line: None)
+    for _ in range(50):
+        if client.available():
+            break
+        threading.Event().wait(0.1)
+    yield service, config
+    service.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def test_round_trip_returns_the_job_result_and_logs(service, synthetic_export, tmp_path):
+    _, config = service
+    logs = []
+    client = EncodingClient(config, log_func=logs.append)
+    assert client.available()
+    options = MediaOptions(duration_seconds=2, fps=5, in_memory=True)
+    outputs = client.submit(
+        "extract_alert_media", mp4_path=synthetic_export, preview_path=str(tmp_path / "preview.gif"),
+        jpeg_save_dir=str(tmp_path), camera_name="driveway", options=options,
+    ).result(timeout=60)
+    assert outputs["preview"].data[:6] == b"GIF89a"
+    assert outputs["still_jpeg"].data[:2] == b"\xff\xd8"
+    assert any("GIF" in line for line in logs)
+
+
+def test_failed_job_raises_with_its_logs(service, tmp_path):
+    _, config = service
+    logs = []
+    client = EncodingClient(config, log_func=logs.append)
+    future = client.submit("extract_midframe_jpeg", mp4_path=str(tmp_path / "missing.mp4"),
+                           jpeg_save_dir=str(tmp_path), camera_name="driveway")
+    assert future.result(timeout=60) is None   # the method logs and returns None
+    assert any("missing.mp4" in line for line in logs)
+    with pytest.raises(ValueError):
+        client.submit("remove_everything")
+
+
+def test_unauthenticated_client_is_not_available(service):
+    _, config = service
+    wrong = EncodingServiceConfig(host=config.host, port=config.port, authkey=b"wrong")
+    assert not EncodingClient(wrong).available()
+    assert not EncodingClient(EncodingServiceConfig(port=config.port)).available()
+
+
+def test_withdraw_drops_queued_jobs_and_waits_for_running_ones(service, monkeypatch, tmp_path):
+    svc, config = service
+    # A one-thread pool in this process, so the test controls when the running job ends
+    svc.pool.shutdown(wait=True)
+    svc.pool = ThreadPoolExecutor(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def blocking_job(mp4_path, jpeg_save_dir, camera_name, log_func=print):
+        started.set()
+        release.wait(10)
+        return mp4_path
+
+    monkeypatch.setattr(alert_helper.VideoProcessor, "extract_midframe_jpeg", staticmethod(blocking_job))
+    client = EncodingClient(config, log_func=lambda line: None)
+    job = dict(jpeg_save_dir=str(tmp_path), camera_name="driveway")
+    running = client.submit("extract_midframe_jpeg", mp4_path="running.mp4", **job)
+    assert started.wait(10)
+    queued = client.submit("extract_midframe_jpeg", mp4_path="queued.mp4", **job)
+
+    assert queued.withdraw() is True
+    with pytest.raises(CancelledError):
+        queued.result(timeout=10)
+    assert running.withdraw() is False
+    release.set()
+    assert running.result(timeout=10) == "running.mp4"
@@ -0,0 +1,223 @@
+# test_gif_helper.py
+"""GifEncoder output, parsed back with Pillow, GifBudget planning, and parallel mapping against serial."""
+
+import io
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+from gif_helper import GifBudget, GifEncoder, ParallelFrameMapper, SharedFrameRing
+
+
+def moving_square_frames(count=6, size=(48, 64)):
+    h, w = size
+    frames = np.zeros((count, h, w, 3), dtype=np.uint8)
+    frames[:] = (30, 90, 160)
+    for i in range(count):
+        frames[i, 10:26, 4 + i * 8:20 + i * 8] = (250, 220, 20)
+    return frames
+
+
+@pytest.mark.parametrize("preset", list(GifEncoder.PRESETS))
+def test_encode_round_trips_through_pillow(preset):
+    frames = moving_square_frames()
+    fp = io.BytesIO()
+    written = GifEncoder(preset).encode(frames, fp, fps=5)
+
+    fp.seek(0)
+    with Image.open(fp) as gif:
+        assert gif.format == "GIF"
+        assert gif.size == (64, 48)
+        assert gif.n_frames == written == len(frames)
+        durations = [frame.info["duration"] for frame in ImageSequence.Iterator(gif)]
+    assert durations == [200] * len(frames)
+
+
+def test_encode_keeps_colors_and_motion():
+    frames = moving_square_frames()
+    fp = io.BytesIO()
+    GifEncoder("quality").encode(frames, fp, fps=5)
+
+    fp.seek(0)
+    with Image.open(fp) as gif:
+        decoded = [np.asarray(frame.convert("RGB"), dtype=np.int16) for frame in ImageSequence.Iterator(gif)]
+    for source, frame in zip(frames, decoded):
+        assert np.abs(frame - source.astype(np.int16)).mean() < 8
+    # The square moved, so composited frames differ where it was drawn
+    assert np.abs(decoded[0] - decoded[-1]).max() > 100
+
+
+def test_encode_honours_per_frame_durations():
+    frames = moving_square_frames(count=3)
+    fp = io.BytesIO()
+    GifEncoder("fast").encode(frames, fp, fps=5, durations=[100, 400, 700])
+
+    fp.seek(0)
+    with Image.open(fp) as gif:
+        durations = [frame.info["duration"] for frame in ImageSequence.Iterator(gif)]
+    assert durations == [100, 400, 700]
+
+
+def test_stream_folds_static_frames_into_longer_ones():
+    # The square leaves the 64px frame after the 8th frame, so the last 4 frames are identical
+    frames = moving_square_frames(count=12)
+    fp = io.BytesIO()
+    stream = GifEncoder("balanced").open_stream(fp, fps=10)
+    for frame in frames:
+        stream.add_frame(frame)
+    written = stream.close()
+
+    fp.seek(0)
+    with Image.open(fp) as gif:
+        durations = [frame.info["duration"] for frame in ImageSequence.Iterator(gif)]
+    assert len(durations) == written == 9
+    assert durations[-1] == 400
+    assert sum(durations) == 100 * len(frames)
+
+
+def test_unknown_preset_is_rejected():
+    with pytest.raises(ValueError):
+        GifEncoder("ultra")
+
+
+def noisy_motion_frames(count=30, size=(240, 480)):
+    """A moving block of noise: expensive for LZW, so budgets bite."""
+    rng = np.random.default_rng(4)
+    frames = np.repeat(rng.integers(0, 256, size + (3,), dtype=np.uint8)[None], count, axis=0)
+    for i in range(count):
+        frames[i, 60:180, i * 12:i * 12 + 120] = rng.integers(0, 256, (120, 120, 3))
+    return frames
+
+
+def encoded_size(frames, preset, fps):
+    fp = io.BytesIO()
+    GifEncoder(preset).encode(frames, fp, fps=fps)
+    return len(fp.getvalue())
+
+
+def test_budget_leaves_a_gif_that_fits_alone():
+    frames = noisy_motion_frames()
+    full = encoded_size(frames, "balanced", 5)
+    plan = GifBudget.plan(frames, 5, 2 * full, "balanced")
+    assert (plan.preset, plan.frame_step, plan.width, plan.frame_count) == ("balanced", 1, 480, 30)
+    assert plan.changes("balanced", 480, 30) == []
+    # The estimate from sample encodes is close to the real size
+    assert abs(plan.estimated_bytes - full) < 0.1 * full
+
+
+@pytest.mark.parametrize("fraction", [0.5, 0.2])
+def test_budget_plan_fits_in_one_encode(fraction):
+    frames = noisy_motion_frames()
+    budget = int(encoded_size(frames, "balanced", 5) * fraction)
+    plan = GifBudget.plan(frames, 5, budget, "balanced")
+    assert plan.changes("balanced", 480, 30)
+    adjusted = GifBudget.apply(frames, plan)
+    assert len(adjusted) == plan.frame_count
+    assert adjusted.shape[2] == plan.width
+    assert encoded_size(adjusted, plan.preset, 5 / plan.frame_step) <= budget
+
+
+def test_budget_tries_cheap_adjustments_first():
+    frames = noisy_motion_frames()
+    full = encoded_size(frames, "balanced", 5)
+    plan = GifBudget.plan(frames, 5, int(full * 0.5), "balanced")
+    # Palette and frame rate go before resolution, and the clip is only shortened last
+    assert plan.preset == GifBudget.FALLBACK_PRESET
+    assert plan.frame_count == -(-30 // plan.frame_step)
+
+
+def test_impossible_budget_stops_at_the_floors():
+    frames = noisy_motion_frames()
+    plan = GifBudget.plan(frames, 5, 1000, "balanced")
+    assert plan.width == GifBudget.MIN_WIDTH
+    assert plan.frame_count == GifBudget.MIN_FRAMES
+    assert plan.estimated_bytes > 1000
+
+
+def busy_frames(count=24, size=(72, 96)):
+    rng = np.random.default_rng(3)
+    frames = np.repeat(rng.integers(0, 256, size + (3,), dtype=np.uint8)[None], count, axis=0)
+    for i in range(count):
+        frames[i, 20:40, i * 3:i * 3 + 20] = (255, 200, 0)
+    return frames
+
+
+def test_parallel_mapping_matches_serial():
+    frames = busy_frames(count=7)
+    encoder = GifEncoder("quality")
+    _, lut = encoder.build_palette(frames)
+    serial = GifEncoder("quality").map_frames(frames, lut)
+    parallel = ParallelFrameMapper.map(frames, lut, "quality", workers=3)
+    assert parallel.shape == frames.shape[:3]
+    assert np.array_equal(parallel, serial)
+
+
+@pytest.mark.parametrize("preset", list(GifEncoder.PRESETS))
+def test_parallel_encode_is_byte_identical(preset):
+    frames = busy_frames()
+    outputs = []
+    for workers in (1, 2, 3):
+        fp = io.BytesIO()
+        GifEncoder(preset, workers).encode(frames, fp, fps=10)
+        outputs.append(fp.getvalue())
+    assert outputs[0] == outputs[1] == outputs[2]
+
+
+def test_parallel_stream_is_byte_identical():
+    outputs = []
+    for workers in (1, 2):
+        fp = io.BytesIO()
+        stream = GifEncoder("balanced", workers).open_stream(fp, fps=10, threaded=True)
+        for frame in busy_frames(count=30):
+            stream.add_frame(frame)
+        stream.close()
+        outputs.append(fp.getvalue())
+    assert outputs[0] == outputs[1]
+
+
+def test_ring_reuses_slots_and_grows_them():
+    ring = SharedFrameRing(slots=2)
+    try:
+        first, small = ring.acquire(1000)
+        second, _ = ring.acquire(1000)
+        assert first != second
+        ring.release(first)
+        again, grown = ring.acquire(5000)
+        assert again == first
+        assert grown.size >= 5000 and grown.name != small.name
+        ring.release(again)
+        ring.release(second)
+    finally:
+        ring.close()
+
+
+def test_stream_keeps_both_ring_slots_busy():
+    # While one batch maps, the stream writes the previous one: two slots are out at once
+    encoder = GifEncoder("balanced", workers=2)
+    ring = ParallelFrameMapper.ring()
+    in_use = []
+    acquire = ring.acquire
+
+    def recording_acquire(nbytes):
+        slot = acquire(nbytes)
+        in_use.append(2 - ring._free.qsize())
+        return slot
+
+    ring.acquire = recording_acquire
+    try:
+        stream = encoder.open_stream(io.BytesIO(), fps=10)
+        for frame in busy_frames():
+            stream.add_frame(frame)
+        stream.close()
+    finally:
+        del ring.acquire
+    assert max(in_use) == 2
+    assert ring._free.qsize() == 2   # every slot returned
+
+
+def test_aborted_stream_returns_its_slot():
+    encoder = GifEncoder("fast", workers=2)
+    stream = encoder.open_stream(io.BytesIO(), fps=10)
+    for frame in busy_frames(count=stream.batch_frames):
+        stream.add_frame(frame)
+    stream.abort()
+    assert ParallelFrameMapper.ring()._free.qsize() == 2
@@ -0,0 +1,140 @@
+# test_phash_helper.py
+"""PerceptualHash on synthetic stills and RecentHashIndex (find, add, claim) against a temporary index file."""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from phash_helper import PerceptualHash, RecentHashIndex
+
+
+def scene(seed, size=(120, 160)):
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    # Large smooth blocks, like a real scene at hash resolution
+    return np.kron(small, np.ones((size[0] // 6, size[1] // 8, 1), dtype=np.uint8))
+
+
+@pytest.mark.parametrize("method", PerceptualHash.METHODS)
+def test_hash_is_64_bit_and_stable(method):
+    value = PerceptualHash.compute(scene(0), method)
+    assert 0 <= value < 2 ** 64
+    assert PerceptualHash.compute(scene(0).copy(), method) == value
+
+
+@pytest.mark.parametrize("method", PerceptualHash.METHODS)
+def test_near_identical_stills_are_close(method):
+    original = scene(0)
+    rng = np.random.default_rng(5)
+    noisy = np.clip(original.astype(np.int16) + rng.integers(-6, 7, original.shape), 0, 255).astype(np.uint8)
+    brighter = np.clip(original.astype(np.int16) + 20, 0, 255).astype(np.uint8)
+    base = PerceptualHash.compute(original, method)
+    assert PerceptualHash.distance(base, PerceptualHash.compute(noisy, method)) <= 4
+    assert PerceptualHash.distance(base, PerceptualHash.compute(brighter, method)) <= 4
+
+
+@pytest.mark.parametrize("method", PerceptualHash.METHODS)
+def test_different_stills_are_far(method):
+    a = PerceptualHash.compute(scene(0), method)
+    b = PerceptualHash.compute(scene(1), method)
+    assert PerceptualHash.distance(a, b) > 16
+
+
+def test_distance_counts_differing_bits():
+    assert PerceptualHash.distance(0b1011, 0b1011) == 0
+    assert PerceptualHash.distance(0b1011, 0b0010) == 2
+    assert PerceptualHash.distance(0, 2 ** 64 - 1) == 64
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        PerceptualHash.compute(scene(0), "ahash")
+
+
+def test_index_finds_closest_match_per_camera(tmp_path):
+    index = RecentHashIndex(tmp_path / "hashes.json", window_seconds=60)
+    index.add("driveway", 0xFFFF0000FFFF0000, label="alert-1")
+    index.add("driveway", 0xFFFF0000FFFF000F, label="alert-2")
+    index.add("porch", 0xFFFF0000FFFF0001, label="alert-3")
+
+    match = index.find("driveway", 0xFFFF0000FFFF0001, max_distance=6)
+    assert match is not None
+    assert (match.label, match.distance) == ("alert-1", 1)
+    assert 0 <= match.seconds_ago < 5
+    assert index.find("driveway", 0x0000FFFF0000FFFF, max_distance=6) is None
+    assert index.find("garage", 0xFFFF0000FFFF0000, max_distance=6) is None
+
+
+def test_index_persists_between_instances(tmp_path):
+    path = tmp_path / "hashes.json"
+    RecentHashIndex(path, window_seconds=60).add("driveway", 0x1234, label="alert-1")
+    match = RecentHashIndex(path, window_seconds=60).find("driveway", 0x1234, max_distance=0)
+    assert match is not None and match.label == "alert-1"
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_index_drops_entries_outside_the_window(tmp_path):
+    path = tmp_path / "hashes.json"
+    stale = {"driveway": [{"hash": f"{0x1234:016x}", "time": time.time() - 120, "label": "old"}]}
+    path.write_text(json.dumps(stale), encoding="utf-8")
+
+    index = RecentHashIndex(path, window_seconds=60)
+    assert index.find("driveway", 0x1234, max_distance=0) is None
+    index.add("driveway", 0x5678, label="new")
+    entries = json.loads(path.read_text(encoding="utf-8"))["driveway"]
+    assert [e["label"] for e in entries] == ["new"]
+
+
+def test_corrupt_index_is_treated_as_empty(tmp_path):
+    path = tmp_path / "hashes.json"
+    path.write_text("{not json", encoding="utf-8")
+    index = RecentHashIndex(path, window_seconds=60)
+    assert index.find("driveway", 0x1234, max_distance=64) is None
+    index.add("driveway", 0x1234)
+    assert index.find("driveway", 0x1234, max_distance=0) is not None
+
+
+def test_claim_records_a_pending_hash_the_next_alert_matches(tmp_path):
+    index = RecentHashIndex(tmp_path / "hashes.json", window_seconds=60)
+    assert index.claim("driveway", 0x1234, max_distance=2, label="alert-1") is None
+    match = index.claim("driveway", 0x1235, max_distance=2, label="alert-2")
+    assert match is not None and match.pending
+    assert (match.label, match.distance) == ("alert-1", 1)
+
+    index.confirm("driveway", 0x1234, label="alert-1")
+    match = index.find("driveway", 0x1234, max_distance=0)
+    assert match is not None and not match.pending
+
+
+def test_released_claim_no_longer_matches(tmp_path):
+    index = RecentHashIndex(tmp_path / "hashes.json", window_seconds=60)
+    index.add("driveway", 0x1234, label="sent")
+    assert index.claim("driveway", 0xFF00, max_distance=2, label="failed") is None
+    index.release("driveway", 0xFF00, label="failed")
+    assert index.find("driveway", 0xFF00, max_distance=2) is None
+    # Only the claim is dropped; a sent alert's hash is never released
+    index.release("driveway", 0x1234, label="sent")
+    assert index.find("driveway", 0x1234, max_distance=0) is not None
+
+
+def test_abandoned_claim_expires_before_the_window(tmp_path):
+    path = tmp_path / "hashes.json"
+    abandoned = {"driveway": [{"hash": f"{0x1234:016x}", "time": time.time() - 30, "label": "crashed", "pending": True}]}
+    path.write_text(json.dumps(abandoned), encoding="utf-8")
+    assert RecentHashIndex(path, window_seconds=600, pending_seconds=60).find("driveway", 0x1234, 0) is not None
+    assert RecentHashIndex(path, window_seconds=600, pending_seconds=10).find("driveway", 0x1234, 0) is None
+
+
+def test_concurrent_claims_let_exactly_one_alert_through(tmp_path):
+    path = tmp_path / "hashes.json"
+    barrier = threading.Barrier(6)
+
+    def claim(n):
+        barrier.wait()
+        return RecentHashIndex(path, window_seconds=60).claim("driveway", 0x1234 + n % 2, 2, label=f"alert-{n}")
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        matches = list(pool.map(claim, range(6)))
+    assert sum(match is None for match in matches) == 1
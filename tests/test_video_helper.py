@@ -0,0 +1,351 @@
+# test_video_helper.py
+"""FrameSampler seek/grab choice and segments, cropping, StillSelector, FrameDeduplicator and ClipRemuxer on synthetic input."""
+
+import io
+import numpy as np
+import pytest
+import cv2
+from video_helper import (
+    ClipRemuxer, DecodeBackend, FrameDeduplicator, FrameExtractor, FrameSampler, OpenCVBackend, StillSelector,
+)
+
+av = pytest.importorskip("av")
+
+
+class RecordingCapture:
+    """A cv2.VideoCapture stand-in over a clip of `total` frames that records every call."""
+
+    def __init__(self, total=300):
+        self.total = total
+        self.position = 0
+        self.calls = []
+
+    def get(self, prop):
+        return self.position
+
+    def set(self, prop, value):
+        self.calls.append(("seek", int(value)))
+        self.position = int(value)
+
+    def grab(self):
+        if self.position >= self.total:
+            return False
+        self.calls.append(("grab", self.position))
+        self.position += 1
+        return True
+
+    def retrieve(self):
+        return True, np.full((4, 4, 3), (self.position - 1) % 256, dtype=np.uint8)
+
+
+def test_should_seek_uses_the_gap_without_keyframes():
+    assert not FrameSampler.should_seek(0, 14, seek_threshold=15)
+    assert FrameSampler.should_seek(0, 15, seek_threshold=15)
+    assert FrameSampler.should_seek(20, 10, seek_threshold=15)   # backwards always seeks
+
+
+def test_should_seek_only_when_a_keyframe_lies_in_between():
+    keyframes = [0, 30, 60, 90]
+    assert not FrameSampler.should_seek(1, 29, 15, keyframes)    # same GOP: decode forward
+    assert FrameSampler.should_seek(1, 31, 15, keyframes)        # lands on 30, past position
+    assert not FrameSampler.should_seek(31, 59, 15, keyframes)
+    # With cv2's preroll, a target just past a keyframe lands on the previous one
+    assert not FrameSampler.should_seek(1, 40, 15, keyframes, preroll=16)
+    assert FrameSampler.should_seek(1, 46, 15, keyframes, preroll=16)
+
+
+def test_sample_grabs_short_gaps_and_seeks_long_ones():
+    cap = RecordingCapture()
+    frames = list(FrameSampler.sample(cap, [0, 5, 100], seek_threshold=15))
+    assert [index for index, _ in frames] == [0, 5, 100]
+    assert [int(frame[0, 0, 0]) for _, frame in frames] == [0, 5, 100]
+    assert cap.calls == (
+        [("grab", 0)] + [("grab", i) for i in range(1, 6)] + [("seek", 100), ("grab", 100)]
+    )
+
+
+def test_sample_with_keyframes_seeks_across_gops_only():
+    cap = RecordingCapture()
+    keyframes = list(range(0, 300, 30))
+    indices = [0, 25, 90, 200]
+    frames = list(FrameSampler.sample(cap, indices, keyframes=keyframes))
+    assert [index for index, _ in frames] == indices
+    seeks = [value for call, value in cap.calls if call == "seek"]
+    # 25 is in the first GOP; 90 and 200 each land on a keyframe past the decoder
+    assert seeks == [90, 200]
+    assert sum(call == "grab" for call, _ in cap.calls) == 26 + 1 + 1
+
+
+def test_sample_stops_at_the_end_of_the_stream():
+    cap = RecordingCapture(total=50)
+    frames = list(FrameSampler.sample(cap, [10, 40, 60], seek_threshold=15))
+    assert [index for index, _ in frames] == [10, 40]
+
+
+def static_scene(count, size=(64, 96)):
+    h, w = size
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    return np.repeat(background[None], count, axis=0)
+
+
+@pytest.mark.parametrize("region", [
+    (0.4, 0.4, 0.5, 0.5), (0.9, 0.9, 1.0, 1.0), (0.0, 0.0, 1.0, 1.0), (0.1, 0.2, 0.7, 0.4), (0.0, 0.6, 0.05, 0.65),
+])
+def test_crop_rect_pads_fits_and_keeps_the_aspect_ratio(region):
+    width, height = 1280, 720
+    x0, y0, x1, y1 = FrameExtractor.crop_rect(region, width, height)
+    assert 0 <= x0 < x1 <= width and 0 <= y0 < y1 <= height
+    assert (x1 - x0) % 2 == 0 and (y1 - y0) % 2 == 0
+    assert abs((x1 - x0) / (y1 - y0) - width / height) < 0.02
+    assert x1 - x0 >= int(FrameExtractor.CROP_MIN_FRACTION * width) - 2
+    # The region itself is always inside the crop
+    rx0, ry0, rx1, ry1 = region
+    assert x0 <= rx0 * width and rx1 * width <= x1 + 1
+    assert y0 <= ry0 * height and ry1 * height <= y1 + 1
+
+
+def test_crop_rect_margin_and_centering():
+    assert FrameExtractor.crop_rect((0.4, 0.4, 0.5, 0.5), 1280, 720) == (352, 198, 800, 448)
+    assert FrameExtractor.crop_rect((0.0, 0.0, 1.0, 1.0), 1280, 720) == (0, 0, 1280, 720)
+
+
+def test_crop_frame_scales_to_a_downscaled_frame():
+    frame = np.arange(64 * 128 * 3, dtype=np.uint32).reshape(64, 128, 3).astype(np.uint8)
+    full = FrameExtractor.crop_frame(frame, (32, 16, 96, 48), source_width=128)
+    assert full.shape == (32, 64, 3) and np.shares_memory(full, frame)
+    half = FrameExtractor.crop_frame(frame[::2, ::2], (32, 16, 96, 48), source_width=128)
+    assert half.shape == (16, 32, 3)
+
+
+@pytest.fixture
+def corner_motion_clip(tmp_path):
+    """A 4 s, 10 fps 320x180 clip: static noise with a block moving in the top-left quarter."""
+    path = tmp_path / "corner.mp4"
+    rng = np.random.default_rng(2)
+    background = cv2.GaussianBlur(rng.integers(0, 256, (180, 320, 3), dtype=np.uint8), (5, 5), 0)
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 10, (320, 180))
+    for i in range(40):
+        frame = background.copy()
+        x = 10 + (i % 20) * 4
+        frame[20:50, x:x + 30] = (255, 255, 255)
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+
+def test_auto_crop_follows_the_moving_region(corner_motion_clip):
+    result = FrameExtractor.extract(
+        corner_motion_clip, gif_frame_count=10, gif_fps=5, gif_selection="motion", auto_crop=True, still="mid",
+    )
+    assert result.crop is not None
+    x0, y0, x1, y1 = result.crop
+    # Holds where the block moved (x 10..116, y 20..50) and stays well short of the frame
+    assert x0 <= 10 and x1 >= 116 and y0 <= 20 and y1 >= 50
+    assert x1 - x0 < 320 * 0.75
+    assert result.gif_frames.shape[1:3] == (y1 - y0, x1 - x0)
+    assert result.still.shape[:2] == (180, 320)   # stills stay full-frame by default
+
+
+def test_fixed_crop_applies_to_stills_when_asked(corner_motion_clip):
+    result = FrameExtractor.extract(
+        corner_motion_clip, gif_frame_count=4, crop=(0.5, 0.5, 1.0, 1.0), still="mid", crop_stills=True,
+    )
+    x0, y0, x1, y1 = result.crop
+    assert x1 == 320 and y1 == 180
+    assert result.gif_frames.shape[1:3] == (y1 - y0, x1 - x0)
+    assert result.still.shape[:2] == (y1 - y0, x1 - x0)
+
+
+def test_auto_crop_without_motion_keeps_the_full_frame(corner_motion_clip, tmp_path):
+    path = tmp_path / "static.mp4"
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 10, (320, 180))
+    for _ in range(30):
+        writer.write(np.full((180, 320, 3), 120, dtype=np.uint8))
+    writer.release()
+    result = FrameExtractor.extract(str(path), gif_frame_count=5, gif_fps=5, gif_selection="motion", auto_crop=True)
+    assert result.crop is None
+    assert result.gif_frames.shape[1:3] == (180, 320)
+
+
+def with_subject(frame, x):
+    frame = frame.copy()
+    cv2.rectangle(frame, (x, 16), (x + 24, 48), (255, 255, 255), -1)
+    cv2.line(frame, (x, 16), (x + 24, 48), (0, 0, 0), 2)
+    return frame
+
+
+def test_still_selector_prefers_the_frame_with_the_subject():
+    empty = static_scene(1)[0]
+    frames = [empty, empty.copy(), with_subject(empty, 40), empty.copy()]
+    assert StillSelector.pick(frames) == 2
+
+
+def test_still_selector_prefers_the_sharp_frame():
+    empty = static_scene(1)[0]
+    sharp = with_subject(empty, 40)
+    blurred = cv2.GaussianBlur(sharp, (9, 9), 0)
+    # Same subject, same place: only sharpness tells them apart
+    assert StillSelector.pick([blurred, sharp, blurred.copy()]) == 1
+    scores = StillSelector.scores([blurred, sharp])
+    assert scores[1] > scores[0]
+
+
+def test_still_selector_candidates_spread_through_the_pool():
+    pool = list(range(100, 200, 5))
+    assert StillSelector.candidate_indices(pool, 5) == [100, 125, 150, 170, 195]
+    assert StillSelector.candidate_indices([1, 2], 5) == [1, 2]
+    assert StillSelector.pick([static_scene(1)[0]]) == 0
+
+
+def test_collapse_merges_static_runs_and_sums_durations():
+    frames = static_scene(8)
+    frames[3:6, 16:48, 24:56] = 255   # a subject appears for three frames
+    keep, durations = FrameDeduplicator.collapse(frames, frame_ms=200, threshold=4.0)
+    assert keep == [0, 3, 6]
+    assert durations == [600, 600, 400]
+    assert sum(durations) == 200 * len(frames)
+
+
+def test_collapse_ignores_noise_below_threshold():
+    frames = static_scene(6)
+    rng = np.random.default_rng(1)
+    noise = rng.integers(-2, 3, frames.shape)
+    frames = np.clip(frames.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    keep, durations = FrameDeduplicator.collapse(frames, frame_ms=100, threshold=4.0)
+    assert keep == [0]
+    assert durations == [600]
+
+
+def test_collapse_counts_small_subject_in_large_scene():
+    # One block of the 8x8 grid changing is enough, even though the frame mean barely moves
+    frames = static_scene(2, size=(256, 256))
+    frames[1, :32, :32] = 255 - frames[1, :32, :32]
+    keep, _ = FrameDeduplicator.collapse(frames, frame_ms=100, threshold=10.0)
+    assert keep == [0, 1]
+
+
+def test_collapse_with_zero_threshold_keeps_everything():
+    frames = static_scene(4)
+    keep, durations = FrameDeduplicator.collapse(frames, frame_ms=250, threshold=0)
+    assert keep == [0, 1, 2, 3]
+    assert durations == [250] * 4
+
+
+@pytest.fixture
+def synthetic_clip(tmp_path):
+    """A 4 s, 10 fps H.264 clip with a keyframe every second."""
+    path = tmp_path / "clip.mp4"
+    with av.open(str(path), "w") as container:
+        stream = container.add_stream("libx264", rate=10)
+        stream.width, stream.height = 96, 64
+        stream.pix_fmt = "yuv420p"
+        stream.codec_context.gop_size = 10
+        stream.options = {"keyint_min": "10", "sc_threshold": "0", "bf": "0"}
+        for i in range(40):
+            image = np.full((64, 96, 3), i * 6, dtype=np.uint8)
+            frame = av.VideoFrame.from_ndarray(image, format="rgb24")
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return str(path)
+
+
+def probe(data: bytes):
+    with av.open(io.BytesIO(data)) as container:
+        packets = [p for p in container.demux(video=0) if p.dts is not None]
+    with av.open(io.BytesIO(data)) as container:
+        frames = list(container.decode(video=0))
+    return packets, frames
+
+
+def test_remux_copies_the_whole_clip(synthetic_clip):
+    fp = io.BytesIO()
+    copied = ClipRemuxer.remux(synthetic_clip, fp)
+    packets, frames = probe(fp.getvalue())
+    assert copied == len(packets) == 40
+    assert len(frames) == 40
+    assert packets[0].is_keyframe
+    assert min(p.pts for p in packets) == 0
+
+
+def test_remux_trims_from_the_keyframe_before_start(synthetic_clip):
+    fp = io.BytesIO()
+    # 1.5 s falls inside the second GOP, so the copy starts at its keyframe (1.0 s)
+    copied = ClipRemuxer.remux(synthetic_clip, fp, start_seconds=1.5, duration_seconds=1.0)
+    packets, frames = probe(fp.getvalue())
+    assert packets[0].is_keyframe
+    assert min(p.pts for p in packets) == 0
+    assert copied == len(packets) == 15   # 1.0 s up to the 2.5 s end, at 10 fps
+    # The first decoded frame is the 1.0 s source frame (gray level 10 * 6)
+    assert abs(int(frames[0].to_ndarray(format="rgb24").mean()) - 60) <= 3
+
+
+def test_remux_writes_to_a_non_seekable_stream(synthetic_clip):
+    class WriteOnly(io.RawIOBase):
+        def __init__(self):
+            self.chunks = []
+
+        def writable(self):
+            return True
+
+        def write(self, b):
+            self.chunks.append(bytes(b))
+            return len(b)
+
+    fp = WriteOnly()
+    assert ClipRemuxer.remux(synthetic_clip, fp) == 40
+    packets, _ = probe(b"".join(fp.chunks))
+    assert len(packets) == 40
+
+
+def test_segments_split_the_span_evenly_in_order():
+    runs = FrameSampler.segments([30, 0, 10, 10, 20, 90, 60, 50, 40, 80, 70], 3)
+    assert runs == [[0, 10, 20, 30], [40, 50, 60], [70, 80, 90]]
+    assert FrameSampler.segments([5, 1, 5], 1) == [[1, 5]]
+    assert FrameSampler.segments([], 4) == [[]]
+    # Never more runs than indices, and every index exactly once
+    runs = FrameSampler.segments(list(range(0, 900, 3)), 4)
+    assert len(runs) == 4 and sum(runs, []) == list(range(0, 900, 3))
+
+
+@pytest.mark.parametrize("backend", ["opencv", "pyav"])
+def test_sample_parallel_matches_serial_order_and_frames(synthetic_clip, backend):
+    indices = list(range(0, 40, 3)) + [39]
+    decoder = DecodeBackend.open(synthetic_clip, backend)
+    try:
+        serial = list(decoder.sample(indices))
+    finally:
+        decoder.release()
+    parallel = list(FrameSampler.sample_parallel(synthetic_clip, indices, workers=3, backend=backend))
+    assert [index for index, _ in parallel] == [index for index, _ in serial] == sorted(set(indices))
+    for (_, a), (_, b) in zip(serial, parallel):
+        assert np.array_equal(a, b)
+
+
+def test_sample_parallel_scans_keyframes_once(synthetic_clip, monkeypatch):
+    keyframes = FrameSampler.keyframe_indices(synthetic_clip)
+    assert keyframes == [0, 10, 20, 30]
+    scans = []
+    monkeypatch.setattr(FrameSampler, "keyframe_indices", staticmethod(lambda path: scans.append(path)))
+    frames = list(FrameSampler.sample_parallel(synthetic_clip, list(range(40)), workers=4, keyframes=keyframes))
+    assert len(frames) == 40
+    assert scans == []
+
+
+def test_sample_parallel_raises_a_segment_error(synthetic_clip, monkeypatch):
+    sample = OpenCVBackend.sample
+
+    def failing_sample(self, indices, seek_threshold=None, max_width=None):
+        if min(indices) >= 20:
+            raise RuntimeError("decoder crashed")
+        return sample(self, indices, seek_threshold, max_width)
+
+    monkeypatch.setattr(OpenCVBackend, "sample", failing_sample)
+    received = []
+    with pytest.raises(RuntimeError, match="decoder crashed"):
+        for index, _ in FrameSampler.sample_parallel(synthetic_clip, list(range(40)), workers=2):
+            received.append(index)
+    # The first segment's frames still arrive, in order, before the error
+    assert received == list(range(20))
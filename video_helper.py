@@ -0,0 +1,1018 @@
+# video_helper.py
+"""
+Low-level frame access helpers used by VideoProcessor in alert_helper.py.
+"""
+
+import os
+import queue
+from bisect import bisect_right
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import cv2
+
+try:
+    import av  # optional: only needed for the "pyav" decode backend
+except ImportError:
+    av = None
+
+
+@dataclass
+class ClipInfo:
+    fps: float
+    total_frames: int
+    width: int
+    height: int
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.total_frames / self.fps if self.fps > 0 else 0.0
+
+
+@dataclass
+class ExtractionResult:
+    info: ClipInfo
+    gif_frames: np.ndarray = field(default_factory=lambda: np.empty((0, 0, 0, 3), np.uint8))  # (N, H, W, 3) RGB
+    gif_indices: List[int] = field(default_factory=list)                        # source frame of each GIF frame
+    still: Optional[np.ndarray] = None                                          # BGR, full resolution
+    still_index: Optional[int] = None
+    timed_frames: List[Tuple[float, np.ndarray]] = field(default_factory=list)  # (seconds, BGR)
+    thumbnail: Optional[np.ndarray] = None                                      # BGR, downscaled still
+    motion_scores: Dict[int, float] = field(default_factory=dict)               # frame index -> activity
+    contact_sheet: Optional[np.ndarray] = None                                  # BGR grid of tiles
+    crop: Optional[Tuple[int, int, int, int]] = None                            # GIF crop (x0, y0, x1, y1)
+
+
+@dataclass
+class FrameUse:
+    """One output a decoded frame feeds, see FrameExtractor.extract()."""
+    kind: str                          # "gif", "mid", "candidate", "timed" or "sheet"
+    cell: Optional[int] = None         # "sheet": the contact-sheet cell
+
+
+class FrameBuffer:
+    """
+    Preallocated contiguous (capacity, height, width, 3) uint8 RGB buffer. Frames are resized
+    and color-converted straight into their slot, so the decode loop allocates nothing per
+    frame and peak memory is known before decoding starts.
+    """
+
+    def __init__(self, capacity: int, width: int, height: int):
+        self.frames = np.empty((capacity, height, width, 3), dtype=np.uint8)
+        self._resized = np.empty((height, width, 3), dtype=np.uint8)
+        self.count = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.frames.nbytes
+
+    def append(self, frame: np.ndarray) -> None:
+        """Resize a BGR frame into the next slot and convert it to RGB in place."""
+        if self.count >= len(self.frames):
+            raise IndexError("FrameBuffer is full")
+        height, width = self.frames.shape[1:3]
+        source = frame
+        if frame.shape[:2] != (height, width):
+            cv2.resize(frame, (width, height), dst=self._resized, interpolation=cv2.INTER_AREA)
+            source = self._resized
+        cv2.cvtColor(source, cv2.COLOR_BGR2RGB, dst=self.frames[self.count])
+        self.count += 1
+
+    def view(self) -> np.ndarray:
+        """The filled part of the buffer, without copying."""
+        return self.frames[:self.count]
+
+    def reset(self) -> None:
+        """Start filling from the first slot again, overwriting what is there."""
+        self.count = 0
+
+
+class FrameSampler:
+    """Reaches a precomputed set of frame indices with as little decode work as possible."""
+
+    # Without a keyframe index (no PyAV), gaps of at least this many frames are crossed with a
+    # seek instead of grab(). grab() still decodes every frame it skips, while cv2 seeks to
+    # the previous keyframe and decodes forward from there. BI exports use a ~1-2s GOP, so
+    # one second at 15 fps is the shortest gap that can reach past a keyframe.
+    SEEK_THRESHOLD_FRAMES = 15
+
+    # cv2's FFmpeg backend seeks to the keyframe at or before (target - 16) and decodes
+    # forward from there, so a seek only helps when that keyframe is past the current position.
+    OPENCV_SEEK_PREROLL = 16
+
+    # Exports spanning fewer frames than this are decoded serially even when workers are
+    # available: thread and capture start-up outweigh the gain on short clips
+    PARALLEL_MIN_SPAN = 600
+    SEGMENT_QUEUE_FRAMES = 16
+
+    @staticmethod
+    def step_indices(total_frames: int, count: int) -> List[int]:
+        """Return up to `count` frame indices spread across the clip at a fixed step."""
+        if total_frames <= 0 or count <= 0:
+            return []
+        step = max(1, int(total_frames / count))
+        return [i * step for i in range(count) if i * step < total_frames]
+
+    @staticmethod
+    def keyframe_indices(mp4_path: str) -> Optional[List[int]]:
+        """
+        Frame indices of the clip's keyframes, read from the packet flags without decoding
+        anything (needs PyAV). None when they cannot be read.
+        """
+        if av is None:
+            return None
+        try:
+            with av.open(mp4_path) as container:
+                stream = container.streams.video[0]
+                fps = float(stream.average_rate or stream.guessed_rate or 0)
+                if fps <= 0:
+                    return None
+                start = stream.start_time or 0
+                return sorted(
+                    int(round((packet.pts - start) * stream.time_base * fps))
+                    for packet in container.demux(stream)
+                    if packet.is_keyframe and packet.pts is not None
+                )
+        except Exception:
+            return None
+
+    @staticmethod
+    def should_seek(
+        position: int,
+        index: int,
+        seek_threshold: int,
+        keyframes: Optional[List[int]] = None,
+        preroll: int = 0
+    ) -> bool:
+        """
+        Whether to reach `index` with a seek rather than decoding forward from `position` (the
+        next frame the decoder returns). With the keyframe index, seek exactly when the keyframe
+        the seek lands on (the last one at or before index - preroll) is past position: decoding
+        then restarts closer to the target. Otherwise fall back to the seek_threshold gap.
+        """
+        gap = index - position
+        if gap < 0:
+            return True
+        if keyframes:
+            landing = bisect_right(keyframes, max(index - preroll, 0)) - 1
+            return landing >= 0 and keyframes[landing] > position
+        return gap >= seek_threshold
+
+    @staticmethod
+    def sample(
+        cap: "cv2.VideoCapture",
+        indices: List[int],
+        seek_threshold: int = SEEK_THRESHOLD_FRAMES,
+        keyframes: Optional[List[int]] = None
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Yield (frame_index, BGR frame) for each requested index, in ascending order.
+        Skipped frames are grabbed but never retrieved, and gaps that cross a keyframe (or,
+        without keyframes, reach seek_threshold) are seeked over, so decode work scales with
+        the number of output frames rather than clip length.
+        Stops early if the stream ends before an index is reached.
+        """
+        position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+        for index in sorted(set(indices)):
+            if FrameSampler.should_seek(
+                position, index, seek_threshold, keyframes, FrameSampler.OPENCV_SEEK_PREROLL
+            ):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                position = index
+            while position < index:
+                if not cap.grab():
+                    return
+                position += 1
+
+            if not cap.grab():
+                return
+            ok, frame = cap.retrieve()
+            position += 1
+            if not ok or frame is None:
+                return
+            yield index, frame
+
+    @staticmethod
+    def segments(indices: List[int], count: int) -> List[List[int]]:
+        """Split indices (sorted, deduplicated) into up to `count` runs covering similar frame spans."""
+        ordered = sorted(set(indices))
+        if not ordered or count <= 1:
+            return [ordered]
+        span = (ordered[-1] - ordered[0] + 1) / count
+        runs: List[List[int]] = [[]]
+        for index in ordered:
+            if runs[-1] and len(runs) < count and index - ordered[0] >= span * len(runs):
+                runs.append([])
+            runs[-1].append(index)
+        return runs
+
+    @staticmethod
+    def sample_parallel(
+        mp4_path: str,
+        indices: List[int],
+        workers: int,
+        seek_threshold: Optional[int] = None,
+        backend: str = "opencv",
+        max_width: Optional[int] = None,
+        keyframes: Optional[List[int]] = None
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Same output as sample(), but the span is split into `workers` segments that are decoded
+        at once, each on a thread with its own decoder (both backends release the GIL while
+        decoding). Each segment starts with a seek, which costs at most one GOP. Frames are
+        yielded in order; later segments buffer at most SEGMENT_QUEUE_FRAMES frames ahead.
+        keyframes (see keyframe_indices()) are shared by every segment's decoder instead of
+        each scanning the file again. An error in a segment is raised here, in order.
+        """
+        runs = FrameSampler.segments(indices, workers)
+        queues: List["queue.Queue"] = [queue.Queue(maxsize=FrameSampler.SEGMENT_QUEUE_FRAMES) for _ in runs]
+        stop = threading.Event()
+
+        def put(out: "queue.Queue", item) -> bool:
+            while not stop.is_set():
+                try:
+                    out.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def decode(run: List[int], out: "queue.Queue") -> None:
+            decoder = None
+            try:
+                decoder = DecodeBackend.open(mp4_path, backend, keyframes=keyframes)
+                for item in decoder.sample(run, seek_threshold, max_width):
+                    if not put(out, item):
+                        return
+                put(out, None)
+            except BaseException as e:
+                put(out, e)  # the consumer raises it when it reaches this segment
+            finally:
+                if decoder:
+                    decoder.release()
+
+        threads = [
+            threading.Thread(target=decode, args=(run, out), name=f"segment-decode-{i}", daemon=True)
+            for i, (run, out) in enumerate(zip(runs, queues))
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for out in queues:
+                while True:
+                    item = out.get()
+                    if item is None:
+                        break
+                    if isinstance(item, BaseException):
+                        raise item
+                    yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+
+class DecodeBackend(ABC):
+    """
+    Opens a clip and reaches requested frame indices. FrameExtractor only talks to this
+    interface, so the decoder library is a configuration choice (DecodeBackend.open()).
+    """
+
+    name = ""
+    keyframes: Optional[List[int]] = None   # frame indices of the clip's keyframes, when known
+
+    @staticmethod
+    def open(mp4_path: str, backend: str = "opencv", **options) -> "DecodeBackend":
+        backends = {cls.name: cls for cls in (OpenCVBackend, PyAVBackend)}
+        if backend not in backends:
+            raise ValueError(f"Unknown decode backend '{backend}' (expected one of {', '.join(backends)})")
+        return backends[backend](mp4_path, **options)
+
+    @abstractmethod
+    def probe(self) -> ClipInfo:
+        ...
+
+    @abstractmethod
+    def sample(
+        self,
+        indices: List[int],
+        seek_threshold: Optional[int] = None,
+        max_width: Optional[int] = None
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Yield (frame_index, BGR frame) for each requested index in ascending order. max_width
+        is a hint: backends that can scale during conversion return frames no wider than it.
+        seek_threshold overrides the backend's keyframe-based seek decision with a fixed gap.
+        """
+
+    @abstractmethod
+    def release(self) -> None:
+        ...
+
+
+class OpenCVBackend(DecodeBackend):
+    """cv2.VideoCapture with FrameSampler's grab/seek strategy. The default."""
+
+    name = "opencv"
+
+    def __init__(self, mp4_path: str, keyframes: Optional[List[int]] = None):
+        self.cap = cv2.VideoCapture(mp4_path)
+        if not self.cap.isOpened():
+            raise Exception(f"Could not open MP4: {mp4_path}")
+        self.keyframes = keyframes or FrameSampler.keyframe_indices(mp4_path)
+
+    def probe(self) -> ClipInfo:
+        return FrameExtractor.probe(self.cap)
+
+    def sample(self, indices, seek_threshold=None, max_width=None):
+        if seek_threshold is not None:
+            return FrameSampler.sample(self.cap, indices, seek_threshold)
+        return FrameSampler.sample(self.cap, indices, keyframes=self.keyframes)
+
+    def release(self) -> None:
+        self.cap.release()
+
+
+class PyAVBackend(DecodeBackend):
+    """
+    FFmpeg through PyAV. Decoding runs on FFmpeg's own threads (thread_type="AUTO"), frames
+    are scaled by swscale while converting to BGR when max_width is given, and with
+    keyframes_only the decoder skips every non-keyframe (skip_frame="NONKEY"): each index
+    then gets its nearest keyframe (see nearest_keyframe()), decoded once, which is cheap
+    enough for stills from long exports but too coarse for animation.
+    """
+
+    name = "pyav"
+
+    def __init__(
+        self, mp4_path: str, keyframes_only: bool = False, threads: int = 0, keyframes: Optional[List[int]] = None
+    ):
+        if av is None:
+            raise Exception("PyAV is not installed (pip install av)")
+        self.container = av.open(mp4_path)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        self.stream.codec_context.thread_count = threads
+        if keyframes_only:
+            self.stream.codec_context.skip_frame = "NONKEY"
+        self.keyframes_only = keyframes_only
+        self.fps = float(self.stream.average_rate or self.stream.guessed_rate or 0)
+        self.start = self.stream.start_time or 0
+        self.keyframes = keyframes or FrameSampler.keyframe_indices(mp4_path)
+
+    def probe(self) -> ClipInfo:
+        total = self.stream.frames
+        if not total and self.stream.duration and self.fps:
+            total = int(self.stream.duration * self.stream.time_base * self.fps)
+        return ClipInfo(
+            fps=self.fps,
+            total_frames=int(total),
+            width=self.stream.codec_context.width,
+            height=self.stream.codec_context.height,
+        )
+
+    def nearest_keyframe(self, index: int) -> int:
+        """The keyframe closest to `index` (the earlier one on a tie); `index` itself if unknown."""
+        if not self.keyframes:
+            return index
+        after = bisect_right(self.keyframes, index)
+        if after == 0:
+            return self.keyframes[0]
+        before = self.keyframes[after - 1]
+        if after == len(self.keyframes) or index - before <= self.keyframes[after] - index:
+            return before
+        return self.keyframes[after]
+
+    def _index(self, frame: "av.VideoFrame") -> int:
+        return int(round((frame.pts - self.start) * self.stream.time_base * self.fps))
+
+    def _seek(self, index: int) -> Iterator["av.VideoFrame"]:
+        """Seek to the keyframe at or before `index` and return a fresh decode iterator."""
+        target = self.start + int(index / self.fps / self.stream.time_base)
+        self.container.seek(target, stream=self.stream, backward=True, any_frame=False)
+        return self.container.decode(self.stream)
+
+    def _convert(self, frame: "av.VideoFrame", max_width: Optional[int]) -> np.ndarray:
+        if max_width and frame.width > max_width:
+            height = int(frame.height * max_width / frame.width)
+            return frame.to_ndarray(format="bgr24", width=max_width, height=height)
+        return frame.to_ndarray(format="bgr24")
+
+    def sample(self, indices, seek_threshold=None, max_width=None):
+        keyframes = self.keyframes if seek_threshold is None else None
+        if seek_threshold is None:
+            seek_threshold = FrameSampler.SEEK_THRESHOLD_FRAMES
+        frames: Optional[Iterator["av.VideoFrame"]] = None
+        current: Optional["av.VideoFrame"] = None
+        position = -1
+        for index in sorted(set(indices)):
+            target = self.nearest_keyframe(index) if self.keyframes_only else index
+            if current is not None and position >= target:
+                # Already decoded past it (keyframe-only or a frame-rate gap): reuse that frame
+                yield index, self._convert(current, max_width)
+                continue
+            if frames is None or FrameSampler.should_seek(position + 1, target, seek_threshold, keyframes):
+                frames = self._seek(target)
+            for frame in frames:
+                current, position = frame, self._index(frame)
+                if position >= target:
+                    break
+            else:
+                if not (self.keyframes_only and current is not None):
+                    return
+                # No keyframe after it: the last one before it is the nearest
+                position = max(position, target)
+            yield index, self._convert(current, max_width)
+
+    def release(self) -> None:
+        self.container.close()
+
+
+class ClipRemuxer:
+    """
+    Copies an export's packets into a new MP4 without re-encoding, optionally trimmed to a
+    window. The output is fragmented MP4, which needs no seeking while it is written, so it
+    can go straight into a non-seekable stream such as an UploadStream, and still plays with
+    range requests. A trimmed clip starts at the keyframe at or before start_seconds.
+    """
+
+    MOVFLAGS = "frag_keyframe+empty_moov+default_base_moof"
+
+    @staticmethod
+    def remux(
+        mp4_path: str, fp, start_seconds: float = 0.0, duration_seconds: Optional[float] = None
+    ) -> int:
+        """Write the (trimmed) clip to the binary stream fp; returns the number of packets copied."""
+        if av is None:
+            raise Exception("PyAV is not installed (pip install av)")
+        with av.open(mp4_path) as source, \
+                av.open(fp, "w", format="mp4", options={"movflags": ClipRemuxer.MOVFLAGS}) as target:
+            video = source.streams.video[0]
+            streams = [s for s in source.streams if s.type in ("video", "audio")]
+            outputs = {s.index: target.add_stream_from_template(s) for s in streams}
+            if start_seconds > 0:
+                # Seeks backwards to a keyframe, so the copy starts decodable
+                source.seek((video.start_time or 0) + int(start_seconds / video.time_base), stream=video)
+            end = start_seconds + duration_seconds if duration_seconds else None
+
+            base_seconds = None
+            copied = 0
+            for packet in source.demux(streams):
+                if packet.dts is None:
+                    continue  # demuxer flush packet
+                stream = packet.stream
+                seconds = float((packet.dts - (stream.start_time or 0)) * stream.time_base)
+                if end is not None and stream is video and seconds >= end:
+                    break
+                if base_seconds is None:
+                    base_seconds = float(packet.dts * stream.time_base)
+                # Shift every stream by the same time so the clip starts at 0 and stays in sync
+                offset = int(round(base_seconds / stream.time_base))
+                if packet.dts - offset < 0:
+                    continue
+                packet.dts -= offset
+                if packet.pts is not None:
+                    packet.pts -= offset
+                packet.stream = outputs[stream.index]
+                target.mux(packet)
+                copied += 1
+            return copied
+
+
+class MotionAnalyzer:
+    """Cheap frame-differencing activity scores on downscaled grayscale copies."""
+
+    ANALYSIS_WIDTH = 128
+
+    # Candidates below this fraction of the window's peak activity are trimmed from its ends,
+    # unless the peak itself is under MIN_ACTIVITY (mean gray levels), i.e. only sensor noise
+    TRIM_FRACTION = 0.15
+    MIN_ACTIVITY = 1.0
+
+    # A pixel is "moving" when it differs from the window's median by more than this many
+    # gray levels; regions smaller than MIN_REGION_PIXELS (at ANALYSIS_WIDTH) are noise
+    REGION_THRESHOLD = 20
+    MIN_REGION_PIXELS = 12
+
+    @staticmethod
+    def small_gray(frame: np.ndarray, width: int = ANALYSIS_WIDTH, blur: bool = True) -> np.ndarray:
+        """Downscaled grayscale copy of a BGR frame for scoring, lightly blurred unless blur=False."""
+        height = max(1, int(frame.shape[0] * width / frame.shape[1]))
+        small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (3, 3), 0) if blur else gray
+
+    @staticmethod
+    def activity_scores(grays: List[np.ndarray]) -> np.ndarray:
+        """Mean absolute difference of each frame from the one before it (the first copies the second)."""
+        if len(grays) < 2:
+            return np.zeros(len(grays), dtype=np.float32)
+        stack = np.stack(grays).astype(np.int16)
+        scores = np.abs(np.diff(stack, axis=0)).mean(axis=(1, 2)).astype(np.float32)
+        return np.concatenate([scores[:1], scores])
+
+    @staticmethod
+    def best_window(scores: np.ndarray, length: int, min_length: int) -> Tuple[int, int]:
+        """
+        [start, end) of the `length`-long run with the most activity, ties going to the
+        earliest (closest to the trigger), then trimmed of quiet ends down to min_length.
+        """
+        if len(scores) <= length:
+            start, end = 0, len(scores)
+        else:
+            sums = np.convolve(scores, np.ones(length, dtype=np.float32), mode="valid")
+            start = int(sums.argmax())
+            end = start + length
+
+        peak = float(scores[start:end].max()) if end > start else 0.0
+        if peak < MotionAnalyzer.MIN_ACTIVITY:
+            return start, end
+        quiet = peak * MotionAnalyzer.TRIM_FRACTION
+        while end - start > min_length and scores[start] < quiet:
+            start += 1
+        while end - start > min_length and scores[end - 1] < quiet:
+            end -= 1
+        return start, end
+
+    @staticmethod
+    def motion_region(grays: List[np.ndarray]) -> Optional[Tuple[float, float, float, float]]:
+        """
+        Bounding box of everything that moved across the frames, as fractions of the frame
+        (x0, y0, x1, y1), or None when nothing did. Pixels are compared to the per-pixel median
+        of the stack, which stands in for the empty background.
+        """
+        if len(grays) < 2:
+            return None
+        stack = np.stack(grays)
+        background = np.median(stack, axis=0).astype(np.int16)
+        moving = (np.abs(stack.astype(np.int16) - background).max(axis=0) > MotionAnalyzer.REGION_THRESHOLD)
+        moving = cv2.morphologyEx(moving.astype(np.uint8), cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+        if int(moving.sum()) < MotionAnalyzer.MIN_REGION_PIXELS:
+            return None
+        rows = np.flatnonzero(moving.any(axis=1))
+        cols = np.flatnonzero(moving.any(axis=0))
+        height, width = moving.shape
+        return cols[0] / width, rows[0] / height, (cols[-1] + 1) / width, (rows[-1] + 1) / height
+
+    @staticmethod
+    def select_gif_indices(
+        decoder: DecodeBackend,
+        info: ClipInfo,
+        frame_count: int,
+        fps: int,
+        trigger_seconds: float = 0.0,
+        search_seconds: float = 20.0,
+        scores_out: Optional[Dict[int, float]] = None,
+        region_out: Optional[List[float]] = None,
+        sample: Optional[Callable[[List[int], Optional[int]], Iterator[Tuple[int, np.ndarray]]]] = None
+    ) -> List[int]:
+        """
+        Scan candidates at the GIF frame rate from just before the trigger to search_seconds
+        after it, and return the frame indices of the most active window of up to
+        frame_count frames. Candidate scores are written to scores_out when given, and the
+        window's motion_region() is appended to region_out. sample replaces
+        decoder.sample() for reaching the candidates.
+
+        Only ANALYSIS_WIDTH grayscale copies are kept while scanning, so memory does not grow
+        with the source resolution; the caller decodes the chosen window again with a seek.
+        """
+        if info.fps <= 0 or fps <= 0:
+            return FrameSampler.step_indices(info.total_frames, frame_count)
+
+        step = max(1, int(round(info.fps / fps)))
+        first = max(0, int((trigger_seconds - 2.0) * info.fps))
+        last = min(info.total_frames, int((trigger_seconds + search_seconds) * info.fps))
+        candidates = list(range(first, last, step))
+
+        indices, grays = [], []
+        width = MotionAnalyzer.ANALYSIS_WIDTH
+        frames = sample(candidates, width) if sample else decoder.sample(candidates, max_width=width)
+        for index, frame in frames:
+            indices.append(index)
+            grays.append(MotionAnalyzer.small_gray(frame))
+        if not indices:
+            return []
+
+        scores = MotionAnalyzer.activity_scores(grays)
+        if scores_out is not None:
+            scores_out.update(zip(indices, scores.tolist()))
+        start, end = MotionAnalyzer.best_window(scores, frame_count, min_length=min(frame_count, 2 * fps))
+        if region_out is not None:
+            region = MotionAnalyzer.motion_region(grays[start:end])
+            if region:
+                region_out.extend(region)
+        return indices[start:end]
+
+
+class FrameDeduplicator:
+    """
+    Collapses runs of static frames into one frame shown for longer. Differences are the mean
+    absolute difference per block of a coarse grid, computed on strided copies; the busiest
+    block decides, so a small subject moving in a large static scene still counts as change
+    while sensor noise spread evenly over the frame does not.
+    """
+
+    STRIDE = 4
+    GRID = 8
+
+    @staticmethod
+    def block_difference(a: np.ndarray, b: np.ndarray) -> float:
+        """Busiest-block mean absolute difference between two strided int16 frames."""
+        diff = np.abs(a - b).mean(axis=2)
+        grid = FrameDeduplicator.GRID
+        h, w = diff.shape[0] // grid * grid, diff.shape[1] // grid * grid
+        blocks = diff[:h, :w].reshape(grid, h // grid, grid, w // grid)
+        return float(blocks.mean(axis=(1, 3)).max())
+
+    @staticmethod
+    def collapse(frames: np.ndarray, frame_ms: int, threshold: float) -> Tuple[List[int], List[int]]:
+        """
+        Positions of the frames to keep and each kept frame's duration in ms. Each frame is
+        compared with the last kept one rather than its neighbour, so slow drifts (clouds,
+        exposure) still produce a new frame once they add up.
+        """
+        if len(frames) < 2 or threshold <= 0:
+            return list(range(len(frames))), [frame_ms] * len(frames)
+        small = frames[:, ::FrameDeduplicator.STRIDE, ::FrameDeduplicator.STRIDE].astype(np.int16)
+        keep, durations = [0], [frame_ms]
+        for position in range(1, len(frames)):
+            if FrameDeduplicator.block_difference(small[position], small[keep[-1]]) < threshold:
+                durations[-1] += frame_ms
+            else:
+                keep.append(position)
+                durations.append(frame_ms)
+        return keep, durations
+
+
+class StillSelector:
+    """Picks the best still from a set of candidate frames by sharpness and activity."""
+
+    ANALYSIS_WIDTH = 256
+    SHARPNESS_WEIGHT = 0.4
+    ACTIVITY_WEIGHT = 0.6
+
+    @staticmethod
+    def scores(frames: List[np.ndarray]) -> np.ndarray:
+        """
+        Score BGR frames in one batch on downscaled grayscale copies. Sharpness is the variance
+        of the Laplacian; activity is the mean difference from the candidates' median, which
+        approximates the empty background. Both are normalized to the best candidate.
+        """
+        grays = np.stack([
+            MotionAnalyzer.small_gray(f, StillSelector.ANALYSIS_WIDTH, blur=False) for f in frames
+        ]).astype(np.float32)
+
+        laplacian = (
+            grays[:, :-2, 1:-1] + grays[:, 2:, 1:-1] + grays[:, 1:-1, :-2] + grays[:, 1:-1, 2:]
+            - 4.0 * grays[:, 1:-1, 1:-1]
+        )
+        sharpness = laplacian.var(axis=(1, 2))
+        activity = np.abs(grays - np.median(grays, axis=0)).mean(axis=(1, 2))
+
+        def normalized(values: np.ndarray) -> np.ndarray:
+            peak = float(values.max())
+            return values / peak if peak > 0 else np.zeros_like(values)
+
+        return (
+            StillSelector.SHARPNESS_WEIGHT * normalized(sharpness)
+            + StillSelector.ACTIVITY_WEIGHT * normalized(activity)
+        )
+
+    @staticmethod
+    def pick(frames: List[np.ndarray]) -> int:
+        """Position of the best frame in `frames`."""
+        if len(frames) < 2:
+            return 0
+        return int(StillSelector.scores(frames).argmax())
+
+    @staticmethod
+    def candidate_indices(pool: List[int], count: int) -> List[int]:
+        """Up to `count` indices spread evenly through pool."""
+        if len(pool) <= count:
+            return list(pool)
+        picks = np.linspace(0, len(pool) - 1, count).round().astype(int)
+        return [pool[i] for i in np.unique(picks)]
+
+
+class ContactSheet:
+    """
+    Tiles frames into a single grid image. The canvas is allocated once and each frame is
+    downscaled straight into its cell as it is decoded, so no full-resolution frame is kept.
+    """
+
+    LABEL_SCALE = 0.45
+
+    def __init__(self, count: int, frame_width: int, frame_height: int, tile_width: int = 320):
+        self.columns = int(np.ceil(np.sqrt(count)))
+        self.rows = int(np.ceil(count / self.columns))
+        self.tile_width, self.tile_height = FrameExtractor.scaled_size(frame_width, frame_height, tile_width)
+        self.image = np.zeros((self.rows * self.tile_height, self.columns * self.tile_width, 3), dtype=np.uint8)
+
+    def place(self, position: int, frame: np.ndarray, label: Optional[str] = None) -> None:
+        """Downscale a BGR frame into cell `position` (row-major), optionally stamping a label."""
+        row, column = divmod(position, self.columns)
+        y, x = row * self.tile_height, column * self.tile_width
+        tile = cv2.resize(frame, (self.tile_width, self.tile_height), interpolation=cv2.INTER_AREA)
+        if label:
+            cv2.putText(tile, label, (6, self.tile_height - 8), cv2.FONT_HERSHEY_SIMPLEX,
+                        self.LABEL_SCALE, (0, 0, 0), 3, cv2.LINE_AA)
+            cv2.putText(tile, label, (6, self.tile_height - 8), cv2.FONT_HERSHEY_SIMPLEX,
+                        self.LABEL_SCALE, (255, 255, 255), 1, cv2.LINE_AA)
+        self.image[y:y + self.tile_height, x:x + self.tile_width] = tile
+
+    @staticmethod
+    def motion_indices(scores: Dict[int, float], count: int) -> List[int]:
+        """
+        The most active frame in each of `count` equal stretches of the scored frames, so the
+        sheet follows the action without bunching every tile on the busiest second.
+        """
+        indices = sorted(scores)
+        if len(indices) <= count:
+            return indices
+        values = np.array([scores[i] for i in indices])
+        bounds = np.linspace(0, len(indices), count + 1).astype(int)
+        return [indices[a + int(values[a:b].argmax())] for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+class FrameExtractor:
+    """Serves every still and animation output from a single pass over the clip."""
+
+    # Smallest crop, as a fraction of the frame side (see crop_rect())
+    CROP_MIN_FRACTION = 0.35
+
+    @staticmethod
+    def probe(cap: "cv2.VideoCapture") -> ClipInfo:
+        return ClipInfo(
+            fps=cap.get(cv2.CAP_PROP_FPS),
+            total_frames=int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        )
+
+    @staticmethod
+    def alert_jpeg_times(duration_seconds: float) -> List[float]:
+        """Timestamps for the timed JPEG set: 2s in, 3s from the end, and every 5s."""
+        times = []
+        if duration_seconds > 2:
+            times.append(2.0)
+        if duration_seconds > 3:
+            t = duration_seconds - 3.0
+            if t > 0:
+                times.append(t)
+        t = 0.0
+        while t < duration_seconds:
+            times.append(t)
+            t += 5.0
+        return sorted(set(times))
+
+    @staticmethod
+    def scaled_size(width: int, height: int, max_width: int) -> Tuple[int, int]:
+        """(width, height) after capping width at max_width, keeping aspect ratio."""
+        if width <= max_width:
+            return width, height
+        return max_width, int(height * (max_width / width))
+
+    @staticmethod
+    def crop_rect(
+        region: Tuple[float, float, float, float],
+        width: int,
+        height: int,
+        margin: float = 0.1,
+        min_fraction: float = CROP_MIN_FRACTION
+    ) -> Tuple[int, int, int, int]:
+        """
+        Pixel rectangle (x0, y0, x1, y1) for a fractional region, padded by `margin` of the
+        frame on each side, grown to at least min_fraction of the frame and to the frame's
+        aspect ratio, and shifted back inside the frame. Sides are even for the encoders.
+        """
+        x0, y0, x1, y1 = region
+        crop_w = max(x1 - x0 + 2 * margin, min_fraction)
+        crop_h = max(y1 - y0 + 2 * margin, min_fraction)
+        crop_w = crop_h = min(1.0, max(crop_w, crop_h))  # same fraction of both sides keeps the aspect ratio
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        left = min(max(0.0, cx - crop_w / 2), 1.0 - crop_w)
+        top = min(max(0.0, cy - crop_h / 2), 1.0 - crop_h)
+
+        w = int(crop_w * width) & ~1
+        h = int(crop_h * height) & ~1
+        # A crop reaching the far edge stays on it after the sides are floored to even pixels
+        left_px = width - w if left + crop_w >= 1.0 - 1e-9 else min(int(left * width), width - w)
+        top_px = height - h if top + crop_h >= 1.0 - 1e-9 else min(int(top * height), height - h)
+        return left_px, top_px, left_px + w, top_px + h
+
+    @staticmethod
+    def crop_frame(frame: np.ndarray, rect: Tuple[int, int, int, int], source_width: int) -> np.ndarray:
+        """
+        The part of a frame inside a crop_rect() rectangle of the source_width-wide source,
+        scaled when the frame was downscaled. Returns a view.
+        """
+        x0, y0, x1, y1 = rect
+        scale = frame.shape[1] / source_width
+        if scale != 1:
+            x0, y0, x1, y1 = (int(v * scale) for v in rect)
+        return frame[y0:y1, x0:x1]
+
+    @staticmethod
+    def resize_to_width(frame: np.ndarray, max_width: int) -> np.ndarray:
+        """Downscale a frame to max_width, keeping aspect ratio. Smaller frames are returned as-is."""
+        height, width = frame.shape[:2]
+        if width <= max_width:
+            return frame
+        new_height = int(height * (max_width / width))
+        return cv2.resize(frame, (max_width, new_height), interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def extract(
+        mp4_path: str,
+        gif_frame_count: int = 0,
+        gif_max_width: int = 720,
+        still: Optional[str] = None,
+        timed_jpegs: bool = False,
+        thumbnail_width: Optional[int] = None,
+        gif_fps: Optional[int] = None,
+        gif_selection: str = "even",
+        trigger_seconds: float = 0.0,
+        search_seconds: float = 20.0,
+        still_candidates: int = 9,
+        gif_sink: Optional[Callable[[np.ndarray], None]] = None,
+        contact_sheet_frames: int = 0,
+        contact_sheet_selection: str = "even",
+        contact_sheet_width: int = 320,
+        crop: Optional[Tuple[float, float, float, float]] = None,
+        auto_crop: bool = False,
+        crop_stills: bool = False,
+        decode_workers: int = 1,
+        backend: str = "opencv",
+        keyframe_stills: bool = False
+    ) -> ExtractionResult:
+        """
+        Open the clip once and decode the union of every requested frame in one forward pass.
+        Timed JPEGs follow alert_jpeg_times(). A thumbnail is cut from the still (or the middle
+        frame when no still is requested), so it costs no extra decode.
+
+        still="mid" takes the middle frame. still="best" scores up to still_candidates frames
+        spread through the GIF frames (or the whole clip without a GIF) with StillSelector and
+        keeps the best at full resolution.
+
+        With gif_sink, each GIF frame is handed to it as soon as it is decoded instead of being
+        collected, and result.gif_frames stays empty. The array passed in is reused for the
+        next frame, so the sink must copy anything it keeps.
+
+        gif_selection="even" spreads the GIF frames across the whole clip. "motion" first scans
+        the clip around trigger_seconds at gif_fps (see MotionAnalyzer) and takes the most
+        active window instead, which may hold fewer than gif_frame_count frames. The scan only
+        keeps scores, so the main pass seeks to the window and decodes it at full size.
+
+        contact_sheet_frames tiles that many frames into result.contact_sheet, each cell
+        contact_sheet_width wide. They are spread over the clip ("even"), or taken from the
+        motion scan ("motion"), which needs gif_selection="motion" and otherwise falls back
+        to "even".
+
+        crop is a fixed region (x0, y0, x1, y1) as fractions of the frame; auto_crop instead
+        uses the motion scan's moving region (gif_selection="motion" only). Either way the
+        region is padded and fitted by crop_rect() and the GIF frames are cropped before they
+        are resized, so the preview spends its pixels on the subject. crop_stills crops the
+        still, thumbnail and timed frames to the same rectangle; the contact sheet stays
+        full-frame as an overview.
+
+        decode_workers > 1 decodes long spans (see FrameSampler.PARALLEL_MIN_SPAN) in that many
+        segments at once, both for the motion scan and the main pass. backend picks the
+        decoder ("opencv" or "pyav", see DecodeBackend).
+
+        keyframe_stills serves the frames that only feed stills (the middle frame, timed JPEGs
+        and an evenly spread contact sheet) from a keyframe-only PyAV pass: each snaps to its
+        nearest keyframe, which skips decoding whole GOPs on long exports. still_index, the
+        timed JPEG times and the sheet labels are those of the keyframe actually used. Frames
+        the main pass decodes anyway stay exact. Ignored when PyAV is not installed.
+        """
+        if not os.path.exists(mp4_path):
+            raise Exception(f"MP4 not found: {mp4_path}")
+
+        decoder = DecodeBackend.open(mp4_path, backend)
+        keyframes: Optional[PyAVBackend] = None
+        try:
+            info = decoder.probe()
+            if info.total_frames <= 0:
+                raise Exception("Total frames reported as 0")
+
+            def sample(indices: List[int], max_width: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+                if decode_workers > 1 and indices and max(indices) - min(indices) >= FrameSampler.PARALLEL_MIN_SPAN:
+                    return FrameSampler.sample_parallel(
+                        mp4_path, indices, decode_workers, backend=backend, max_width=max_width,
+                        keyframes=decoder.keyframes
+                    )
+                return decoder.sample(indices, max_width=max_width)
+
+            # Map each frame index to the outputs that want it
+            result = ExtractionResult(info=info)
+            wanted: Dict[int, List[FrameUse]] = {}
+            motion_region: List[float] = []
+            if gif_selection == "motion" and gif_frame_count and gif_fps:
+                gif_indices = MotionAnalyzer.select_gif_indices(
+                    decoder, info, gif_frame_count, gif_fps, trigger_seconds, search_seconds,
+                    scores_out=result.motion_scores, region_out=motion_region if auto_crop else None,
+                    sample=sample
+                )
+            else:
+                gif_indices = FrameSampler.step_indices(info.total_frames, gif_frame_count)
+            for index in gif_indices:
+                wanted.setdefault(index, []).append(FrameUse("gif"))
+
+            if still == "best":
+                pool = gif_indices or FrameSampler.step_indices(info.total_frames, still_candidates)
+                for index in StillSelector.candidate_indices(pool, still_candidates):
+                    wanted.setdefault(index, []).append(FrameUse("candidate"))
+
+            # Still-only frames go to the keyframe pass unless the main pass decodes them anyway
+            keyframe_wanted: Dict[int, List[FrameUse]] = {}
+            if keyframe_stills and av is not None:
+                keyframes = PyAVBackend(mp4_path, keyframes_only=True)
+
+            def want_still(index: int, use: FrameUse) -> None:
+                target = wanted
+                if keyframes is not None and index not in wanted:
+                    index = keyframes.nearest_keyframe(index)
+                    target = wanted if index in wanted else keyframe_wanted
+                uses = target.setdefault(index, [])
+                if use.kind == "timed" and any(u.kind == "timed" for u in uses):
+                    return  # two timestamps snapped to the same keyframe
+                uses.append(use)
+
+            if still != "best" and (still == "mid" or thumbnail_width):
+                want_still(max(0, info.total_frames // 2), FrameUse("mid"))
+
+            if timed_jpegs and info.fps > 0:
+                for t in FrameExtractor.alert_jpeg_times(info.duration_seconds):
+                    want_still(min(int(t * info.fps), info.total_frames - 1), FrameUse("timed"))
+
+            sheet: Optional[ContactSheet] = None
+            if contact_sheet_frames:
+                if contact_sheet_selection == "motion" and result.motion_scores:
+                    sheet_indices = ContactSheet.motion_indices(result.motion_scores, contact_sheet_frames)
+                else:
+                    sheet_indices = FrameSampler.step_indices(info.total_frames, contact_sheet_frames)
+                sheet = ContactSheet(len(sheet_indices), info.width, info.height, contact_sheet_width)
+                for position, index in enumerate(sheet_indices):
+                    if contact_sheet_selection == "motion" and result.motion_scores:
+                        wanted.setdefault(index, []).append(FrameUse("sheet", cell=position))
+                    else:
+                        want_still(index, FrameUse("sheet", cell=position))
+
+            region = crop or (tuple(motion_region) if motion_region else None)
+            if region:
+                result.crop = FrameExtractor.crop_rect(region, info.width, info.height)
+            x0, y0, x1, y1 = result.crop or (0, 0, info.width, info.height)
+            still_crop = result.crop if crop_stills else None
+            gif_size = FrameExtractor.scaled_size(x1 - x0, y1 - y0, gif_max_width)
+            buffer = FrameBuffer(1 if gif_sink else len(gif_indices), *gif_size)
+            candidates: List[Tuple[int, np.ndarray]] = []
+
+            def deliver(index: int, frame: np.ndarray, uses: List[FrameUse]) -> None:
+                still_frame = FrameExtractor.crop_frame(frame, still_crop, info.width) if still_crop else frame
+                for use in uses:
+                    kind = use.kind
+                    if kind == "gif":
+                        result.gif_indices.append(index)
+                        gif_frame = FrameExtractor.crop_frame(frame, result.crop, info.width) if result.crop else frame
+                        if gif_sink:
+                            buffer.reset()
+                            buffer.append(gif_frame)
+                            gif_sink(buffer.frames[0])
+                        else:
+                            buffer.append(gif_frame)
+                    elif kind == "mid":
+                        result.still, result.still_index = still_frame, index
+                    elif kind == "candidate":
+                        candidates.append((index, still_frame))
+                    elif kind == "timed":
+                        result.timed_frames.append((index / info.fps, still_frame))
+                    elif kind == "sheet":
+                        label = f"{index / info.fps:.1f}s" if info.fps > 0 else None
+                        sheet.place(use.cell, frame, label)
+
+            for index, frame in sample(list(wanted)):
+                deliver(index, frame, wanted[index])
+            if keyframe_wanted:
+                for index, frame in keyframes.sample(list(keyframe_wanted)):
+                    deliver(index, frame, keyframe_wanted[index])
+
+            if not gif_sink:
+                result.gif_frames = buffer.view()
+            if sheet is not None:
+                result.contact_sheet = sheet.image
+            if candidates:
+                best = StillSelector.pick([frame for _, frame in candidates])
+                result.still_index, result.still = candidates[best]
+            if thumbnail_width and result.still is not None:
+                result.thumbnail = FrameExtractor.resize_to_width(result.still, thumbnail_width)
+            if still is None:
+                result.still, result.still_index = None, None
+
+            result.timed_frames.sort(key=lambda item: item[0])
+            return result
+        finally:
+            decoder.release()
+            if keyframes is not None:
+                keyframes.release()
@@ -133,6 +133,7 @@ def get_alerts():
                 'gif_url': alert.get('gif_url'),
                 'jpeg_urls': alert.get('jpeg_urls', []),
                 'jpeg_count': alert.get('jpeg_count', 0),
+                'clip_url': alert.get('clip_url'),
                 'success': alert.get('success', False),
                 'error_message': alert.get('error_message'),
                 'debug_mode': alert.get('debug_mode', False),